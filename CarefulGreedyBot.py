@@ -2,63 +2,40 @@
 # CarefulGreedyBot always plays the highest scoring move, except when it opens
 # up the triples on the border of the board for the opponent, in which case it
 # apples penalties for every "opened up" field
+# (the penalties are computed for all moves at once from their feature matrix, see
+# ScrabbleFeatures, so this bot needs NumPy)
 #
 
 __author__ = 'Sebastian Wernicke'
 
-import random
-import math
 from ScrabbleBot import ScrabbleAI
 from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleFeatures
 from ScrabbleBot import ScrabbleUtils
 
 
 class CarefulGreedyBot(ScrabbleAI.ScrabbleAI):
 
-    def make_move(self, board: ScrabbleBoard, letters: list, solutions: list) -> ScrabbleUtils.ScrabbleMove:
-        for s in solutions:
-            penalty = 0
-            col = s.col
-            row = s.row
-            length = len(s.word)
-            if s.how == "across":
-                penalty = 0
-                if col == 0:
-                    if row == 0 or row == 7 or row == 14:
-                        penalty = 0
-                    elif 0 < row < 7:
-                        if board.get(0, 0) == ' ':
-                            penalty += 15
-                        if board.get(7, 0) == ' ':
-                            penalty += 25
-                    else:
-                        if board.get(7, 0) == ' ':
-                            penalty += 25
-                        if board.get(14, 0) == ' ':
-                            penalty += 15
-                s.score -= penalty
-                if col + length == 14:
-                    if row == 0 or row == 7 or row == 14:
-                        penalty = 0
-                    elif 0 < row < 7:
-                        if board.get(0, 14) == ' ':
-                            penalty += 15
-                        if board.get(7, 14) == ' ':
-                            penalty += 25
-                    else:
-                        if board.get(7, 14) == ' ':
-                            penalty += 25
-                        if board.get(14, 14) == ' ':
-                            penalty += 15
-                s.score -= penalty
-            if s.how == "down":
-                #if row == 0 or row + length == 14:
-                #    penalty = -4
-                #if row == 1 or row + length == 13:
-                ##    penalty = -1
-                s.score += penalty
-        if len(solutions) > 0:
-            solutions.sort(reverse=True)
-            return solutions[0]
-        else:
+    def make_move(self, board: ScrabbleBoard, letters: list,
+                  solutions: ScrabbleUtils.MoveList) -> ScrabbleUtils.ScrabbleMove:
+        if len(solutions) == 0:
             return None
+        features = ScrabbleFeatures.feature_matrix(board, solutions)
+        row = features[:, ScrabbleFeatures.START_ROW]
+        col = features[:, ScrabbleFeatures.START_COL]
+        length = features[:, ScrabbleFeatures.LENGTH]
+
+        # Penalties for the free triples on the left and on the right border, on the
+        # side of the center row that the word is on
+        def free(r, c):
+            return 1 if board.get(r, c) == ' ' else 0
+        upper = row < 7
+        left = upper * (15 * free(0, 0) + 25 * free(7, 0)) + ~upper * (25 * free(7, 0) + 15 * free(14, 0))
+        right = upper * (15 * free(0, 14) + 25 * free(7, 14)) + ~upper * (25 * free(7, 14) + 15 * free(14, 14))
+
+        # Only words across are penalized, and not in the rows of the triples themselves.
+        # The penalty of a word that starts at the left border is counted twice
+        penalized = (features[:, ScrabbleFeatures.ACROSS] == 1) & (row != 0) & (row != 7) & (row != 14)
+        penalty = penalized * (2 * (col == 0) * left + (col + length == 14) * right)
+        scores = features[:, ScrabbleFeatures.SCORE] - penalty
+        return solutions[int(scores.argmax())]
@@ -0,0 +1,13 @@
+#
+# EndgameBot plays greedily until the bag is empty, and then solves the endgame
+# (see ScrabbleEndgame) to find the move that maximizes its final spread
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleEndgame
+from GreedyBot import GreedyBot
+
+
+class EndgameBot(ScrabbleEndgame.EndgameMixin, GreedyBot):
+    pass
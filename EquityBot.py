@@ -0,0 +1,69 @@
+#
+# EquityBot plays the move with the highest equity: its score plus the value of the
+# tiles it keeps on the rack (the leave), which it looks up in a leave table built
+# from self-play by ScrabbleLeaveTrainer.py (see ScrabbleLeaves). So it gives up a
+# few points to keep "ERS*" rather than "QVV".
+# Once the bag is empty (fewer than 8 unseen tiles, assuming two players), the leave
+# is not drawn to anymore and the bot plays the highest scoring move
+#
+# Parameters:
+#  - table_file: the leave table (by default the one of the OSPD4 dictionary)
+#  - leave_weight: factor of the leave values in the equity
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleAI
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleLeaves
+from ScrabbleBot import ScrabbleSimulation
+from ScrabbleBot import ScrabbleUtils
+
+
+class EquityBot(ScrabbleAI.ScrabbleAI):
+
+    def __init__(self, name, table_file: str = ScrabbleLeaves.default_table_file("OSPD4.txt"),
+                 leave_weight: float = 1.0):
+        super().__init__(name)
+        self.table_file = table_file
+        self.leave_weight = leave_weight
+        self._table = None
+
+    # The table is opened in the process that plays the game (and shared by all bots there)
+    def start_game(self, legal_words: set, word_signatures: dict, engine: str, dawg, letter_values: dict):
+        self._table = ScrabbleLeaves.load_leave_table(self.table_file)
+
+    def make_move(self, board: ScrabbleBoard, letters: list,
+                  solutions: ScrabbleUtils.MoveList) -> ScrabbleUtils.ScrabbleMove:
+        if len(solutions) == 0:
+            return None
+        if len(ScrabbleSimulation.unseen_letters(board, letters)) <= 7:
+            return solutions.top(1)[0]
+
+        # The moves only use a few different sets of rack tiles, so every leave is looked up once
+        columns = solutions.columns()
+        storage = columns["storage"]
+        played = columns["letters"]
+        scores = columns["score"]
+        order = columns["order"]
+        leave_values = dict()
+        best_position = 0
+        best_equity = None
+        for position in range(0, len(solutions)):
+            i = order[position] if order is not None else position
+            leave_value = leave_values.get(played[i])
+            if leave_value is None:
+                leave = ScrabbleLeaves.leave_of(letters, storage[played[i]])
+                leave_value = self.leave_weight * self._table.value(leave)
+                leave_values[played[i]] = leave_value
+            equity = scores[i] + leave_value
+            if best_equity is None or equity > best_equity:
+                best_position = position
+                best_equity = equity
+        return solutions[best_position]
+
+    # The table is not sent along to worker processes (they open it in start_game)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_table'] = None
+        return state
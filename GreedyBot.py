@@ -1,5 +1,6 @@
 #
 # GreedyBot always plays the highest scoring move
+# (it takes its moves lazily, so only the best one is searched for)
 #
 
 __author__ = 'Sebastian Wernicke'
@@ -8,14 +9,14 @@ import random
 import math
 from ScrabbleBot import ScrabbleAI
 from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleMoves
 from ScrabbleBot import ScrabbleUtils
 
 
 class GreedyBot(ScrabbleAI.ScrabbleAI):
 
-    def make_move(self, board: ScrabbleBoard, letters: list, solutions: list) -> ScrabbleUtils.ScrabbleMove:
-        if len(solutions) > 0:
-            solutions.sort(reverse=True)
-            return solutions[0]
-        else:
-            return None
+    lazy_moves = True
+
+    def make_move(self, board: ScrabbleBoard, letters: list,
+                  solutions: ScrabbleMoves.MoveProvider) -> ScrabbleUtils.ScrabbleMove:
+        return solutions.best()
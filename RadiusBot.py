@@ -1,41 +1,24 @@
 #
 # RadiusBot gives a little penalty to words that are off-center
+# (the penalty is computed for all moves at once from their feature matrix, see
+# ScrabbleFeatures, so this bot needs NumPy)
 #
 
 __author__ = 'Sebastian Wernicke'
 
-import random
-import math
 from ScrabbleBot import ScrabbleAI
 from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleFeatures
 from ScrabbleBot import ScrabbleUtils
 
 
 class RadiusBot(ScrabbleAI.ScrabbleAI):
 
-    def make_move(self, board: ScrabbleBoard, letters: list, solutions: list) -> ScrabbleUtils.ScrabbleMove:
-        for s in solutions:
-            penalty = 0
-            col = s.col
-            row = s.row
-            length = len(s.word)
-            if s.how == "across":
-                for c in range(col, col+length):
-                    penalty += math.sqrt((c - 7) ** 2 + (row - 7) ** 2)
-                penalty /= length
-                s.score -= penalty * 0.5
-            if s.how == "down":
-                for r in range(row, row+length):
-                    penalty += math.sqrt((col - 7) ** 2 + (r - 7) ** 2)
-                penalty /= length
-                s.score -= penalty * 0.5
-        if len(solutions) > 0:
-            solutions.sort(reverse=True)
-            return solutions[0]
-        else:
+    def make_move(self, board: ScrabbleBoard, letters: list,
+                  solutions: ScrabbleUtils.MoveList) -> ScrabbleUtils.ScrabbleMove:
+        if len(solutions) == 0:
             return None
-
-
-
-
-
+        features = ScrabbleFeatures.feature_matrix(board, solutions)
+        # The penalty is half the mean distance of the squares of the word from the center
+        scores = features[:, ScrabbleFeatures.SCORE] - features[:, ScrabbleFeatures.CENTRE_DISTANCE] * 0.5
+        return solutions[int(scores.argmax())]
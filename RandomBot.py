@@ -15,6 +15,6 @@ class RandomBot(ScrabbleAI.ScrabbleAI):
 
     def make_move(self, board: ScrabbleBoard, letters: list, solutions: list) -> ScrabbleUtils.ScrabbleMove:
         if len(solutions) > 0:
-            return random.choice(solutions)
+            return self.rng.choice(solutions)
         else:
             return None
@@ -0,0 +1,296 @@
+#
+# This script benchmarks the move generators on a fixed corpus of positions
+# and racks, and plays a few GreedyBot self-play games with each of them.
+#
+# For every engine configuration it reports (as JSON):
+#  - time to build or load the lexicon / signature structures
+#  - possible_moves latency percentiles over the corpus (without cached results of earlier
+#    runs), and moves generated per second
+#  - peak memory (resident set size) of the process that ran the configuration
+#  - full-game throughput of GreedyBot self-play
+#
+# Each configuration runs in a fresh process, so build times and peak memory
+# are not influenced by the other configurations.
+#
+# Usage:
+#   python ScrabbleBenchmark.py --output bench.json
+#   python ScrabbleBenchmark.py --baseline bench.json --output new.json
+# The second form compares the new results against a stored baseline and
+# exits with status 1 if any metric got worse by more than the tolerance.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleGame
+from ScrabbleBot import ScrabbleMatch
+from GreedyBot import GreedyBot
+
+from time import perf_counter
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import sys
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak memory is then not reported
+    resource = None
+
+
+#
+# Corpus of board positions, from an empty board to a dense late-game board
+#
+CORPUS_BOARDS = {
+    "empty": ["               "] * 15,
+    "opening": ["               ",
+                "               ",
+                "               ",
+                "               ",
+                "               ",
+                "               ",
+                "               ",
+                "       WOW     ",
+                "      MOP      ",
+                "               ",
+                "               ",
+                "               ",
+                "               ",
+                "               ",
+                "               "],
+    "sparse": ["           B   ",
+               "           E   ",
+               "           G   ",
+               "          GO   ",
+               "          IT   ",
+               "          V    ",
+               "          E    ",
+               "       WOWS    ",
+               "      MOP      ",
+               "     JEE       ",
+               "  PRION        ",
+               "               ",
+               "               ",
+               "               ",
+               "               "],
+    "midgame": ["       CELEB   ",
+                "           E   ",
+                "           G   ",
+                "          GO   ",
+                "          IT   ",
+                "    R     V    ",
+                "    E     E    ",
+                "   QI  WOWS    ",
+                "   UN MOPE     ",
+                "   A JEE E     ",
+                "  PRION  D     ",
+                "   T  U  Y     ",
+                " DIZENS        ",
+                "               ",
+                "               "],
+    "dense": [" PACIFYING     ",
+              " IS            ",
+              "YE             ",
+              " REQUALIFIED   ",
+              "H L            ",
+              "EDS            ",
+              "NO   T         ",
+              " RAINWASHING   ",
+              "UM   O         ",
+              "T  E O         ",
+              " WAKENERS      ",
+              " ONETIME       ",
+              "OOT  E B       ",
+              "N      U       ",
+              " JACULATING    "],
+}
+
+#
+# Corpus of racks, by number of blanks
+#
+CORPUS_RACKS = {
+    0: ["AEINRST", "PBAZEST", "QVWUIOE", "EEIOUAA"],
+    1: ["*PBAZES", "AEINRS*", "QXJ*TLO"],
+    2: ["**PBAZE", "**EQUIT", "**CDLMN"],
+}
+
+#
+# Engine configurations: name -> (engine, signature_mode)
+#
+ENGINES = {
+    "signatures-compiled": ("signatures", "compiled"),
+    "signatures-dict": ("signatures", "dict"),
+    "signatures-query": ("signatures", "query"),
+    "signatures-compact": ("signatures", "compact"),
+    "signatures-anagram": ("signatures", "anagram"),
+    "dawg": ("dawg", None),
+}
+
+#
+# Metrics that are compared against a baseline, and whether higher is better
+#
+COMPARED_METRICS = {
+    "build_seconds": False,
+    "latency_p50": False,
+    "latency_p90": False,
+    "latency_p99": False,
+    "moves_per_second": True,
+    "peak_rss_mb": False,
+    "games_per_second": True,
+}
+
+
+#
+# GreedyBot that counts how often it was asked for a move
+#
+class CountingGreedyBot(GreedyBot):
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.turns = 0
+
+    def make_move(self, board, letters, solutions):
+        self.turns += 1
+        return super().make_move(board, letters, solutions)
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return None
+    divisor = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0  # Bytes on macOS, kilobytes elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+
+
+#
+# Benchmark one engine configuration (runs in its own process)
+#
+def benchmark_engine(dictionary_file: str, engine: str, signature_mode: str,
+                     repetitions: int, num_games: int, seed: int) -> dict:
+
+    start_time = perf_counter()
+    lexicon = ScrabbleMatch.load_move_generator(dictionary_file, engine, signature_mode)
+    build_seconds = perf_counter() - start_time
+    legal_words, word_signatures, engine, dawg = lexicon
+    letter_values = ScrabbleGame.get_letter_values()
+
+    # Move generation on the corpus
+    cases = []
+    latencies = []
+    total_moves = 0
+    for board_name, rows in CORPUS_BOARDS.items():
+        board = ScrabbleBoard.ScrabbleBoard()
+        board.load(rows)
+        for num_blanks, racks in CORPUS_RACKS.items():
+            for rack in racks:
+                # Untimed warm-up (e.g. for cross-checks the board computes on first use). The moves
+                # the board caches per line and its placement analysis are dropped before every
+                # timed run, so that each one generates the moves of the position from scratch
+                board.possible_moves(rack, letter_values, legal_words, word_signatures, engine, dawg)
+                case_latencies = []
+                for i in range(0, repetitions):
+                    board.clear_caches()
+                    start_time = perf_counter()
+                    solutions = board.possible_moves(rack, letter_values, legal_words, word_signatures, engine, dawg)
+                    case_latencies.append(perf_counter() - start_time)
+                latencies.extend(case_latencies)
+                total_moves += len(solutions) * repetitions
+                cases.append({"board": board_name, "rack": rack, "blanks": num_blanks,
+                              "moves": len(solutions), "latency_median": percentile(case_latencies, 50)})
+
+    # Full games
+    random.seed(seed)
+    players = [CountingGreedyBot("Greedy-1"), CountingGreedyBot("Greedy-2")]
+    start_time = perf_counter()
+    for i in range(0, num_games):
+        game = ScrabbleGame.ScrabbleGame(players, legal_words, word_signatures, engine, dawg)
+        game.play_until_finished(0)
+    game_seconds = perf_counter() - start_time
+    turns = sum(p.turns for p in players)
+
+    return {"engine": engine,
+            "signature_mode": signature_mode,
+            "build_seconds": build_seconds,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p90": percentile(latencies, 90),
+            "latency_p99": percentile(latencies, 99),
+            "latency_max": max(latencies),
+            "moves_per_second": total_moves / sum(latencies),
+            "games": num_games,
+            "turns": turns,
+            "games_per_second": num_games / game_seconds if game_seconds > 0 else None,
+            "turns_per_second": turns / game_seconds if game_seconds > 0 else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "cases": cases}
+
+
+#
+# Compare results against a baseline, returns the list of regressions
+#
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    print("\nENGINE                 METRIC             BASELINE    CURRENT     RATIO")
+    for name, current in results["engines"].items():
+        if name not in baseline["engines"]:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old = baseline["engines"][name].get(metric)
+            new = current.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            worse = ratio < 1.0 - tolerance if higher_is_better else ratio > 1.0 + tolerance
+            print("{:<22} {:<18} {:<11.4g} {:<11.4g} {:.2f}{}".format(name, metric, old, new, ratio,
+                                                                      "  REGRESSION" if worse else ""))
+            if worse:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ScrabbleBot move generators")
+    parser.add_argument("--dictionary", default="OSPD4.txt")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES.keys()), choices=list(ENGINES.keys()))
+    parser.add_argument("--repetitions", type=int, default=3, help="timed runs per position and rack")
+    parser.add_argument("--games", type=int, default=3, help="GreedyBot self-play games per engine")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results to this JSON file (default: print them)")
+    parser.add_argument("--baseline", help="JSON file of earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change that counts as regression")
+    args = parser.parse_args()
+
+    results = {"python": platform.python_version(),
+               "platform": platform.platform(),
+               "repetitions": args.repetitions,
+               "seed": args.seed,
+               "engines": dict()}
+
+    context = multiprocessing.get_context("spawn")
+    for name in args.engines:
+        print("Benchmarking '" + name + "'")
+        engine, signature_mode = ENGINES[name]
+        with context.Pool(1) as pool:
+            results["engines"][name] = pool.apply(benchmark_engine, (args.dictionary, engine, signature_mode,
+                                                                     args.repetitions, args.games, args.seed))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if len(compare(results, baseline, args.tolerance)) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,22 @@
 # a ScrabbleBoard, a list of the letters it has available, and a list
 # of valid moves that can be played on the given board with the current
 # letters (this is provided as a courtesy and does not have to be used
-# of course)
+# of course). The valid moves come as a ScrabbleUtils.MoveList, which can be used
+# like a list of ScrabbleMoves; bots that change the scores of moves (e.g. to rank
+# them by their own criteria) can change them on the moves or with its set_score /
+# adjust_score
+#
+# Bots that don't need every legal move can set 'lazy_moves = True'. They then get a
+# ScrabbleMoves.MoveProvider instead of the list, and only the moves they ask for
+# (e.g. the best one) are generated
+#
+# Bots that generate moves themselves (e.g. to simulate what happens after a move)
+# can override "start_game", which the ScrabbleGame calls before the first move with
+# the lexicon and move generator of the game
+#
+# Bots that make random choices draw them from 'rng', which the ScrabbleGame sets to
+# its random number generator before the game starts (so that seeded games play out
+# the same in any process)
 #
 
 __author__ = 'Sebastian Wernicke'
@@ -23,9 +38,20 @@ from ScrabbleBot import ScrabbleUtils
 #
 class ScrabbleAI:
 
+    # Whether make_move takes a ScrabbleMoves.MoveProvider instead of a list of moves
+    lazy_moves = False
+
+    # Random number generator of the game (see ScrabbleGame)
+    rng = random
+
     def __init__(self, name):
         self.name = name
 
+    # Called by ScrabbleGame before the game starts, with the arguments that
+    # ScrabbleBoard.possible_moves needs (nothing to do for most bots)
+    def start_game(self, legal_words: set, word_signatures: dict, engine: str, dawg, letter_values: dict):
+        pass
+
     def make_move(self, board: ScrabbleBoard, letters: list, solutions: list) -> ScrabbleUtils.ScrabbleMove:
         raise NotImplementedError("Subclass must implement abstract method")
 
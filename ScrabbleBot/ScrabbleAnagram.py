@@ -0,0 +1,177 @@
+#
+# This file defines an anagram index that answers subset queries over the lexicon:
+# "which words consist of these required letters plus some letters of this rack
+# (where blanks can stand for any letter)?"
+#
+# The index is a trie over the word signatures (the sorted letters of a word), so
+# every path from the root spells a sorted letter multiset and the words with that
+# signature are stored at its end. A query walks the trie once, letter group by
+# letter group in alphabetical order: each group must contain all required copies
+# of its letter and can take additional copies from the rack (as real tiles or as
+# blanks). Subtrees that no rack subset can reach are never visited, so there is no
+# need to enumerate the subsets of the rack and look each of them up. Once no blanks
+# are left, only the children for required and rack letters are looked at.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from collections import Counter
+
+
+class AnagramNode:
+
+    __slots__ = ('children', 'words', 'height', 'below')
+
+    def __init__(self):
+        self.children = dict()  # letter -> AnagramNode
+        self.words = None  # Words whose signature ends here (if any)
+        self.height = 0  # Number of letters on the longest path to a word below
+        self.below = 0  # Bitmask of the letters on the paths below (bit 0 is 'A')
+
+
+def letter_bit(letter: str) -> int:
+    return 1 << (ord(letter) - ord('A'))
+
+
+class AnagramIndex:
+
+    def __init__(self, legal_words):
+        print("Building anagram index for " + str(len(legal_words)) + " words")
+        self._legal_words = legal_words
+        self.root = AnagramNode()
+        self.num_nodes = 1
+        for word in sorted(legal_words):
+            node = self.root
+            for letter in sorted(word):
+                child = node.children.get(letter)
+                if child is None:
+                    child = AnagramNode()
+                    node.children[letter] = child
+                    self.num_nodes += 1
+                node = child
+            if node.words is None:
+                node.words = [word]
+            else:
+                node.words.append(word)
+        for node in self._nodes():
+            if node.words is not None:
+                node.words.sort()
+            for letter, child in node.children.items():
+                node.height = max(node.height, child.height + 1)
+                node.below |= child.below | letter_bit(letter)
+
+    # All nodes, children before their parents
+    def _nodes(self) -> list:
+        order = []
+        stack = [self.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children.values())
+        order.reverse()
+        return order
+
+    #
+    # All words that consist of the letters 'required' plus letters from 'rack'
+    # (blanks are '*'), using exactly 'num_from_rack' rack tiles, or any number of
+    # them if 'num_from_rack' is None. Returns a list of (word, rack letters used)
+    # tuples, where the rack letters used are a sorted tuple (blanks included).
+    # A word is listed once for every different set of rack letters that forms it
+    # (e.g. with a real 'E' and with a blank as 'E')
+    #
+    def anagrams(self, required: str, rack: str, num_from_rack: int = None) -> list:
+        required_counts = dict(Counter(required))
+        required_letters = sorted(required_counts.keys())
+        rack_counts = dict(Counter(letter for letter in rack if letter != '*'))
+        # Without blanks, the only letters that can come next are these (in alphabetical order)
+        usable_letters = sorted(set(required_counts) | set(rack_counts))
+        max_from_rack = len(rack) if num_from_rack is None else num_from_rack
+        exact = num_from_rack is not None
+        results = []
+
+        # For the letter groups from the i-th required letter on: the required letters
+        # that are still missing, and how many of them
+        missing_masks = [0] * (len(required_letters) + 1)
+        missing_counts = [0] * (len(required_letters) + 1)
+        for i in range(len(required_letters) - 1, -1, -1):
+            missing_masks[i] = missing_masks[i+1] | letter_bit(required_letters[i])
+            missing_counts[i] = missing_counts[i+1] + required_counts[required_letters[i]]
+        all_placed = len(required_letters)
+
+        # 'next_required' indexes the first required letter that has not been placed,
+        # the rack letters used so far are in 'used'
+        def visit(node: AnagramNode, last_letter: str, next_required: int, used: list, blanks_left: int):
+            if node.words is not None and next_required == all_placed and (not exact or len(used) == max_from_rack):
+                letters_used = tuple(sorted(used))
+                for word in node.words:
+                    results.append((word, letters_used))
+
+            capacity = max_from_rack - len(used)
+            limit = required_letters[next_required] if next_required < all_placed else 'Z'
+            if blanks_left > 0:
+                letters = node.children.keys()
+            else:
+                letters = [letter for letter in usable_letters if letter > last_letter and letter in node.children]
+            for letter in letters:
+                # The next letter group can't skip over a required letter
+                if letter == last_letter or letter > limit:
+                    continue
+                needed = required_counts.get(letter, 0)
+                real_left = rack_counts.get(letter, 0)
+                if needed == 0 and (capacity == 0 or real_left + blanks_left == 0):
+                    continue
+
+                # Place the required copies of the letter
+                group_node = node
+                for i in range(0, needed):
+                    group_node = group_node.children.get(letter)
+                    if group_node is None:
+                        break
+                if group_node is None:
+                    continue
+                after_required = next_required + 1 if needed > 0 else next_required
+                missing = missing_counts[after_required]
+
+                # Only continue below nodes that still have all missing required letters
+                # and enough depth for them (and for the rack letters still to be used)
+                if needed > 0 and group_node.below & missing_masks[after_required] == missing_masks[after_required] \
+                        and group_node.height >= missing + (capacity if exact else 0):
+                    visit(group_node, letter, after_required, used, blanks_left)
+
+                # Add copies from the rack, each one as a real tile or a blank
+                extra = 0
+                while extra < capacity and extra < real_left + blanks_left:
+                    group_node = group_node.children.get(letter)
+                    if group_node is None:
+                        break
+                    extra += 1
+                    if group_node.below & missing_masks[after_required] != missing_masks[after_required] or \
+                            group_node.height < missing + (capacity - extra if exact else 0):
+                        continue
+                    for num_real in range(max(0, extra - blanks_left), min(extra, real_left) + 1):
+                        visit(group_node, letter, after_required,
+                              used + [letter] * num_real + ['*'] * (extra - num_real),
+                              blanks_left - (extra - num_real))
+
+        visit(self.root, '', 0, [], rack.count('*'))
+        return results
+
+    # Word signature lookup with the same keys as build_word_signatures (leading '*'
+    # for blanks). Every word is listed once
+    def get(self, key: str, default=None):
+        letters = key.lstrip('*')
+        num_blanks = len(key) - len(letters)
+        ret = [word for word, letters_used in self.anagrams(letters, '*' * num_blanks, num_blanks)]
+        if len(ret) == 0:
+            return default
+        return ret
+
+    def __getitem__(self, key: str) -> list:
+        ret = self.get(key)
+        if ret is None:
+            raise KeyError(key)
+        return ret
+
+    # Pickled as the word list, the trie is rebuilt on load
+    def __reduce__(self):
+        return AnagramIndex, (self._legal_words,)
@@ -0,0 +1,115 @@
+#
+# This file defines the BoardAnalysis class and an LRU cache for it.
+#
+# A BoardAnalysis holds everything about a board position that the signature
+# based move generator needs before it looks at a rack: in which (row, col)
+# a word can start when a given number of tiles is played across or down, and
+# which letters on the board such a word has to include (see
+# ScrabbleUtils.find_placements). It only depends on the board, so it is
+# computed once per position and reused for every rack, e.g. when a simulation
+# evaluates many hypothetical racks on the same position.
+#
+# Analyses are kept in a bounded LRU cache, keyed by a hash of the board.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleUtils
+
+from collections import OrderedDict
+
+MAX_RACK_SIZE = 7
+
+
+#
+# Key of a board position for the cache (the board as one string)
+#
+def board_key(board: list) -> str:
+    return "".join("".join(row) for row in board)
+
+
+class BoardAnalysis:
+
+    def __init__(self, board: list):
+        self.key = board_key(board)
+        self.placements_across, self.placements_down = ScrabbleUtils.find_placements(board, MAX_RACK_SIZE)
+
+    # Placements for playing 'num_letters' tiles as a list of (row, col, letters on the board)
+    # tuples, 'how' is "across" or "down"
+    def placements(self, num_letters: int, how: str) -> list:
+        if how == "across":
+            return self.placements_across[num_letters]
+        elif how == "down":
+            return self.placements_down[num_letters]
+        raise ValueError("Placements are either 'across' or 'down'")
+
+    # All placements as (row, col, how, num_letters, letters on the board) tuples
+    def all_placements(self) -> list:
+        ret = []
+        for num_letters in range(1, MAX_RACK_SIZE + 1):
+            for how, placements in (("across", self.placements_across), ("down", self.placements_down)):
+                for row, col, letters in placements[num_letters]:
+                    ret.append((row, col, how, num_letters, letters))
+        return ret
+
+    # Number of placements for playing 'num_letters' tiles (in both directions)
+    def num_placements(self, num_letters: int) -> int:
+        return len(self.placements_across[num_letters]) + len(self.placements_down[num_letters])
+
+    # Placements whose word covers the square (row, col), as in all_placements
+    def placements_through(self, row: int, col: int) -> list:
+        ret = []
+        for placement in self.all_placements():
+            start_row, start_col, how, num_letters, letters = placement
+            length = num_letters + len(letters)
+            if how == "across" and row == start_row and start_col <= col < start_col + length:
+                ret.append(placement)
+            elif how == "down" and col == start_col and start_row <= row < start_row + length:
+                ret.append(placement)
+        return ret
+
+
+#
+# Bounded LRU cache of BoardAnalysis objects
+#
+class BoardAnalysisCache:
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Analysis of 'board', computed on a miss. 'key' can be given if the caller
+    # already knows the board's hash, and 'build' if the board can compute its analysis
+    # faster (a function that returns the BoardAnalysis)
+    def get(self, board: list, key=None, build=None) -> BoardAnalysis:
+        if key is None:
+            key = board_key(board)
+        analysis = self._entries.get(key)
+        if analysis is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return analysis
+        self.misses += 1
+        analysis = BoardAnalysis(board) if build is None else build()
+        self._entries[key] = analysis
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return analysis
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+#
+# Cache shared by all boards of a process
+#
+analysis_cache = BoardAnalysisCache()
+
+
+def analyze_board(board: list) -> BoardAnalysis:
+    return analysis_cache.get(board)
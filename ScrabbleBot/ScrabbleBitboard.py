@@ -0,0 +1,394 @@
+#
+# This file defines an array-backed representation of a Scrabble board (needs NumPy).
+#
+# The board is stored as
+#  - a 15x15 uint8 array of letter codes (0 for an empty square, 1-26 for A-Z)
+#  - a 15x15 bool array of the squares that hold a blank
+#  - occupancy bitmasks: one uint16 per row (bit c is set if column c is occupied)
+#    and one uint16 per column (bit r is set if row r is occupied)
+#  - the multiplier layout, also split into letter and word multipliers
+#
+# transposed() returns a view of the same board with rows and columns swapped
+# (sharing all arrays), so that playing down becomes playing across on the transpose.
+# Anchor detection, neighbour occupancy and line extraction work on whole arrays
+# instead of looping over the squares in Python.
+#
+# ArrayScrabbleBoard is a ScrabbleBoard that keeps such a BitBoard in sync with the
+# nested lists, so everything that uses the list-of-lists accessors keeps working.
+# It takes its anchors from the BitBoard, and its placement analysis (the pre-pass of
+# the "signatures" move generator) from find_placements below, which only walks the
+# lines that have a tile or a square next to one. ScrabbleGame and ScrabbleMatch
+# play on it with board_type="arrays". With batch_scoring (board_type="batch"), the
+# "signatures" engine also scores the candidate words of all placements of a rack in
+# one batch with a ScrabbleScoring.BatchScorer of the position
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleAnalysis
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleScoring
+from ScrabbleBot import ScrabbleUtils
+
+try:
+    import numpy as np
+except ImportError:  # The array-backed board is then not available
+    np = None
+
+EMPTY = 0
+FULL_MASK = (1 << 15) - 1
+
+
+#
+# Letter code <-> letter conversions
+#
+def letter_code(letter: str) -> int:
+    if letter == ' ':
+        return EMPTY
+    return ord(letter) - ord('A') + 1
+
+
+def code_letter(code: int) -> str:
+    if code == EMPTY:
+        return ' '
+    return chr(code + ord('A') - 1)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The array-backed Scrabble board requires NumPy, please install it (pip install numpy)")
+
+
+#
+# Expand 15 bitmasks (one per line) into a 15x15 bool array
+#
+def masks_to_array(masks) -> "np.ndarray":
+    return (np.asarray(masks, dtype=np.uint16)[:, None] >> np.arange(15, dtype=np.uint16)) & 1 == 1
+
+
+#
+# Compress a 15x15 bool array into 15 bitmasks (one per row)
+#
+def array_to_masks(squares) -> "np.ndarray":
+    return (squares.astype(np.uint16) << np.arange(15, dtype=np.uint16)).sum(axis=1, dtype=np.uint16)
+
+
+class BitBoard:
+
+    # Initialize an empty board
+    def __init__(self):
+        _require_numpy()
+        self.letters = np.zeros((15, 15), dtype=np.uint8)
+        self.blanks = np.zeros((15, 15), dtype=bool)
+        self.row_masks = np.zeros(15, dtype=np.uint16)
+        self.col_masks = np.zeros(15, dtype=np.uint16)
+        self.multipliers = np.array(ScrabbleBoard.get_board_multipliers(), dtype=np.uint8)
+        self.letter_multipliers = np.where((self.multipliers == 2) | (self.multipliers == 3),
+                                           self.multipliers, 1).astype(np.uint8)
+        self.word_multipliers = np.where((self.multipliers == 4) | (self.multipliers == 6),
+                                         self.multipliers // 2, 1).astype(np.uint8)
+        self.is_transposed = False
+
+    # Create a board from 15 rows of 15 letters or ' ' (strings or lists),
+    # optionally with the blank locations ('X' marks a blank)
+    @classmethod
+    def from_rows(cls, board: list, blank_locations: list = None) -> "BitBoard":
+        ret = cls()
+        ret.letters[:, :] = [[letter_code(letter) for letter in row] for row in board]
+        if blank_locations is not None:
+            ret.blanks[:, :] = [[square == 'X' for square in row] for row in blank_locations]
+        ret._update_masks()
+        return ret
+
+    # A view of this board with rows and columns swapped. All arrays are shared,
+    # so changes to one of them are visible in the other
+    def transposed(self) -> "BitBoard":
+        ret = BitBoard.__new__(BitBoard)
+        ret.letters = self.letters.T
+        ret.blanks = self.blanks.T
+        ret.row_masks = self.col_masks
+        ret.col_masks = self.row_masks
+        ret.multipliers = self.multipliers.T
+        ret.letter_multipliers = self.letter_multipliers.T
+        ret.word_multipliers = self.word_multipliers.T
+        ret.is_transposed = not self.is_transposed
+        return ret
+
+    def _update_masks(self):
+        occupied = self.letters != EMPTY
+        self.row_masks[:] = array_to_masks(occupied)
+        self.col_masks[:] = array_to_masks(occupied.T)
+
+    def get(self, row: int, col: int) -> str:
+        return code_letter(self.letters[row, col])
+
+    # Place a single tile
+    def place(self, row: int, col: int, letter: str, blank: bool = False):
+        self.letters[row, col] = letter_code(letter)
+        self.blanks[row, col] = blank
+        self.row_masks[row] |= np.uint16(1 << col)
+        self.col_masks[col] |= np.uint16(1 << row)
+
+    # Remove a single tile
+    def remove(self, row: int, col: int):
+        self.letters[row, col] = EMPTY
+        self.blanks[row, col] = False
+        self.row_masks[row] &= np.uint16(FULL_MASK ^ (1 << col))
+        self.col_masks[col] &= np.uint16(FULL_MASK ^ (1 << row))
+
+    # Place the tiles of a ScrabbleMove (tiles that are already on the board are left alone)
+    def execute_move(self, move: ScrabbleUtils.ScrabbleMove):
+        d_row, d_col = (1, 0) if move.how == "down" else (0, 1)
+        for i in range(0, len(move.word)):
+            row, col = move.row + i * d_row, move.col + i * d_col
+            if self.letters[row, col] == EMPTY:
+                self.place(row, col, move.word[i], i in move.blank_positions)
+
+    def is_empty(self) -> bool:
+        return not self.row_masks.any()
+
+    def occupied(self) -> "np.ndarray":
+        return self.letters != EMPTY
+
+    # Empty squares with an occupied square above or below, i.e. the squares where
+    # playing across forms a cross word
+    def vertical_neighbours(self) -> "np.ndarray":
+        return masks_to_array(self.vertical_neighbour_masks())
+
+    # Empty squares with an occupied square left or right
+    def horizontal_neighbours(self) -> "np.ndarray":
+        return masks_to_array(self.horizontal_neighbour_masks())
+
+    # Number of occupied orthogonal neighbours of every square
+    def neighbour_counts(self) -> "np.ndarray":
+        occupied = self.occupied().astype(np.uint8)
+        counts = np.zeros((15, 15), dtype=np.uint8)
+        counts[1:, :] += occupied[:-1, :]
+        counts[:-1, :] += occupied[1:, :]
+        counts[:, 1:] += occupied[:, :-1]
+        counts[:, :-1] += occupied[:, 1:]
+        return counts
+
+    # Row bitmasks of the empty squares with an occupied square above or below
+    def vertical_neighbour_masks(self) -> "np.ndarray":
+        masks = self.row_masks
+        neighbours = np.zeros(15, dtype=np.uint16)
+        neighbours[1:] |= masks[:-1]
+        neighbours[:-1] |= masks[1:]
+        return neighbours & ~masks
+
+    # Row bitmasks of the empty squares with an occupied square left or right
+    def horizontal_neighbour_masks(self) -> "np.ndarray":
+        masks = self.row_masks
+        return ((masks << 1) | (masks >> 1)) & ~masks & np.uint16(FULL_MASK)
+
+    # Row bitmasks of the anchors: empty squares next to a tile, or the center square
+    # on an empty board (same as ScrabbleDawg.compute_anchors)
+    def anchor_masks(self) -> "np.ndarray":
+        if self.is_empty():
+            ret = np.zeros(15, dtype=np.uint16)
+            ret[7] = 1 << 7
+            return ret
+        return self.vertical_neighbour_masks() | self.horizontal_neighbour_masks()
+
+    def anchors(self) -> "np.ndarray":
+        return masks_to_array(self.anchor_masks())
+
+    # The letters of one row (of a column on the transpose) as a string
+    def line(self, index: int) -> str:
+        return "".join(code_letter(code) for code in self.letters[index])
+
+    # The (first, last) columns of the runs of consecutive tiles in one row
+    def tile_runs(self, index: int) -> list:
+        occupied = np.zeros(17, dtype=np.int8)
+        occupied[1:16] = self.letters[index] != EMPTY
+        changes = np.flatnonzero(np.diff(occupied))
+        return [(int(changes[i]), int(changes[i+1]) - 1) for i in range(0, len(changes), 2)]
+
+    # Conversions back to the nested lists that the rest of the code uses
+    def to_lists(self) -> list:
+        return [[code_letter(code) for code in row] for row in self.letters]
+
+    def blank_locations(self) -> list:
+        return [['X' if blank else ' ' for blank in row] for row in self.blanks]
+
+    def __str__(self) -> str:
+        ret = " ------------------------------- \n"
+        for row in range(0, 15):
+            ret += "| "
+            for col in range(0, 15):
+                letter = self.get(row, col)
+                ret += (letter.lower() if self.blanks[row, col] else letter) + " "
+            ret += "|\n"
+        ret += " ------------------------------- "
+        return ret
+
+
+#
+# Placements of words in one line (a row, or a column of the transpose) with the given
+# letters, occupancy mask and mask of the squares that make a word legal (tiles, empty
+# squares with a tile on either side across the line, and the center square), as
+# (square, num_letters, start, letters on the board) tuples, where 'square' is the empty
+# square from which find_placements walks. The letters on the board are in the order in
+# which find_placements collects them (the tiles left of the square from right to left)
+#
+def _line_placements(line: list, occupied: int, hot: int, max_num_letters: int) -> list:
+    ret = []
+    if hot == 0:
+        return ret
+    empties = [position for position in range(0, 15) if not (occupied >> position) & 1]
+    num_empties = len(empties)
+
+    # Last square of a word whose last tile from the rack goes to empties[k] (squares between
+    # two empty squares hold tiles), and the tiles it takes up after that square
+    ends = [empties[k + 1] - 1 for k in range(0, num_empties - 1)] + [14]
+    tiles_after = [line[empties[k] + 1:ends[k] + 1] for k in range(0, num_empties)]
+
+    for i in range(0, num_empties):
+        square = empties[i]
+
+        # The word starts at the run of tiles left of the square, and is legal as soon as
+        # it reaches the first square of 'hot' from there on (none for later squares either)
+        start = empties[i - 1] + 1 if i > 0 else 0
+        reachable = hot >> start
+        if reachable == 0:
+            break
+        first_hot = start + (reachable & -reachable).bit_length() - 1
+
+        letters = line[start:square][::-1]
+        num_letters = 0
+        for k in range(i, min(i + max_num_letters, num_empties)):
+            num_letters += 1
+            letters += tiles_after[k]
+            if ends[k] >= first_hot:
+                ret.append((square, num_letters, start, list(letters)))
+    return ret
+
+
+#
+# Placements of lines seen before, by (letters, legal squares, maximum number of letters).
+# A move only changes the lines it is played in and crosses, and their neighbours
+#
+MAX_CACHED_LINES = 20000
+_line_cache = dict()
+
+
+def _cached_line_placements(line: list, occupied: int, hot: int, max_num_letters: int) -> list:
+    key = ("".join(line), hot, max_num_letters)
+    ret = _line_cache.get(key)
+    if ret is None:
+        if len(_line_cache) >= MAX_CACHED_LINES:
+            _line_cache.clear()
+        ret = _line_placements(line, occupied, hot, max_num_letters)
+        _line_cache[key] = ret
+    return ret
+
+
+#
+# Same result as ScrabbleUtils.find_placements (including the order of the placements),
+# computed from the occupancy and neighbour masks of a BitBoard. Lines without tiles or
+# neighbouring tiles have no placements, and lines that were seen before (with the same
+# neighbours) are not walked again. 'rows' and 'columns' are the letters of the board as
+# nested lists (and of its transpose), if the caller has them.
+# The lists of letters on the board are shared between results, and must not be changed
+#
+def find_placements(bitboard: BitBoard, max_num_letters: int, rows: list = None, columns: list = None) -> tuple:
+    potential_plays_across = [[] for i in range(0, max_num_letters + 1)]
+
+    # find_placements walks the squares row by row, so words down are collected per row first
+    down_by_row = [[[] for i in range(0, max_num_letters + 1)] for row in range(0, 15)]
+
+    transposed = bitboard.transposed()
+    for down, board, lines in ((False, bitboard, rows), (True, transposed, columns)):
+        if lines is None:
+            lines = board.to_lists()
+        occupied_masks = board.row_masks.tolist()
+        hot_masks = (board.vertical_neighbour_masks() | board.row_masks).tolist()
+        hot_masks[7] |= 1 << 7
+        for index in range(0, 15):
+            if hot_masks[index] == 0:
+                continue
+            for square, num_letters, start, letters in _cached_line_placements(lines[index], occupied_masks[index],
+                                                                               hot_masks[index], max_num_letters):
+                if down:
+                    down_by_row[square][num_letters].append((start, index, letters))
+                else:
+                    potential_plays_across[num_letters].append((index, start, letters))
+
+    potential_plays_down = [[placement for row in range(0, 15) for placement in down_by_row[row][num_letters]]
+                            for num_letters in range(0, max_num_letters + 1)]
+    return potential_plays_across, potential_plays_down
+
+
+#
+# BoardAnalysis of a BitBoard, with the placements from find_placements above
+#
+class BitBoardAnalysis(ScrabbleAnalysis.BoardAnalysis):
+
+    def __init__(self, bitboard: BitBoard, board: list, board_t: list = None):
+        self.key = ScrabbleAnalysis.board_key(board)
+        self.placements_across, self.placements_down = find_placements(bitboard, ScrabbleAnalysis.MAX_RACK_SIZE,
+                                                                       board, board_t)
+
+
+#
+# A ScrabbleBoard that keeps an array-backed copy of itself in 'bitboard'
+#
+class ArrayScrabbleBoard(ScrabbleBoard.ScrabbleBoard):
+
+    def __init__(self, batch_scoring: bool = False):
+        self.bitboard = BitBoard()
+        self.batch_scoring = batch_scoring
+        self._scorer = None  # (position hash, legal words, letter values, BatchScorer)
+        super().__init__()
+
+    def load(self, board: list, blank_locations: list = None):
+        self.bitboard = BitBoard.from_rows(board, blank_locations)
+        super().load(board, blank_locations)
+
+    def _compute_anchors(self) -> list:
+        return self.bitboard.anchors().tolist()
+
+    def analysis(self) -> ScrabbleAnalysis.BoardAnalysis:
+        return ScrabbleAnalysis.analysis_cache.get(self._board, self._hash,
+                                                   lambda: BitBoardAnalysis(self.bitboard, self._board, self._board_t))
+
+    def clear_caches(self):
+        super().clear_caches()
+        _line_cache.clear()
+        self._scorer = None
+
+    # The batch scorer is built once per position, from the bitboard and the cross-checks
+    # (which are kept up to date move by move once they were computed, as for the "dawg" engine)
+    def _batch_scorer(self, legal_words: set, letter_values: dict):
+        if not self.batch_scoring:
+            return None
+        if self._scorer is not None and self._scorer[0] == self._hash and self._scorer[1] is legal_words and \
+                self._scorer[2] == letter_values:
+            return self._scorer[3]
+        if self._cross_words is not legal_words or self._cross_letter_values != letter_values:
+            self._init_cross_checks(legal_words, letter_values)
+        scorer = ScrabbleScoring.BatchScorer(self.bitboard, letter_values,
+                                             (self._cross_checks_across, self._cross_checks_down))
+        self._scorer = (self._hash, legal_words, letter_values, scorer)
+        return scorer
+
+    def execute_move(self, move: ScrabbleUtils.ScrabbleMove):
+        super().execute_move(move)
+        self.bitboard.execute_move(move)
+
+    def apply(self, move: ScrabbleUtils.ScrabbleMove) -> ScrabbleBoard.BoardUndo:
+        record = super().apply(move)
+        self.bitboard.execute_move(move)
+        return record
+
+    def undo(self, record: ScrabbleBoard.BoardUndo):
+        super().undo(record)
+        for row, col in record.squares:
+            self.bitboard.remove(row, col)
+        for row, col in record.blank_squares:
+            self.bitboard.blanks[row, col] = False
+
+    def play_blank(self, row, col):
+        super().play_blank(row, col)
+        self.bitboard.blanks[row, col] = True
@@ -4,14 +4,23 @@
 # This is the main 'workhorse' for playing a game and has the following methods:
 #  - Class initialization with an empty board
 #  - Return all possible next moves as a list of ScrabbleMoves (including scores)
-#  - Execute a ScrabbleMove
+#  - Return only the k best next moves
+#  - Placement analysis of the position, shared between racks
+#  - Zobrist hash of the position, and cached move lists per position and rack
+#  - Execute a ScrabbleMove, or apply one and undo it again (for search)
+#  - Keep cross-checks and anchors up to date for both move generators
 #  - Conversion to string
 #  - Pretty printing
 #
 
 __author__ = 'Sebastian Wernicke'
 
+from ScrabbleBot import ScrabbleAnalysis
 from ScrabbleBot import ScrabbleUtils
+from ScrabbleBot import ScrabbleDawg
+from ScrabbleBot import ScrabbleExposure
+from ScrabbleBot import ScrabbleZobrist
+from ScrabbleBot import ScrabbleStats
 
 
 #
@@ -58,6 +67,26 @@ def get_board_multipliers() -> list:
             [6, 0, 0, 2, 0, 0, 0, 6, 0, 0, 0, 2, 0, 0, 6]]
 
 
+#
+# Everything ScrabbleBoard.undo needs to take back a move: the squares that got a tile
+# (or a blank flag), and the hash, anchors, cross-checks, exposure map and cached lines from before
+#
+class BoardUndo:
+
+    __slots__ = ('squares', 'blank_squares', 'hash', 'anchors', 'cross_checks', 'exposure', 'cache_dawg',
+                 'cache_entries')
+
+    def __init__(self):
+        self.squares = []
+        self.blank_squares = []
+        self.hash = 0
+        self.anchors = None
+        self.cross_checks = None
+        self.exposure = None
+        self.cache_dawg = None
+        self.cache_entries = []
+
+
 class ScrabbleBoard:
 
     # Initialize an empty board
@@ -66,17 +95,199 @@ class ScrabbleBoard:
         self._multipliers = get_board_multipliers()
         self._blank_locations = get_empty_board()
 
+        # Transposed copies of board and multipliers, so that moves down can be
+        # generated as moves across
+        self._board_t = get_empty_board()
+        self._multipliers_t = ScrabbleDawg.transpose(self._multipliers)
+
+        # Cross-checks, cross-word tile sums and anchors for the move generators.
+        # They are computed for a given set of legal words on first use and from then
+        # on only updated for the rows and columns that a move touches
+        self._cross_words = None
+        self._cross_letter_values = None
+        self._cross_checks_across = None
+        self._cross_sums_across = None
+        self._cross_checks_down = None  # In transposed coordinates
+        self._cross_sums_down = None  # In transposed coordinates
+        self._anchors = self._compute_anchors()
+
+        # Empty premium squares that the next player can / cannot reach, updated with every
+        # move (see ScrabbleExposure), and their masks and counts per kind of premium square
+        self._premium_masks = dict()
+        self._exposure = ScrabbleExposure.ExposureMap.from_board(self._board, self._anchors, self._premium_mask())
+        self._opened_counts = dict()
+
+        # Moves generated per line, reused as long as a line is unchanged
+        self._move_cache = ScrabbleDawg.LineMoveCache()
+
+        # Zobrist hash of the position, updated with every tile that is placed
+        self._hash = 0
+
     def get(self, row: int, col: int):
         return self._board[row][col]
 
-    # Returns a list of possible ScrabbleMoves on the board for a given string of letters
+    # The board as 15 lists of 15 letters or ' ' (a copy)
+    def rows(self) -> list:
+        return [list(row) for row in self._board]
+
+    # The squares that hold a blank, marked with 'X' (a copy)
+    def blank_locations(self) -> list:
+        return [list(row) for row in self._blank_locations]
+
+    # Replace the board contents with a given position (15 rows of 15 letters or ' ',
+    # either as strings or as lists), e.g. to analyse a position that was not played out.
+    # Blanks on the board can be marked with 'X' in 'blank_locations'
+    def load(self, board: list, blank_locations: list = None):
+        self._board = [list(row) for row in board]
+        if blank_locations is None:
+            self._blank_locations = get_empty_board()
+        else:
+            self._blank_locations = [list(row) for row in blank_locations]
+        self._board_t = ScrabbleDawg.transpose(self._board)
+        self._cross_words = None
+        self._anchors = self._compute_anchors()
+        self._exposure = ScrabbleExposure.ExposureMap.from_board(self._board, self._anchors, self._premium_mask())
+        self._move_cache.clear()
+        self._hash = ScrabbleZobrist.compute_hash(self._board, self._blank_locations)
+
+    # Anchors of the current position, computed from scratch (moves update them incrementally)
+    def _compute_anchors(self) -> list:
+        return ScrabbleDawg.compute_anchors(self._board)
+
+    # Zobrist hash of the current position (see ScrabbleZobrist)
+    def zobrist_hash(self) -> int:
+        return self._hash
+
+    def _square_key(self, row: int, col: int) -> int:
+        return ScrabbleZobrist.square_key(row, col, self._board[row][col], self._blank_locations[row][col] == 'X')
+
+    # Mask of the premium squares of the given kinds (see ScrabbleExposure)
+    def _premium_mask(self, kinds: tuple = ScrabbleExposure.PREMIUM_KINDS) -> int:
+        mask = self._premium_masks.get(kinds)
+        if mask is None:
+            mask = ScrabbleExposure.premium_mask(self._multipliers, kinds)
+            self._premium_masks[kinds] = mask
+        return mask
+
+    # Premium square exposure map of the current position (see ScrabbleExposure)
+    def exposure(self) -> ScrabbleExposure.ExposureMap:
+        return self._exposure
+
+    # Empty premium squares of the given kinds that the next player can reach, as (row, col) tuples
+    def exposed_premiums(self, kinds: tuple = ScrabbleExposure.PREMIUM_KINDS) -> list:
+        return ScrabbleExposure.squares(self._exposure.exposed & self._premium_mask(kinds))
+
+    # Premium squares of the given kinds that are out of reach now, but that 'move' would expose
+    def opened_premiums(self, move: ScrabbleUtils.ScrabbleMove, kinds: tuple = ScrabbleExposure.PREMIUM_KINDS) -> list:
+        return ScrabbleExposure.squares(self._exposure.opened(move.row, move.col, move.how == "across",
+                                                              len(move.word)) & self._premium_mask(kinds))
+
+    # Number of premium squares of the given kinds that every word placement would expose,
+    # computed once per position (see ScrabbleExposure.ExposureMap.opened_counts for the layout)
+    def opened_premium_counts(self, kinds: tuple = ScrabbleExposure.PREMIUM_KINDS) -> list:
+        cached = self._opened_counts.get(kinds)
+        if cached is None or cached[0] is not self._exposure:
+            cached = (self._exposure, self._exposure.opened_counts(self._premium_mask(kinds)))
+            self._opened_counts[kinds] = cached
+        return cached[1]
+
+    # Placement analysis of the current position (computed once per position and
+    # shared through an LRU cache, see ScrabbleAnalysis)
+    def analysis(self) -> ScrabbleAnalysis.BoardAnalysis:
+        return ScrabbleAnalysis.analysis_cache.get(self._board, self._hash)
+
+    # Drops what earlier move generations cached (the moves per line and the placement
+    # analyses), so that the next one generates the moves of the position from scratch
+    def clear_caches(self):
+        self._move_cache.clear()
+        ScrabbleAnalysis.analysis_cache.clear()
+
+    # The cross-checks of the position for the given legal words and letter values (see
+    # ScrabbleUtils.CrossChecks), computed on first use and then kept up to date move by move
+    def cross_checks(self, legal_words: set, letter_values: dict) -> ScrabbleUtils.CrossChecks:
+        if self._cross_words is not legal_words or self._cross_letter_values != letter_values:
+            self._init_cross_checks(legal_words, letter_values)
+        return ScrabbleUtils.CrossChecks(self._board, self._board_t, self._multipliers, self._multipliers_t,
+                                         self._cross_checks_across, self._cross_sums_across,
+                                         self._cross_checks_down, self._cross_sums_down)
+
+    # Scorer with which the "signatures" engine scores the candidate words of a placement
+    # in one batch (a ScrabbleScoring.BatchScorer), or None to score them one at a time
+    def _batch_scorer(self, legal_words: set, letter_values: dict):
+        return None
+
+    # Returns a ScrabbleUtils.MoveList of the possible moves on the board for a given string of letters
     # Requires pointer to letter values, allowed words, and the word signature dictionary
+    # The 'engine' switch selects the move generator:
+    #  - "signatures": subset enumeration with word signature lookups (needs word_signatures)
+    #  - "dawg": anchor-based traversal of a word graph (needs dawg)
+    # If a ScrabbleZobrist.MoveListCache is given, move lists are looked up there first
+    # (by position, rack and engine) and stored there after they were generated.
+    # A ScrabbleStats.EngineStats ('stats') records timers and counters of the
+    # "signatures" engine, which checks and scores its candidate words with the cross-checks
     def possible_moves(self, letters: str, letter_values: dict,
-                       legal_words: set, word_signatures: dict) -> list:
+                       legal_words: set, word_signatures: dict,
+                       engine: str = "signatures", dawg: ScrabbleDawg.ScrabbleDawg = None,
+                       move_cache: ScrabbleZobrist.MoveListCache = None,
+                       stats: ScrabbleStats.EngineStats = None) -> ScrabbleUtils.MoveList:
         if len(letters) > 7:
             TypeError("Letters must be a string no longer than 7 characters")
-        return ScrabbleUtils.find_all_moves(self._board, letters, legal_words,
-                                            self._multipliers, letter_values, word_signatures)
+        if move_cache is not None:
+            key = ScrabbleZobrist.MoveListCache.key(self._hash, letters, engine)
+            moves = move_cache.lookup(key)
+            if moves is None:
+                moves = self.possible_moves(letters, letter_values, legal_words, word_signatures, engine, dawg,
+                                            None, stats)
+                move_cache.store(key, moves)
+            return moves
+        if engine == "signatures":
+            return ScrabbleUtils.find_all_moves(self._board, letters, legal_words,
+                                                self._multipliers, letter_values, word_signatures, self.analysis(),
+                                                stats, self._batch_scorer(legal_words, letter_values),
+                                                self.cross_checks(legal_words, letter_values))
+        elif engine == "dawg":
+            if dawg is None:
+                raise ValueError("The 'dawg' engine requires a ScrabbleDawg word graph")
+            if self._cross_words is not legal_words or self._cross_letter_values != letter_values:
+                self._init_cross_checks(legal_words, letter_values)
+            return ScrabbleDawg.generate_moves(self._board, self._board_t, letters, dawg,
+                                               self._multipliers, self._multipliers_t, letter_values,
+                                               self._cross_checks_across, self._cross_sums_across,
+                                               self._cross_checks_down, self._cross_sums_down, self._anchors,
+                                               self._move_cache)
+        else:
+            raise ValueError("Unknown move generation engine '" + engine + "'")
+
+    # Same as possible_moves, but yields the ScrabbleMoves one at a time. With the "signatures"
+    # engine they are generated lazily, the "dawg" engine generates all of them up front
+    def iter_possible_moves(self, letters: str, letter_values: dict,
+                            legal_words: set, word_signatures: dict,
+                            engine: str = "signatures", dawg: ScrabbleDawg.ScrabbleDawg = None,
+                            stats: ScrabbleStats.EngineStats = None):
+        if engine == "signatures":
+            return ScrabbleUtils.iter_all_moves(self._board, letters, legal_words,
+                                                self._multipliers, letter_values, word_signatures, self.analysis(),
+                                                stats, self._batch_scorer(legal_words, letter_values),
+                                                self.cross_checks(legal_words, letter_values))
+        return iter(self.possible_moves(letters, letter_values, legal_words, word_signatures, engine, dawg,
+                                        None, stats))
+
+    # Returns the (up to) k highest scoring ScrabbleMoves, sorted by score from high to low
+    # (moves with the same score in the order of possible_moves).
+    # The "signatures" engine prunes placements that cannot beat the k-th best move
+    # (see ScrabbleUtils.best_moves), the "dawg" engine selects from all moves.
+    # 'stats' is an optional ScrabbleStats.EngineStats (see possible_moves)
+    def best_moves(self, letters: str, letter_values: dict,
+                   legal_words: set, word_signatures: dict, k: int,
+                   engine: str = "signatures", dawg: ScrabbleDawg.ScrabbleDawg = None,
+                   stats: ScrabbleStats.EngineStats = None) -> list:
+        if engine == "signatures":
+            return ScrabbleUtils.best_moves(self._board, letters, legal_words, self._multipliers,
+                                            letter_values, word_signatures, k, self.analysis(), stats,
+                                            self._batch_scorer(legal_words, letter_values),
+                                            self.cross_checks(legal_words, letter_values))
+        return self.possible_moves(letters, letter_values, legal_words, word_signatures, engine, dawg,
+                                   None, stats).top(k)
 
     def check_legal_and_score_move(self, move: ScrabbleUtils.ScrabbleMove, letter_values: dict, legal_words: set) -> int:
         if move.how == "across":
@@ -104,8 +315,127 @@ class ScrabbleBoard:
         else:
             return -1
 
+    # Compute cross-checks from scratch for a set of legal words
+    def _init_cross_checks(self, legal_words: set, letter_values: dict):
+        self._cross_words = legal_words
+        self._cross_letter_values = letter_values
+        self._cross_checks_across, self._cross_sums_across = \
+            ScrabbleDawg.compute_cross_checks(self._board, legal_words, letter_values)
+        self._cross_checks_down, self._cross_sums_down = \
+            ScrabbleDawg.compute_cross_checks(self._board_t, legal_words, letter_values)
+        self._move_cache.clear()
+
+    # Update cross-checks and anchors after tiles were placed in 'rows' x 'cols'
+    # (one of the two is a single line). Cross-checks for playing across only depend
+    # on the columns, cross-checks for playing down only on the rows.
+    # Every line in which tiles, anchors or cross-checks changed is dropped from the move cache.
+    # If an undo record is given, the previous anchors, cross-checks and cache entries are saved in it
+    def _update_cross_checks(self, rows: range, cols: range, record: BoardUndo = None):
+        changed_rows = set(rows)
+        changed_cols = set(cols)
+
+        old_anchors = [list(anchor_row) for anchor_row in self._anchors]
+        ScrabbleDawg.update_anchors(self._board, self._anchors, rows.start - 1, rows.stop, cols.start - 1, cols.stop)
+        self._anchors[7][7] = ScrabbleDawg.is_anchor(self._board, 7, 7)  # Board is no longer empty
+        for row in range(0, 15):
+            for col in range(0, 15):
+                if old_anchors[row][col] != self._anchors[row][col]:
+                    changed_rows.add(row)
+                    changed_cols.add(col)
+
+        if self._cross_words is not None:
+            old_across = [[(self._cross_checks_across[row][col], self._cross_sums_across[row][col])
+                           for col in cols] for row in range(0, 15)]
+            ScrabbleDawg.update_cross_checks(self._board, self._cross_checks_across, self._cross_sums_across,
+                                             cols, self._cross_words, self._cross_letter_values)
+            for row in range(0, 15):
+                for i, col in enumerate(cols):
+                    if old_across[row][i] != (self._cross_checks_across[row][col], self._cross_sums_across[row][col]):
+                        changed_rows.add(row)
+
+            # Down cross-checks are stored transposed: [col][row]
+            old_down = [[(self._cross_checks_down[col][row], self._cross_sums_down[col][row])
+                         for row in rows] for col in range(0, 15)]
+            ScrabbleDawg.update_cross_checks(self._board_t, self._cross_checks_down, self._cross_sums_down,
+                                             rows, self._cross_words, self._cross_letter_values)
+            for col in range(0, 15):
+                for i, row in enumerate(rows):
+                    if old_down[col][i] != (self._cross_checks_down[col][row], self._cross_sums_down[col][row]):
+                        changed_cols.add(col)
+
+            if record is not None:
+                record.cross_checks = (self._cross_words, cols, old_across, rows, old_down)
+
+        if record is not None:
+            record.anchors = old_anchors
+            record.cache_dawg = self._move_cache.dawg()
+        for row in changed_rows:
+            entry = self._move_cache.invalidate(False, row)
+            if record is not None:
+                record.cache_entries.append((False, row, entry))
+        for col in changed_cols:
+            entry = self._move_cache.invalidate(True, col)
+            if record is not None:
+                record.cache_entries.append((True, col, entry))
+
     # Execute a ScrabbleMove on the board (with some error checking)
     def execute_move(self, move: ScrabbleUtils.ScrabbleMove):
+        self._execute_move(move, None)
+
+    # Execute a ScrabbleMove and return a record with which undo() restores the current state.
+    # This allows search to explore moves on one board instead of copying it for every branch
+    def apply(self, move: ScrabbleUtils.ScrabbleMove) -> BoardUndo:
+        record = BoardUndo()
+        self._execute_move(move, record)
+        return record
+
+    # Take back the move of an undo record from apply(). Records must be undone in
+    # reverse order of the apply() calls that created them
+    def undo(self, record: BoardUndo):
+        for row, col in record.squares:
+            self._board[row][col] = ' '
+            self._board_t[col][row] = ' '
+        for row, col in record.blank_squares:
+            self._blank_locations[row][col] = ' '
+        self._hash = record.hash
+        if record.anchors is not None:
+            self._anchors = record.anchors
+        if record.exposure is not None:
+            self._exposure = record.exposure
+
+        if record.cross_checks is not None and record.cross_checks[0] is self._cross_words:
+            cross_words, cols, old_across, rows, old_down = record.cross_checks
+            for row in range(0, 15):
+                for i, col in enumerate(cols):
+                    self._cross_checks_across[row][col], self._cross_sums_across[row][col] = old_across[row][i]
+            for col in range(0, 15):
+                for i, row in enumerate(rows):
+                    self._cross_checks_down[col][row], self._cross_sums_down[col][row] = old_down[col][i]
+        elif self._cross_words is not None:
+            self._cross_words = None  # Computed for another state, recompute on next use
+
+        same_cache = record.cache_dawg is self._move_cache.dawg()
+        for transposed, line, entry in record.cache_entries:
+            if entry is not None and same_cache:
+                self._move_cache.restore(transposed, line, entry)
+            else:
+                self._move_cache.invalidate(transposed, line)
+
+    def _execute_move(self, move: ScrabbleUtils.ScrabbleMove, record: BoardUndo):
+        if move.how == "down":
+            squares = [(move.row + i, move.col) for i in range(0, len(move.word))]
+        else:
+            squares = [(move.row, move.col + i) for i in range(0, len(move.word))]
+        old_keys = 0
+        for row, col in squares:
+            old_keys ^= self._square_key(row, col)
+        if record is not None:
+            record.hash = self._hash
+            record.squares = [(row, col) for row, col in squares if self._board[row][col] == ' ']
+            record.blank_squares = [squares[pos] for pos in move.blank_positions
+                                    if self._blank_locations[squares[pos][0]][squares[pos][1]] != 'X']
+            record.exposure = self._exposure
+
         if move.how == "down":
             for i in range(0, len(move.word)):
                 letter_on_board = self._board[move.row + i][move.col]
@@ -113,8 +443,11 @@ class ScrabbleBoard:
                     ValueError("Execution of move blocked at (" + str(move.row + i) + "," + str(move.col) + ")")
             for i in range(0, len(move.word)):
                 self._board[move.row+i][move.col] = move.word[i]
+                self._board_t[move.col][move.row+i] = move.word[i]
             for pos in move.blank_positions:
                 self._blank_locations[move.row+pos][move.col] = 'X'
+            self._update_cross_checks(range(move.row, move.row + len(move.word)), range(move.col, move.col + 1),
+                                      record)
         elif move.how == "across":
             for i in range(0, len(move.word)):
                 letter_on_board = self._board[move.row][move.col + i]
@@ -122,13 +455,25 @@ class ScrabbleBoard:
                     ValueError("Execution of move blocked at (" + str(move.row + i) + "," + str(move.col) + ")")
             for i in range(0, len(move.word)):
                 self._board[move.row][move.col + i] = move.word[i]
+                self._board_t[move.col + i][move.row] = move.word[i]
             for pos in move.blank_positions:
                 self._blank_locations[move.row][move.col+pos] = 'X'
+            self._update_cross_checks(range(move.row, move.row + 1), range(move.col, move.col + len(move.word)),
+                                      record)
         else:
             ValueError("Move does not correctly specify 'down' or ' across'")
+            return
+        self._exposure = self._exposure.after_move(move.row, move.col, move.how == "across", len(move.word))
+
+        new_keys = 0
+        for row, col in squares:
+            new_keys ^= self._square_key(row, col)
+        self._hash ^= old_keys ^ new_keys
 
     def play_blank(self, row, col):
+        self._hash ^= self._square_key(row, col)
         self._blank_locations[row][col] = "X"
+        self._hash ^= self._square_key(row, col)
 
     # Convert board to a nicely readable string
     def __str__(self) -> str:
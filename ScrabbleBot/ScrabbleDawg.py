@@ -0,0 +1,442 @@
+#
+# This file contains an alternative move generator that is based on a DAWG
+# (directed acyclic word graph) of the legal words.
+#
+# Instead of enumerating every subset of the rack and looking up letter
+# signatures, the generator walks the word graph from 'anchor' squares
+# (empty squares next to a tile that is already on the board) and extends
+# words to the left and to the right, following the algorithm of Appel and
+# Jacobson ("The World's Fastest Scrabble Program", 1988). Every word that
+# comes out of the traversal is legal by construction, so no candidate has
+# to be thrown away after scoring.
+#
+# The generator returns the same kind of move list (ScrabbleUtils.MoveList) as
+# ScrabbleUtils.find_all_moves and can be selected through the 'engine'
+# switch of ScrabbleBoard.possible_moves
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot.ScrabbleUtils import MoveList
+
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+#
+# A node of the word graph. 'children' maps a letter to the next node,
+# 'terminal' signals that the path from the root to this node spells a word
+#
+class DawgNode:
+
+    __slots__ = ('children', 'terminal')
+
+    def __init__(self):
+        self.children = dict()
+        self.terminal = False
+
+
+class ScrabbleDawg:
+
+    # Build the word graph from a set of legal words. The graph starts out as
+    # a trie and is then minimized by merging all equivalent suffix subtrees
+    def __init__(self, legal_words: set):
+        print("Building word graph for " + str(len(legal_words)) + " words")
+        self.root = DawgNode()
+        for word in sorted(legal_words):  # Fixes the order of the children, and so of the moves
+            node = self.root
+            for char in word:
+                child = node.children.get(char)
+                if child is None:
+                    child = DawgNode()
+                    node.children[char] = child
+                node = child
+            node.terminal = True
+        self.num_nodes = self._minimize()
+
+    # Merge equivalent subtrees bottom-up, returns the number of remaining nodes
+    def _minimize(self) -> int:
+        registry = dict()
+
+        def register(node: DawgNode) -> DawgNode:
+            for char, child in node.children.items():
+                node.children[char] = register(child)
+            key = (node.terminal, tuple((char, id(child)) for char, child in sorted(node.children.items())))
+            existing = registry.get(key)
+            if existing is not None:
+                return existing
+            registry[key] = node
+            return node
+
+        self.root = register(self.root)
+        return len(registry)
+
+    def __contains__(self, word: str) -> bool:
+        node = self.root
+        for char in word:
+            node = node.children.get(char)
+            if node is None:
+                return False
+        return node.terminal
+
+
+#
+# Compute the cross-check of an empty square for playing across: if there is a
+# tile directly above or below, return the set of letters that form a legal
+# word down together with the value of the tiles in that down word.
+# Squares without vertical neighbours (and occupied squares) are unconstrained (None)
+#
+def compute_cross_check(board: list, row: int, col: int, legal_words: set, letter_values: dict) -> tuple:
+    if board[row][col] != ' ':
+        return None, 0
+    if (row == 0 or board[row-1][col] == ' ') and (row == 14 or board[row+1][col] == ' '):
+        return None, 0
+    prefix = ""
+    start_row = row
+    while start_row > 0 and board[start_row-1][col] != ' ':
+        start_row -= 1
+        prefix = board[start_row][col] + prefix
+    postfix = ""
+    end_row = row
+    while end_row < 14 and board[end_row+1][col] != ' ':
+        end_row += 1
+        postfix += board[end_row][col]
+    allowed = set(char for char in ALPHABET if (prefix + char + postfix) in legal_words)
+    return allowed, sum(letter_values[char] for char in prefix + postfix)
+
+
+#
+# Compute the cross-checks and cross-word tile sums of all squares for playing across
+#
+def compute_cross_checks(board: list, legal_words: set, letter_values: dict) -> tuple:
+    cross_checks = [[None] * 15 for _ in range(15)]
+    cross_sums = [[0] * 15 for _ in range(15)]
+    update_cross_checks(board, cross_checks, cross_sums, range(0, 15), legal_words, letter_values)
+    return cross_checks, cross_sums
+
+
+#
+# Recompute the cross-checks (for playing across) of all squares in the given
+# columns. Placing tiles in a column only changes the down words of that column,
+# so this is all that needs to happen after a move
+#
+def update_cross_checks(board: list, cross_checks: list, cross_sums: list, columns,
+                        legal_words: set, letter_values: dict):
+    for col in columns:
+        for row in range(0, 15):
+            cross_checks[row][col], cross_sums[row][col] = compute_cross_check(board, row, col,
+                                                                               legal_words, letter_values)
+
+
+#
+# An anchor is an empty square that is adjacent to a tile on the board
+#
+def is_anchor(board: list, row: int, col: int) -> bool:
+    if board[row][col] != ' ':
+        return False
+    return (row > 0 and board[row-1][col] != ' ') or (row < 14 and board[row+1][col] != ' ') or \
+        (col > 0 and board[row][col-1] != ' ') or (col < 14 and board[row][col+1] != ' ')
+
+
+#
+# Compute the anchors of the board. On an empty board the only anchor is the center square
+#
+def compute_anchors(board: list) -> list:
+    anchors = [[is_anchor(board, row, col) for col in range(0, 15)] for row in range(0, 15)]
+    if board[7][7] == ' ' and all(board[row][col] == ' ' for row in range(0, 15) for col in range(0, 15)):
+        anchors[7][7] = True
+    return anchors
+
+
+#
+# Recompute the anchors in the rectangle [first_row, last_row] x [first_col, last_col]
+# (clipped to the board), which is the neighbourhood of a move that was just played
+#
+def update_anchors(board: list, anchors: list, first_row: int, last_row: int, first_col: int, last_col: int):
+    for row in range(max(first_row, 0), min(last_row, 14) + 1):
+        for col in range(max(first_col, 0), min(last_col, 14) + 1):
+            anchors[row][col] = is_anchor(board, row, col)
+
+
+#
+# Transpose a 15x15 nested list, so that playing down can be handled as playing across
+#
+def transpose(grid: list) -> list:
+    return [list(column) for column in zip(*grid)]
+
+
+#
+# Generate all moves across in one row of 'board' (which might be a transposed board,
+# in which case the coordinates are swapped back in the moves). Results are
+# collected in 'found', keyed by placement, word and rack letters used, so that
+# for every such key only the best scoring blank designation survives
+#
+def _generate_line(board: list, rack: dict, dawg: ScrabbleDawg, board_multipliers: list,
+                   letter_values: dict, cross_checks: list, cross_sums: list, anchors: list,
+                   row: int, transposed: bool, found: dict):
+    board_row = board[row]
+    mult_row = board_multipliers[row]
+    check_row = cross_checks[row]
+    sum_row = cross_sums[row]
+
+    # 'placed' collects (col, letter, is_blank) for every tile taken from the rack
+    def record(word: str, end_col: int, placed: list):
+        start_col = end_col - len(word) + 1
+        base_score = 0
+        word_multiplier = 1
+        cross_score = 0
+        new_tiles = dict()
+        for col, char, is_blank in placed:
+            new_tiles[col] = is_blank
+        for i in range(0, len(word)):
+            col = start_col + i
+            if col not in new_tiles:
+                base_score += letter_values[word[i]]
+                continue
+            value = 0 if new_tiles[col] else letter_values[word[i]]
+            multiplier = mult_row[col]
+            letter_multiplier = 1
+            square_multiplier = 1
+            if multiplier == 2 or multiplier == 3:
+                letter_multiplier = multiplier
+            elif multiplier == 4:
+                square_multiplier = 2
+            elif multiplier == 6:
+                square_multiplier = 3
+            base_score += value * letter_multiplier
+            word_multiplier *= square_multiplier
+            if check_row[col] is not None:
+                cross_score += (sum_row[col] + value * letter_multiplier) * square_multiplier
+        score = base_score * word_multiplier + cross_score
+        if len(placed) == 7:
+            score += 50
+        letters_used = tuple(sorted('*' if is_blank else char for col, char, is_blank in placed))
+        blank_positions = [col - start_col for col, char, is_blank in placed if is_blank]
+        if transposed:
+            key = (start_col, row, "down", word, letters_used)
+        else:
+            key = (row, start_col, "across", word, letters_used)
+        best = found.get(key)
+        if best is None or score > best[0]:
+            found[key] = (score, blank_positions)
+
+    def extend_right(partial: str, node: DawgNode, col: int, anchor_col: int, placed: list):
+        if col == 15 or board_row[col] == ' ':
+            if node.terminal and col > anchor_col and len(partial) > 1:
+                record(partial, col - 1, placed)
+            if col == 15:
+                return
+            allowed = check_row[col]
+            for char, child in node.children.items():
+                if allowed is not None and char not in allowed:
+                    continue
+                if rack.get(char, 0) > 0:
+                    rack[char] -= 1
+                    placed.append((col, char, False))
+                    extend_right(partial + char, child, col + 1, anchor_col, placed)
+                    placed.pop()
+                    rack[char] += 1
+                if rack.get('*', 0) > 0:
+                    rack['*'] -= 1
+                    placed.append((col, char, True))
+                    extend_right(partial + char, child, col + 1, anchor_col, placed)
+                    placed.pop()
+                    rack['*'] += 1
+        else:
+            child = node.children.get(board_row[col])
+            if child is not None:
+                extend_right(partial + board_row[col], child, col + 1, anchor_col, placed)
+
+    # The left part is generated before we know where it starts, so its tiles are
+    # kept as (letter, is_blank) and only get their columns when extend_right is reached
+    def left_part(partial: str, node: DawgNode, limit: int, anchor_col: int, left_tiles: list):
+        start_col = anchor_col - len(partial)
+        placed = [(start_col + i, char, is_blank) for i, (char, is_blank) in enumerate(left_tiles)]
+        extend_right(partial, node, anchor_col, anchor_col, placed)
+        if limit == 0:
+            return
+        for char, child in node.children.items():
+            if rack.get(char, 0) > 0:
+                rack[char] -= 1
+                left_tiles.append((char, False))
+                left_part(partial + char, child, limit - 1, anchor_col, left_tiles)
+                left_tiles.pop()
+                rack[char] += 1
+            if rack.get('*', 0) > 0:
+                rack['*'] -= 1
+                left_tiles.append((char, True))
+                left_part(partial + char, child, limit - 1, anchor_col, left_tiles)
+                left_tiles.pop()
+                rack['*'] += 1
+
+    for anchor_col in range(0, 15):
+        if not anchors[row][anchor_col]:
+            continue
+        if anchor_col > 0 and board_row[anchor_col-1] != ' ':
+            # The left part is whatever is already on the board
+            start_col = anchor_col - 1
+            while start_col > 0 and board_row[start_col-1] != ' ':
+                start_col -= 1
+            node = dawg.root
+            for col in range(start_col, anchor_col):
+                node = node.children.get(board_row[col])
+                if node is None:
+                    break
+            if node is not None:
+                extend_right("".join(board_row[start_col:anchor_col]), node, anchor_col, anchor_col, [])
+        else:
+            # The left part is built from the rack on empty squares that are not anchors
+            max_limit = sum(rack.values()) - 1
+            limit = 0
+            col = anchor_col - 1
+            while limit < max_limit and col >= 0 and board_row[col] == ' ' and not anchors[row][col]:
+                limit += 1
+                col -= 1
+            left_part("", dawg.root, limit, anchor_col, [])
+
+
+#
+# Cache of generated moves per line (row for moves across, column for moves down).
+#
+# Every line keeps the moves it produced together with the rack they were
+# generated for, for the last few racks (so that the racks of both players, or of
+# the players in a simulation, don't push each other out). The moves of a line
+# only depend on that line's tiles, cross-checks and anchors, so the board
+# invalidates exactly the lines in which one of those changed. For a line that is
+# still valid, the cached moves can be reused for any rack that is contained in a
+# cached rack: they are filtered with a rack-subset check instead of walking the
+# word graph again. This pays off whenever the same position is queried again with
+# the same or a smaller rack (passed turns, racks shrinking in the endgame, search
+# and simulation)
+#
+class LineMoveCache:
+
+    def __init__(self, racks_per_line: int = 4):
+        self.racks_per_line = racks_per_line
+        self._lines = dict()  # (transposed, line) -> [(rack, found)], most recently used first
+        self._dawg = None
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._lines.clear()
+
+    # Drop the moves of a line, returns the dropped entry (or None)
+    def invalidate(self, transposed: bool, line: int):
+        return self._lines.pop((transposed, line), None)
+
+    # Put back an entry that invalidate() returned (when a move is taken back)
+    def restore(self, transposed: bool, line: int, entry: list):
+        self._lines[(transposed, line)] = entry
+
+    def dawg(self) -> ScrabbleDawg:
+        return self._dawg
+
+    # Returns the cached moves of a line that can be played with 'rack', or None
+    def lookup(self, transposed: bool, line: int, rack: dict):
+        entry = self._lines.get((transposed, line))
+        if entry is None:
+            self.misses += 1
+            return None
+        for i in range(0, len(entry)):
+            cached_rack, found = entry[i]
+            if cached_rack == rack:
+                self.hits += 1
+                if i > 0:
+                    entry.insert(0, entry.pop(i))
+                return found
+        for cached_rack, found in entry:
+            if all(count <= cached_rack.get(char, 0) for char, count in rack.items()):
+                self.hits += 1
+                ret = dict()
+                for key, value in found.items():
+                    if _fits(key[4], rack):
+                        ret[key] = value
+                return ret
+        self.misses += 1
+        return None
+
+    def store(self, transposed: bool, line: int, rack: dict, found: dict):
+        entry = self._lines.get((transposed, line))
+        if entry is None:
+            self._lines[(transposed, line)] = [(dict(rack), found)]
+        else:
+            entry.insert(0, (dict(rack), found))
+            del entry[self.racks_per_line:]
+
+    # The cache is only valid for one word graph
+    def check_dawg(self, dawg: ScrabbleDawg):
+        if self._dawg is not dawg:
+            self._lines.clear()
+            self._dawg = dawg
+
+
+#
+# Checks if the (sorted) letters of a move can be taken from a rack
+#
+def _fits(letters_used: tuple, rack: dict) -> bool:
+    count = 0
+    for i in range(0, len(letters_used)):
+        count = count + 1 if i > 0 and letters_used[i] == letters_used[i-1] else 1
+        if count > rack.get(letters_used[i], 0):
+            return False
+    return True
+
+
+#
+# Generate all moves from precomputed cross-checks and anchors. The down cross-checks
+# and multipliers are given for the transposed board ('board_t'), since playing
+# down is handled as playing across on the transposed board.
+# If a LineMoveCache is given, lines are taken from and stored in it
+#
+def generate_moves(board: list, board_t: list, letters: str, dawg: ScrabbleDawg,
+                   board_multipliers: list, board_multipliers_t: list, letter_values: dict,
+                   cross_checks_across: list, cross_sums_across: list,
+                   cross_checks_down: list, cross_sums_down: list, anchors: list,
+                   move_cache: LineMoveCache = None) -> MoveList:
+
+    rack = dict()
+    for char in letters:
+        rack[char] = rack.get(char, 0) + 1
+
+    if move_cache is not None:
+        move_cache.check_dawg(dawg)
+
+    found = dict()
+    anchors_t = transpose(anchors)
+    for transposed in (False, True):
+        for line in range(0, 15):
+            line_found = None
+            if move_cache is not None:
+                line_found = move_cache.lookup(transposed, line, rack)
+            if line_found is None:
+                line_found = dict()
+                if transposed:
+                    _generate_line(board_t, rack, dawg, board_multipliers_t, letter_values,
+                                   cross_checks_down, cross_sums_down, anchors_t, line, True, line_found)
+                else:
+                    _generate_line(board, rack, dawg, board_multipliers, letter_values,
+                                   cross_checks_across, cross_sums_across, anchors, line, False, line_found)
+                if move_cache is not None:
+                    move_cache.store(transposed, line, rack, line_found)
+            found.update(line_found)
+
+    solutions = MoveList()
+    for (row, col, how, word, letters_used), (score, blank_positions) in found.items():
+        solutions.add(row, col, how, word, letters_used, score, blank_positions)
+    return solutions
+
+
+#
+# Given a Scrabble board and a string of letters, this function calculates a MoveList
+# of all possible moves by walking the word graph from the anchor squares.
+# The result contains the same moves as ScrabbleUtils.find_all_moves (without the
+# duplicates that the signature lookup produces for words with repeated letters)
+#
+def find_all_moves(board: list, letters: str, legal_words: set,
+                   board_multipliers: list, letter_values: dict, dawg: ScrabbleDawg) -> MoveList:
+    board_t = transpose(board)
+    cross_checks_across, cross_sums_across = compute_cross_checks(board, legal_words, letter_values)
+    cross_checks_down, cross_sums_down = compute_cross_checks(board_t, legal_words, letter_values)
+    return generate_moves(board, board_t, letters, dawg, board_multipliers, transpose(board_multipliers),
+                          letter_values, cross_checks_across, cross_sums_across,
+                          cross_checks_down, cross_sums_down, compute_anchors(board))
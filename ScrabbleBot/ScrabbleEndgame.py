@@ -0,0 +1,356 @@
+#
+# This file contains an endgame solver and a mixin that lets bots use it
+#
+# Once the bag is empty, the opponent's rack is known (it is exactly the unseen
+# tiles), so the rest of the game can be searched like a game of perfect information.
+# The solver runs a negamax alpha-beta search over the move lists of both players:
+#  - the value of a position is the spread (points of the side to move minus points
+#    of the other side) from there until the end of the game, including the leftover
+#    tile penalties of ScrabbleGame.finish_game: when a player goes out the other one
+#    loses the value of their rack, when both players pass in a row both lose the
+#    value of their own rack
+#  - moves are searched by their score minus the value of the tiles they leave on the
+#    rack, from high to low (a pass last), with the best move of an earlier search from
+#    the transposition table first
+#  - the move list of a rack in a position is generated once and kept for all searches
+#    (it is the same in every iteration of the deepening, and in the next solve of a game)
+#  - only the first 'max_width' moves of a position are searched
+#  - the transposition table is keyed by (board hash, rack of the side to move, rack
+#    of the other side, whether the last move was a pass)
+#  - moves are made with ScrabbleBoard.apply and taken back with undo
+#
+# The search is iteratively deepened until it finds the exact result, or until the
+# time limit is reached, in which case the result of the deepest completed search is
+# used. Positions at the search horizon are estimated as if both players got stuck
+# with their racks (so one ply before the horizon, the first move of the list is the
+# best one). Once a search reaches the end of the game everywhere but misses moves
+# that were pruned, it is repeated with twice as many moves per position, until no
+# move is pruned any more and the result is exact.
+#
+# The solver assumes a game of two players.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleSimulation
+from ScrabbleBot import ScrabbleUtils
+
+from time import perf_counter
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Depth of transposition table entries whose value does not depend on a search horizon
+SOLVED_DEPTH = 1000
+# Depth of transposition table entries whose value does not depend on a search horizon, but on
+# the moves that were searched (with moves pruned, see EndgameSolver.max_width)
+PRUNED_DEPTH = SOLVED_DEPTH - 1
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+#
+# Result of EndgameSolver.solve
+#
+class EndgameResult:
+
+    def __init__(self, value: int, move: ScrabbleUtils.ScrabbleMove, principal_variation: list,
+                 depth: int, exact: bool, nodes: int):
+        self.value = value  # Spread from the position until the end of the game for the side to move
+        self.move = move  # Best move (None for a pass)
+        self.principal_variation = principal_variation  # Best moves of both sides, starting with 'move'
+        self.depth = depth  # Depth (in plies) of the deepest completed search
+        self.exact = exact  # Whether 'value' is the exact result of perfect play
+        self.nodes = nodes
+
+
+class EndgameSolver:
+
+    # 'lexicon' is the tuple (legal_words, word_signatures, engine, dawg) of
+    # ScrabbleMatch.load_move_generator. 'time_limit' is in seconds (None for no limit),
+    # 'max_depth' optionally limits the search depth in plies, 'max_width' the number of
+    # moves searched per position (None for all of them).
+    # 'max_cached_moves' limits the number of moves kept in the move lists
+    def __init__(self, lexicon: tuple, letter_values: dict, time_limit: float = 10.0, max_depth: int = None,
+                 max_width: int = 8, max_table_entries: int = 1000000, max_cached_moves: int = 500000):
+        self._legal_words, self._word_signatures, self._engine, self._dawg = lexicon
+        self._letter_values = letter_values
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.max_width = max_width
+        self.max_table_entries = max_table_entries
+        self.max_cached_moves = max_cached_moves
+        self._table = dict()  # key -> (depth, value, bound, best move key)
+        self._move_lists = dict()  # (board hash, rack) -> [(static value, move, move key, rack left)]
+        self._cached_moves = 0
+        self._board = None
+        self._deadline = None
+        self._width = None
+        self._nodes = 0
+        self._horizon_hits = 0
+        self._pruned = 0
+
+    #
+    # Solve the endgame on 'board' where the side to move has the tiles 'rack' and the
+    # other side has 'opponent_rack' (and the bag is empty). 'passed' tells if the
+    # last move was a pass. The board is the same afterwards
+    #
+    def solve(self, board: ScrabbleBoard.ScrabbleBoard, rack: list, opponent_rack: list,
+              passed: bool = False) -> EndgameResult:
+        self._board = board
+        self._table.clear()
+        self._nodes = 0
+        self._deadline = perf_counter() + self.time_limit if self.time_limit is not None else None
+        rack = sorted(rack)
+        opponent_rack = sorted(opponent_rack)
+
+        # Every move of a player uses a tile, and two passes in a row end the game
+        max_depth = 2 * (len(rack) + len(opponent_rack)) + 2
+        if self.max_depth is not None:
+            max_depth = min(max_depth, self.max_depth)
+
+        result = None
+        self._width = self.max_width
+        depth = 1
+        while depth <= max_depth:
+            self._horizon_hits = 0
+            self._pruned = 0
+            try:
+                value = self._negamax(depth, -float('inf'), float('inf'), rack, opponent_rack, passed)
+            except _SearchTimeout:
+                break
+            exact = self._horizon_hits == 0 and self._pruned == 0
+            variation = self._principal_variation(rack, opponent_rack, passed, depth)
+            result = EndgameResult(value, variation[0] if len(variation) > 0 else None, variation,
+                                   depth, exact, self._nodes)
+            if exact:
+                break
+            if self._horizon_hits == 0:
+                # Only the pruned moves are missing: search the same depth again with twice as many
+                # moves, where the values of the narrower search only serve to order the moves
+                self._width *= 2
+                for key, (entry_depth, entry_value, entry_bound, best_key) in self._table.items():
+                    if entry_depth < SOLVED_DEPTH:
+                        self._table[key] = (-1, entry_value, entry_bound, best_key)
+                continue
+            self._width = self.max_width
+            depth += 1
+
+        if result is None:
+            # Not even the first iteration finished: play the move with the best static value
+            moves = self._ordered_moves(rack, None)
+            move = moves[0] if len(moves) > 0 else None
+            result = EndgameResult(move.score if move is not None else 0, move, [move], 0, False, self._nodes)
+        self._board = None
+        return result
+
+    def _rack_value(self, rack: list) -> int:
+        return sum(self._letter_values[letter] for letter in rack)
+
+    # Moves of the side to move as (static value, move, move key, rack left), where the static
+    # value is the score of the move minus the value of the rack left, from high to low
+    # (moves with the same static value by score). Generated once per position and rack
+    def _moves(self, rack: list) -> list:
+        key = (self._board.zobrist_hash(), "".join(rack))
+        moves = self._move_lists.get(key)
+        if moves is not None:
+            return moves
+        move_list = self._board.possible_moves(key[1], self._letter_values, self._legal_words,
+                                               self._word_signatures, self._engine, self._dawg)
+        move_list.sort(reverse=True)
+        moves = []
+        for move in move_list:
+            new_rack = list(rack)
+            for letter in move.letters:
+                new_rack.remove(letter)
+            moves.append((move.score - self._rack_value(new_rack), move, _move_key(move), new_rack))
+        moves.sort(key=lambda entry: entry[0], reverse=True)
+        if self._cached_moves + len(moves) > self.max_cached_moves:
+            self._move_lists.clear()
+            self._cached_moves = 0
+        self._move_lists[key] = moves
+        self._cached_moves += len(moves)
+        return moves
+
+    # Moves of the side to move (see _moves), the move with key 'first' first
+    def _ordered_moves(self, rack: list, first) -> list:
+        moves = [move for static_value, move, move_key, new_rack in self._moves(rack)]
+        if first is not None:
+            for i in range(0, len(moves)):
+                if _move_key(moves[i]) == first:
+                    moves.insert(0, moves.pop(i))
+                    break
+        return moves
+
+    def _negamax(self, depth: int, alpha: float, beta: float, rack: list, other: list, passed: bool) -> int:
+        self._nodes += 1
+        if self._deadline is not None and perf_counter() > self._deadline:
+            raise _SearchTimeout()
+
+        key = (self._board.zobrist_hash(), "".join(rack), "".join(other), passed)
+        entry = self._table.get(key)
+        first = None
+        if entry is not None:
+            entry_depth, entry_value, entry_bound, first = entry
+            if entry_depth >= depth:
+                if entry_bound == EXACT or (entry_bound == LOWER_BOUND and entry_value >= beta) or \
+                        (entry_bound == UPPER_BOUND and entry_value <= alpha):
+                    if entry_depth == PRUNED_DEPTH:
+                        self._pruned += 1
+                    elif entry_depth < SOLVED_DEPTH:
+                        self._horizon_hits += 1
+                    return entry_value
+
+        if depth == 0:
+            self._horizon_hits += 1
+            return self._rack_value(other) - self._rack_value(rack)
+
+        horizon_hits = self._horizon_hits
+        pruned = self._pruned
+        original_alpha = alpha
+        moves = self._moves(rack)
+        other_value = self._rack_value(other)
+        if depth == 1:
+            # The positions after the moves are at the horizon (or at the end of the game), where
+            # every move is worth its static value plus the value of the other rack, and a pass
+            # the value of both racks: the best move is the first one
+            best_value = other_value - self._rack_value(rack)
+            best_key = None
+            exact = passed  # A second pass in a row ends the game
+            if len(moves) > 0 and moves[0][0] + other_value >= best_value:
+                best_value = moves[0][0] + other_value
+                best_key = moves[0][2]
+                exact = len(moves[0][3]) == 0  # Going out ends the game
+            # The value is exact if the best option is, and either beats beta or all other options are exact too
+            if not exact or (best_value < beta and not (passed and all(len(entry[3]) == 0 for entry in moves))):
+                self._horizon_hits += 1
+        else:
+            best_value, best_key = self._search_moves(depth, alpha, beta, rack, other, passed, moves, first)
+
+        if best_value <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_value >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        if len(self._table) >= self.max_table_entries:
+            self._table.clear()
+        if self._horizon_hits > horizon_hits:
+            entry_depth = depth
+        elif self._pruned > pruned:
+            entry_depth = PRUNED_DEPTH
+        else:
+            entry_depth = SOLVED_DEPTH
+        self._table[key] = (entry_depth, best_value, bound, best_key)
+        return best_value
+
+    # Searches the moves (see _moves) of a position 'depth' > 1 plies before the horizon, the move
+    # with key 'first' first and a pass last. Returns the best value and the key of the best move
+    def _search_moves(self, depth: int, alpha: float, beta: float, rack: list, other: list, passed: bool,
+                      moves: list, first) -> tuple:
+        ordered = moves
+        if first is not None:
+            for i in range(0, len(moves)):
+                if moves[i][2] == first:
+                    ordered = [moves[i]] + moves[:i] + moves[i+1:]
+                    break
+        if self._width is not None and len(ordered) > self._width:
+            ordered = ordered[:self._width]
+            width_pruned = True
+        else:
+            width_pruned = False
+
+        best_value = -float('inf')
+        best_key = None
+        for static_value, move, move_key, new_rack in ordered + [(None, None, None, None)]:
+            if move is None:
+                if passed:
+                    # Second pass in a row, the game is over
+                    value = self._rack_value(other) - self._rack_value(rack)
+                else:
+                    value = -self._negamax(depth - 1, -beta, -alpha, other, rack, True)
+            elif len(new_rack) == 0:
+                # Going out, the other side loses the value of their rack
+                value = move.score + self._rack_value(other)
+            else:
+                record = self._board.apply(move)
+                try:
+                    # The window of the other side is shifted by the points of the move
+                    value = move.score - self._negamax(depth - 1, move.score - beta, move.score - alpha,
+                                                       other, new_rack, False)
+                finally:
+                    self._board.undo(record)
+            if value > best_value:
+                best_value = value
+                best_key = move_key
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                return best_value, best_key
+        if width_pruned:
+            self._pruned += 1
+        return best_value, best_key
+
+    # The best moves of both sides from the transposition table
+    def _principal_variation(self, rack: list, other: list, passed: bool, depth: int) -> list:
+        variation = []
+        records = []
+        for ply in range(0, depth):
+            entry = self._table.get((self._board.zobrist_hash(), "".join(rack), "".join(other), passed))
+            if entry is None:
+                break
+            best_key = entry[3]
+            if best_key is None:
+                variation.append(None)
+                if passed:
+                    break
+                rack, other, passed = other, rack, True
+                continue
+            moves = self._ordered_moves(rack, best_key)
+            if len(moves) == 0 or _move_key(moves[0]) != best_key:
+                break
+            move = moves[0]
+            variation.append(move)
+            new_rack = list(rack)
+            for letter in move.letters:
+                new_rack.remove(letter)
+            if len(new_rack) == 0:
+                break
+            records.append(self._board.apply(move))
+            rack, other, passed = other, new_rack, False
+        for record in reversed(records):
+            self._board.undo(record)
+        return variation
+
+
+def _move_key(move: ScrabbleUtils.ScrabbleMove) -> tuple:
+    return move.row, move.col, move.how, move.word, tuple(move.blank_positions)
+
+
+#
+# Mixin for ScrabbleAI bots that plays the endgame with an EndgameSolver and leaves
+# all other moves to the bot, e.g.
+#   class EndgameGreedyBot(ScrabbleEndgame.EndgameMixin, GreedyBot): pass
+# The bag is empty (and the opponent's rack is known) when there are at most 7 unseen tiles.
+# 'solutions' is passed on to the bot as is, so it works with bots that take a list of
+# moves as well as with bots that take them lazily
+#
+class EndgameMixin:
+
+    endgame_time_limit = 10.0
+
+    def start_game(self, legal_words: set, word_signatures: dict, engine: str, dawg, letter_values: dict):
+        super().start_game(legal_words, word_signatures, engine, dawg, letter_values)
+        self._endgame_solver = EndgameSolver((legal_words, word_signatures, engine, dawg), letter_values,
+                                             self.endgame_time_limit)
+
+    def make_move(self, board: ScrabbleBoard, letters: list, solutions) -> ScrabbleUtils.ScrabbleMove:
+        solver = getattr(self, '_endgame_solver', None)
+        if solver is not None:
+            unseen = ScrabbleSimulation.unseen_letters(board, letters)
+            if 0 < len(unseen) <= 7:
+                return solver.solve(board, list(letters), unseen).move
+        return super().make_move(board, letters, solutions)
@@ -0,0 +1,182 @@
+#
+# This file contains the premium square exposure map of a board position
+#
+# An empty premium square (see ScrabbleBoard.get_board_multipliers) is exposed when
+# the next player could cover it with a word, i.e. when it is at most 6 squares away
+# from an anchor (an empty square next to a tile, or the center of the empty board)
+# in its row or column: a word from the anchor to the square places at most 7 tiles.
+# The other empty premium squares are hidden. Whether a word that covers a square
+# exists for the opponent's rack is not taken into account.
+#
+# Squares are bits of a 225 bit integer (bit row * 15 + col), so maps, the premium
+# squares of some kinds (premium_mask) and the squares of a move combine with '&' and
+# '|'. A move can only expose hidden squares that are close to the new anchors next to
+# its word, and these squares only depend on where the word is, not on the position.
+# So they are tabulated once for every word placement (opening_mask), and the squares
+# a move would expose are one table lookup and one '&' with the hidden squares:
+#   ExposureMap.opened(row, col, across, length)
+# ScrabbleBoard keeps the ExposureMap of its position up to date with every move
+# (ExposureMap.after_move) and restores it on undo.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+# Number of squares from an anchor within which a square can still be covered
+REACH_DISTANCE = 6
+
+
+def square_bit(row: int, col: int) -> int:
+    return 1 << (row * 15 + col)
+
+
+# The (row, col) squares of a mask, in row order
+def squares(mask: int) -> list:
+    ret = []
+    while mask:
+        low_bit = mask & -mask
+        index = low_bit.bit_length() - 1
+        ret.append((index // 15, index % 15))
+        mask ^= low_bit
+    return ret
+
+
+# Kinds of premium squares (their codes in ScrabbleBoard.get_board_multipliers)
+DOUBLE_LETTER = 2
+TRIPLE_LETTER = 3
+DOUBLE_WORD = 4
+TRIPLE_WORD = 6
+PREMIUM_KINDS = (DOUBLE_LETTER, TRIPLE_LETTER, DOUBLE_WORD, TRIPLE_WORD)
+
+
+# Mask of the squares of the given kinds on a board with the given multipliers
+def premium_mask(multipliers: list, kinds: tuple = PREMIUM_KINDS) -> int:
+    mask = 0
+    for row in range(0, 15):
+        for col in range(0, 15):
+            if multipliers[row][col] in kinds:
+                mask |= square_bit(row, col)
+    return mask
+
+
+# Squares that a word through (row, col) can cover: up to REACH_DISTANCE squares away in its row or column
+def _reach_mask(row: int, col: int) -> int:
+    mask = 0
+    for i in range(max(0, col - REACH_DISTANCE), min(14, col + REACH_DISTANCE) + 1):
+        mask |= square_bit(row, i)
+    for i in range(max(0, row - REACH_DISTANCE), min(14, row + REACH_DISTANCE) + 1):
+        mask |= square_bit(i, col)
+    return mask
+
+
+_REACH = [[_reach_mask(row, col) for col in range(0, 15)] for row in range(0, 15)]
+
+# _opening[across][line][first][last] and _spans[across][line][first][last], built on first use
+_opening = None
+_spans = None
+
+
+def _build_tables():
+    global _opening, _spans
+    opening = [[[[0] * 15 for first in range(0, 15)] for line in range(0, 15)] for across in range(0, 2)]
+    spans = [[[[0] * 15 for first in range(0, 15)] for line in range(0, 15)] for across in range(0, 2)]
+    for across in range(0, 2):
+        # (row, col) of the square at 'position' of 'line'
+        def square(line: int, position: int) -> tuple:
+            return (line, position) if across else (position, line)
+        for line in range(0, 15):
+            for first in range(0, 15):
+                span = 0
+                reach = _REACH[square(line, first - 1)[0]][square(line, first - 1)[1]] if first > 0 else 0
+                for last in range(first, 15):
+                    span |= square_bit(*square(line, last))
+                    for side in (line - 1, line + 1):
+                        if 0 <= side < 15:
+                            row, col = square(side, last)
+                            reach |= _REACH[row][col]
+                    after = reach
+                    if last < 14:
+                        row, col = square(line, last + 1)
+                        after |= _REACH[row][col]
+                    opening[across][line][first][last] = after & ~span
+                    spans[across][line][first][last] = span
+    _opening = opening
+    _spans = spans
+
+
+#
+# Squares close to the new anchors of a word from (row, col) with 'length' letters (across
+# or down): all squares that the word can expose. The squares of the word are not included
+#
+def opening_mask(row: int, col: int, across: bool, length: int) -> int:
+    if _opening is None:
+        _build_tables()
+    if across:
+        return _opening[1][row][col][col + length - 1]
+    return _opening[0][col][row][row + length - 1]
+
+
+def span_mask(row: int, col: int, across: bool, length: int) -> int:
+    if _spans is None:
+        _build_tables()
+    if across:
+        return _spans[1][row][col][col + length - 1]
+    return _spans[0][col][row][row + length - 1]
+
+
+#
+# Exposed and hidden empty premium squares of a position (immutable, moves create new maps)
+#
+class ExposureMap:
+
+    __slots__ = ('exposed', 'hidden')
+
+    def __init__(self, exposed: int, hidden: int):
+        self.exposed = exposed
+        self.hidden = hidden
+
+    # Map of a board (15 lists of 15 letters or ' ') with the given anchors (see
+    # ScrabbleDawg.compute_anchors) and premium squares (see premium_mask)
+    @classmethod
+    def from_board(cls, board: list, anchors: list, premiums: int) -> "ExposureMap":
+        reachable = 0
+        empty = 0
+        for row in range(0, 15):
+            for col in range(0, 15):
+                if board[row][col] == ' ':
+                    empty |= square_bit(row, col)
+                if anchors[row][col]:
+                    reachable |= _REACH[row][col]
+        return cls(premiums & empty & reachable, premiums & empty & ~reachable)
+
+    # Hidden premium squares that a word from (row, col) with 'length' letters would expose
+    def opened(self, row: int, col: int, across: bool, length: int) -> int:
+        return opening_mask(row, col, across, length) & self.hidden
+
+    # Map after a word from (row, col) with 'length' letters was played
+    def after_move(self, row: int, col: int, across: bool, length: int) -> "ExposureMap":
+        covered = span_mask(row, col, across, length)
+        opened = opening_mask(row, col, across, length) & self.hidden
+        return ExposureMap((self.exposed | opened) & ~covered, self.hidden & ~opened & ~covered)
+
+    #
+    # Number of the premium squares in the mask 'premiums' that every possible word
+    # placement would expose, as a flat list: the entry of a word across from (row, col)
+    # to (row, last) is at index ((1 * 15 + row) * 15 + col) * 15 + last, and the entry of
+    # a word down from (row, col) to (last, col) at ((0 * 15 + col) * 15 + row) * 15 + last
+    #
+    def opened_counts(self, premiums: int) -> list:
+        if _opening is None:
+            _build_tables()
+        hidden = self.hidden & premiums
+        ret = [0] * (2 * 15 * 15 * 15)
+        if hidden == 0:
+            return ret
+        index = 0
+        for across in range(0, 2):
+            for line in range(0, 15):
+                for first in range(0, 15):
+                    masks = _opening[across][line][first]
+                    for last in range(first, 15):
+                        ret[index + last] = (masks[last] & hidden).bit_count()
+                    index += 15
+        return ret
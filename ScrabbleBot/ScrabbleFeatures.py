@@ -0,0 +1,95 @@
+#
+# This file contains the feature matrix of a list of moves (needs NumPy).
+#
+# Bots that rank moves by their own heuristics would otherwise loop over thousands
+# of ScrabbleMoves in Python on every turn. feature_matrix computes one row of
+# features per move of a ScrabbleUtils.MoveList straight from its packed columns,
+# with a few array operations, so that a bot can compute its penalties for all moves
+# in one vectorised expression (see RadiusBot and CarefulGreedyBot). The columns are:
+#  - SCORE: points of the move (as adjusted, if scores of the list were adjusted)
+#  - ACROSS: 1 for moves across, 0 for moves down
+#  - START_ROW, START_COL, END_ROW, END_COL: first and last square of the word
+#  - LENGTH: length of the word
+#  - TILES_USED, BLANKS_USED: tiles played from the rack, and how many of them are blanks
+#  - Q_USED, U_USED, S_USED: Qs, Us and Ss played from the rack
+#  - CENTRE_DISTANCE: mean distance of the squares of the word from the centre square
+#  - CENTROID_DISTANCE: distance of the middle of the word from the centre square
+#  - PREMIUMS_OPENED: empty premium squares that are out of the opponent's reach now and
+#    that the move would expose (see ScrabbleExposure and ScrabbleBoard.opened_premium_counts)
+# The rows are in the current order of the list.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleUtils
+
+try:
+    import numpy as np
+except ImportError:  # The feature matrix is then not available
+    np = None
+
+FEATURES = ("score", "across", "start_row", "start_col", "end_row", "end_col", "length", "tiles_used",
+            "blanks_used", "q_used", "u_used", "s_used", "centre_distance", "centroid_distance", "premiums_opened")
+
+SCORE, ACROSS, START_ROW, START_COL, END_ROW, END_COL, LENGTH, TILES_USED, BLANKS_USED, Q_USED, U_USED, S_USED, \
+    CENTRE_DISTANCE, CENTROID_DISTANCE, PREMIUMS_OPENED = range(len(FEATURES))
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The move feature matrix requires NumPy, please install it (pip install numpy)")
+
+
+#
+# Feature matrix (number of moves x len(FEATURES), float64) of the moves 'moves' on 'board'
+#
+def feature_matrix(board: ScrabbleBoard.ScrabbleBoard, moves: ScrabbleUtils.MoveList) -> "np.ndarray":
+    _require_numpy()
+    num_moves = len(moves)
+    if num_moves == 0:
+        return np.zeros((0, len(FEATURES)))
+
+    columns = moves.columns()
+    order = np.asarray(columns["order"]) if columns["order"] is not None else None
+
+    def column(name: str) -> "np.ndarray":
+        values = np.asarray(columns[name])
+        return values[order] if order is not None else values
+
+    row = column("row").astype(np.int64)
+    col = column("col").astype(np.int64)
+    across = column("across").astype(np.int64)
+    down = 1 - across
+
+    # Lengths of the words and rack strings, and letter counts of the (few different) rack strings
+    storage = columns["storage"]
+    lengths = np.fromiter(map(len, storage), dtype=np.int64, count=len(storage))
+    length = lengths[column("word")]
+    rack_strings, rack_string_index = np.unique(column("letters"), return_inverse=True)
+    letter_counts = np.array([(len(storage[i]), storage[i].count('*'), storage[i].count('Q'),
+                               storage[i].count('U'), storage[i].count('S')) for i in rack_strings],
+                             dtype=np.int64)[rack_string_index.reshape(-1)]
+
+    end_row = row + (length - 1) * down
+    end_col = col + (length - 1) * across
+
+    # Squares of the words, padded to 15 squares
+    offsets = np.arange(15)
+    in_word = offsets[None, :] < length[:, None]
+    square_rows = row[:, None] + offsets[None, :] * down[:, None]
+    square_cols = col[:, None] + offsets[None, :] * across[:, None]
+
+    # Distances are added up from the first square to the last (like a loop over the squares would)
+    distances = np.where(in_word, np.sqrt((square_cols - 7) ** 2 + (square_rows - 7) ** 2), 0.0)
+    centre_distance = np.cumsum(distances, axis=1)[np.arange(num_moves), length - 1] / length
+    centroid_distance = np.sqrt(((row + end_row) / 2 - 7) ** 2 + ((col + end_col) / 2 - 7) ** 2)
+
+    # Premium squares exposed by the word, looked up by its placement (across, line, first, last)
+    opened_counts = np.asarray(board.opened_premium_counts()).reshape(2, 15, 15, 15)
+    premiums_opened = opened_counts[across, row * across + col * down, col * across + row * down,
+                                    end_col * across + end_row * down]
+
+    return np.column_stack((column("score"), across, row, col, end_row, end_col, length, letter_counts[:, 0],
+                            letter_counts[:, 1], letter_counts[:, 2], letter_counts[:, 3], letter_counts[:, 4],
+                            centre_distance, centroid_distance, premiums_opened)).astype(np.float64)
@@ -12,9 +12,16 @@ __author__ = 'Sebastian Wernicke'
 
 from ScrabbleBot import ScrabbleUtils
 from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleBitboard
 from ScrabbleBot import ScrabbleAI
+from ScrabbleBot import ScrabbleDawg
+from ScrabbleBot import ScrabbleMoves
+from ScrabbleBot import ScrabbleZobrist
+from ScrabbleBot import ScrabbleStats
+from ScrabbleBot import ScrabbleTelemetry
 
-from random import shuffle
+import random
+from time import perf_counter
 
 
 #
@@ -45,13 +52,15 @@ def get_letter_values() -> dict:
 
 
 #
-# Class to draw random tiles from until they are out
+# Class to draw random tiles from until they are out. The tiles are shuffled with
+# 'rng' (a random.Random), or with the random module if none is given
 #
 class LetterSet:
 
-    def __init__(self):
+    def __init__(self, rng: random.Random = None):
+        self._rng = rng if rng is not None else random
         self._remaining_letters = get_letter_pieces()
-        shuffle(self._remaining_letters)
+        self._rng.shuffle(self._remaining_letters)
 
     def draw(self, num_letters: int) -> list:
         count = 0
@@ -61,6 +70,10 @@ class LetterSet:
             count += 1
         return ret
 
+    # Put back letters from draw(), so that they are drawn again in the same order
+    def put_back(self, letters: list):
+        self._remaining_letters.extend(reversed(letters))
+
     def empty(self) -> bool:
         return len(self._remaining_letters) == 0
 
@@ -71,16 +84,65 @@ class LetterSet:
         while len(self._remaining_letters) > 0 and len(ret) < len(old_letters):
             ret.append(self._remaining_letters.pop())
         self._remaining_letters.append(old_letters)
-        shuffle(self._remaining_letters)
+        self._rng.shuffle(self._remaining_letters)
         return ret
 
 
+#
+# Everything ScrabbleGame.undo_move needs to take back a move
+#
+class GameUndo:
+
+    __slots__ = ('player', 'rack', 'scores', 'rounds_without_move', 'game_finished', 'move_score', 'drawn', 'board')
+
+    def __init__(self):
+        self.player = 0
+        self.rack = []
+        self.scores = []
+        self.rounds_without_move = 0
+        self.game_finished = False
+        self.move_score = 0
+        self.drawn = []
+        self.board = None  # ScrabbleBoard.BoardUndo of the move (None for a pass)
+
+
 class ScrabbleGame:
 
-    def __init__(self, players: list, legal_words: set, word_signatures: dict):
-        self._board = ScrabbleBoard.ScrabbleBoard()
+    # 'move_cache' is an optional ScrabbleZobrist.MoveListCache, which can be shared
+    # between games (with the same lexicon) to reuse move lists of positions seen before.
+    # 'stats' is an optional ScrabbleStats.EngineStats, in which the move generation of
+    # all turns is timed and counted (see ScrabbleStats).
+    # 'telemetry' is an optional ScrabbleTelemetry.GameTelemetry, which records the move
+    # generation time, make_move time and number of solutions of every turn (for bots
+    # with lazy moves, the moves are generated and counted during make_move).
+    # 'board_type' selects the board the game is played on:
+    #  - "lists": ScrabbleBoard, nested lists of letters
+    #  - "arrays": ScrabbleBitboard.ArrayScrabbleBoard, which also keeps NumPy arrays and
+    #    occupancy bitmasks, from which it computes anchors and placements (needs NumPy)
+    #  - "batch": the same, and the "signatures" engine scores the candidate words of all
+    #    placements of a rack in one batch (see ScrabbleScoring)
+    # 'rng' is the random.Random that shuffles the tiles and that the players make their
+    # random choices with (see ScrabbleAI), by default the random module
+    def __init__(self, players: list, legal_words: set, word_signatures: dict,
+                 engine: str = "signatures", dawg: ScrabbleDawg.ScrabbleDawg = None,
+                 move_cache: ScrabbleZobrist.MoveListCache = None, stats: ScrabbleStats.EngineStats = None,
+                 telemetry: ScrabbleTelemetry.GameTelemetry = None, board_type: str = "lists",
+                 rng: random.Random = None):
+        if board_type == "lists":
+            self._board = ScrabbleBoard.ScrabbleBoard()
+        elif board_type == "arrays":
+            self._board = ScrabbleBitboard.ArrayScrabbleBoard()
+        elif board_type == "batch":
+            self._board = ScrabbleBitboard.ArrayScrabbleBoard(batch_scoring=True)
+        else:
+            raise ValueError("Unknown board type '" + board_type + "'")
         self._legal_words = legal_words
         self._word_signatures = word_signatures
+        self._engine = engine
+        self._dawg = dawg
+        self._move_cache = move_cache
+        self._stats = stats
+        self._telemetry = telemetry
         self._players = []
         self._move_history = []
         self._scores = []
@@ -88,7 +150,8 @@ class ScrabbleGame:
         self._current_player = 0
         self._letter_values = get_letter_values()
         self._game_finished = False
-        self._letter_bag = LetterSet()
+        self._rng = rng if rng is not None else random
+        self._letter_bag = LetterSet(self._rng)
         self._numplayers = len(players)
         self._rounds_without_move = 0
         if self._numplayers > 4:
@@ -99,6 +162,9 @@ class ScrabbleGame:
             self._players.append(p)
             self._scores.append(0)
             self._player_letters.append(self._letter_bag.draw(7))
+        for p in self._players:
+            p.rng = self._rng
+            p.start_game(legal_words, word_signatures, engine, dawg, self._letter_values)
 
     def game_started(self) -> bool:
         return len(self._move_history) > 0
@@ -106,6 +172,14 @@ class ScrabbleGame:
     def game_finished(self) -> bool:
         return self._game_finished
 
+    # Move generator stats of the game so far (None if the game was created without them)
+    def engine_stats(self) -> ScrabbleStats.EngineStats:
+        return self._stats
+
+    # Telemetry of the game so far (None if the game was created without it)
+    def telemetry(self) -> ScrabbleTelemetry.GameTelemetry:
+        return self._telemetry
+
     def finish_game(self):
         self._game_finished = True
         # Subtract penalties for leftover letters
@@ -119,74 +193,118 @@ class ScrabbleGame:
             print("\nNext turn: Player " + str(self._current_player)
                   + " ('" + self._players[self._current_player].name + "')")
 
-        # As a service to the AI, we pre-calculate the legal moves
+        # As a service to the AI, we pre-calculate the legal moves (or, if the AI
+        # wants them lazily, hand it a provider that generates them on request)
         current_letters = "".join(self._player_letters[self._current_player])
-        solutions = self._board.possible_moves(current_letters, self._letter_values,
-                                               self._legal_words, self._word_signatures)
+        start_time = perf_counter() if self._telemetry is not None else None
+        provider = ScrabbleMoves.MoveProvider(self._board, current_letters, self._letter_values,
+                                              self._legal_words, self._word_signatures,
+                                              self._engine, self._dawg, self._move_cache, self._stats)
+        solutions = provider if self._players[self._current_player].lazy_moves else provider.all()
 
         # Let the player tell us what they want to play
-        next_move = self._players[self._current_player].make_move(self._board, current_letters, solutions)
+        if self._telemetry is not None:
+            generated_time = perf_counter()
+            next_move = self._players[self._current_player].make_move(self._board, current_letters, solutions)
+            self._telemetry.add_turn(self._players[self._current_player].name, generated_time - start_time,
+                                     perf_counter() - generated_time, provider.num_generated)
+        else:
+            next_move = self._players[self._current_player].make_move(self._board, current_letters, solutions)
+
+        # Play the move (or pass)
+        player = self._current_player
+        record = self.apply_move(next_move)
 
-        # Play the move (if it's possible)
         if next_move is not None:
+            if verbosity >= 1:
+                ScrabbleUtils.print_move(next_move)
+
+            if verbosity > 0:
+                # Scores right after the move (before any end of game penalties)
+                new_scores = list(record.scores)
+                new_scores[player] += record.move_score
+                print("New scores:", end="")
+                for i in range(0, len(new_scores)):
+                    print(" " + self._players[i].name + ":" + str(new_scores[i]), end="")
+                    if i == player:
+                        print("(+" + str(record.move_score) + ")", end="")
+                print("")
+
+            if verbosity >= 2:
+                    self._board.print()
+        else:
+            if verbosity > 0:
+                print("Doesn't play anything this move")
+
+    # Play a move for the current player (None passes), without asking the player.
+    # Returns a record with which undo_move() restores the game state from before
+    # the move: board, racks, letter bag, scores and whose turn it is.
+    # This allows search to explore moves on one game instead of copying it
+    def apply_move(self, move: ScrabbleUtils.ScrabbleMove) -> GameUndo:
+        record = GameUndo()
+        record.player = self._current_player
+        record.rack = list(self._player_letters[self._current_player])
+        record.scores = list(self._scores)
+        record.rounds_without_move = self._rounds_without_move
+        record.game_finished = self._game_finished
+
+        if move is not None:
 
             #TODO: Implement possibility for bots to trigger a letter exchange
 
             # Score the move (implicitly checks whether it's legal, too)
-            move_score = self._board.check_legal_and_score_move(next_move, self._letter_values, self._legal_words)
+            move_score = self._board.check_legal_and_score_move(move, self._letter_values, self._legal_words)
 
             if move_score == -1:
                 ValueError("Illegal move detected!")
 
             self._scores[self._current_player] += move_score
+            record.move_score = move_score
 
             # Play the move
-            self._board.execute_move(next_move)
-            if verbosity >= 1:
-                ScrabbleUtils.print_move(next_move)
-
-            if verbosity > 0:
-                print("New scores:", end="")
-                for i in range(0, len(self._scores)):
-                    print(" " + self._players[i].name + ":" + str(self._scores[i]), end="")
-                    if i == self._current_player:
-                        print("(+" + str(move_score) + ")", end="")
-                print("")
-
-            if verbosity >= 2:
-                    self._board.print()
+            record.board = self._board.apply(move)
 
             # Remove old letters and draw new letters
             current_letterset = self._player_letters[self._current_player]
-            #print(current_letterset)
-            num_letters = len(next_move.letters)
-            for char in next_move.letters:
+            num_letters = len(move.letters)
+            for char in move.letters:
                 current_letterset.remove(char)
-                #print(current_letterset)
-            current_letterset.extend(self._letter_bag.draw(num_letters))
-            #print(current_letterset)
+            record.drawn = self._letter_bag.draw(num_letters)
+            current_letterset.extend(record.drawn)
             self._rounds_without_move = 0
         else:
-            if verbosity > 0:
-                print("Doesn't play anything this move")
             self._rounds_without_move += 1
 
         # Game ends when there are no moves left for anyone
         if self._rounds_without_move == self._numplayers:
             self.finish_game()
-            return
+            return record
 
         # Game ends when all letters have been drawn and someone uses last letter
         if self._letter_bag.empty() and len(self._player_letters[self._current_player]) == 0:
             self.finish_game()
-            return
+            return record
 
         # Switch to next player
         self._current_player = (self._current_player + 1) % self._numplayers
+        return record
+
+    # Take back a move of apply_move(). Records must be undone in reverse order
+    def undo_move(self, record: GameUndo):
+        if record.board is not None:
+            self._board.undo(record.board)
+        self._letter_bag.put_back(record.drawn)
+        self._player_letters[record.player][:] = record.rack
+        self._scores[:] = record.scores
+        self._rounds_without_move = record.rounds_without_move
+        self._game_finished = record.game_finished
+        self._current_player = record.player
 
     def play_until_finished(self, verbosity: int) -> list:
         while not self.game_finished():
             self.play_one_move(verbosity)
+        if self._telemetry is not None:
+            self._telemetry.finish()
         if verbosity >= 1:
             print("Final scores: " + str(self._scores))
         return self._scores
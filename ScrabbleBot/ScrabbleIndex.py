@@ -0,0 +1,390 @@
+#
+# This file contains a compiled, on-disk version of the word signature
+# dictionary that ScrabbleUtils.build_word_signatures creates.
+#
+# Building the signatures for two blanks takes a long time and a lot of
+# memory, so the index is written to a binary file once and afterwards only
+# memory-mapped. Lookups go straight to the mapped file through a hash
+# table, nothing is unpickled into a Python dictionary.
+#
+# Alternatively, BlankExpandingSignatures keeps only the blank-free
+# signatures in memory and resolves blanks when a key is looked up.
+#
+# The file remembers a checksum of the lexicon and the number of blanks it
+# was built for. If either does not match, the file is rebuilt automatically.
+#
+# File layout (all integers are unsigned 32 bit little endian, sections are
+# 4-byte aligned):
+#   header          magic, version, counts, blob sizes, lexicon checksum
+#   word_offsets    num_words + 1 offsets into the word blob
+#   key_offsets     num_keys + 1 offsets into the key blob
+#   posting_offsets num_keys + 1 offsets into the postings
+#   postings        word numbers for each key
+#   table           open addressing hash table (0 = empty, else key number + 1)
+#   word blob       all words, concatenated
+#   key blob        all signatures, concatenated
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleUtils
+
+from array import array
+from hashlib import sha256
+from math import comb
+from zlib import crc32
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'SBSIGIDX'
+VERSION = 2
+HEADER = struct.Struct('<8sIIIIIQQQ32s')
+
+
+#
+# Checksum of a set of legal words (independent of the order and formatting of the source file)
+#
+def lexicon_checksum(legal_words) -> bytes:
+    return sha256("\n".join(sorted(legal_words)).encode('ascii')).digest()
+
+
+#
+# Default location of the compiled index for a dictionary file
+#
+def default_index_file(dictionary_file: str, num_blanks: int) -> str:
+    return dictionary_file + ".sig" + str(num_blanks)
+
+
+def _padding(length: int) -> bytes:
+    return b'\0' * (-length % 4)
+
+
+def _uint32_array(values) -> array:
+    ret = array('I', values)
+    if sys.byteorder != 'little':
+        ret.byteswap()
+    return ret
+
+
+#
+# Build an open addressing hash table (load factor at most 1/2) for a list of keys.
+# Slots hold the key number + 1, or 0 if they are empty
+#
+def build_key_table(keys: list) -> tuple:
+    table_size = 1
+    while table_size < 2 * len(keys):
+        table_size *= 2
+    mask = table_size - 1
+    table = array('I', bytes(4 * table_size))
+    for i, key in enumerate(keys):
+        slot = crc32(key.encode('ascii')) & mask
+        while table[slot] != 0:
+            slot = (slot + 1) & mask
+        table[slot] = i + 1
+    return table, mask
+
+
+#
+# Look up a key in a table from build_key_table, given the concatenated keys and
+# their offsets. Returns the key number, or -1 if the key is not present
+#
+def find_key(key: str, table, mask: int, key_offsets, key_blob) -> int:
+    key_bytes = key.encode('ascii')
+    slot = crc32(key_bytes) & mask
+    while True:
+        entry = table[slot]
+        if entry == 0:
+            return -1
+        if key_blob[key_offsets[entry-1]:key_offsets[entry]] == key_bytes:
+            return entry - 1
+        slot = (slot + 1) & mask
+
+
+#
+# Compile the word signatures of 'legal_words' with up to 'num_blanks' blanks into 'filename'
+#
+def build_signature_index(legal_words, num_blanks: int, filename: str):
+
+    word_signatures = ScrabbleUtils.build_word_signatures(legal_words, num_blanks)
+
+    print("Writing word signature index '" + filename + "'")
+
+    words = sorted(legal_words)
+    word_numbers = dict((word, i) for i, word in enumerate(words))
+    word_blob = "".join(words).encode('ascii')
+    word_offsets = [0]
+    for word in words:
+        word_offsets.append(word_offsets[-1] + len(word))
+
+    keys = list(word_signatures.keys())
+    key_blob = "".join(keys).encode('ascii')
+    key_offsets = [0]
+    posting_offsets = [0]
+    postings = array('I')
+    for key in keys:
+        key_offsets.append(key_offsets[-1] + len(key))
+        postings.extend(word_numbers[word] for word in word_signatures[key])
+        posting_offsets.append(len(postings))
+
+    table, mask = build_key_table(keys)
+
+    if sys.byteorder != 'little':
+        postings.byteswap()
+        table.byteswap()
+
+    # Write to a temporary file first, so that concurrent readers never see a half-written index
+    tmp_filename = filename + ".tmp" + str(os.getpid())
+    with open(tmp_filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, num_blanks, len(words), len(keys), len(table),
+                            len(word_blob), len(key_blob), len(postings), lexicon_checksum(legal_words)))
+        f.write(_padding(HEADER.size))
+        f.write(_uint32_array(word_offsets).tobytes())
+        f.write(_uint32_array(key_offsets).tobytes())
+        f.write(_uint32_array(posting_offsets).tobytes())
+        f.write(postings.tobytes())
+        f.write(table.tobytes())
+        f.write(word_blob)
+        f.write(_padding(len(word_blob)))
+        f.write(key_blob)
+    os.replace(tmp_filename, filename)
+
+
+#
+# Read-only view of a compiled signature index. Behaves like the dictionary
+# returned by ScrabbleUtils.build_word_signatures as far as find_all_moves
+# is concerned ('in', indexing, get)
+#
+class SignatureIndex:
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._file = open(filename, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, num_blanks, num_words, num_keys, table_size, word_blob_size, key_blob_size, \
+            num_postings, checksum = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            view.release()
+            self.close()
+            raise ValueError("'" + filename + "' is not a word signature index of version " + str(VERSION))
+        self.num_blanks = num_blanks
+        self.checksum = checksum
+        self._num_keys = num_keys
+        self._mask = table_size - 1
+
+        offset = HEADER.size + len(_padding(HEADER.size))
+
+        def section(length: int):
+            nonlocal offset
+            ret = view[offset:offset + length]
+            offset += length + len(_padding(length))
+            return ret
+
+        self._word_offsets = section(4 * (num_words + 1)).cast('I')
+        self._key_offsets = section(4 * (num_keys + 1)).cast('I')
+        self._posting_offsets = section(4 * (num_keys + 1)).cast('I')
+        self._postings = section(4 * num_postings).cast('I')
+        self._table = section(4 * table_size).cast('I')
+        self._word_blob = section(word_blob_size)
+        self._key_blob = section(key_blob_size)
+        view.release()
+
+    # Returns the key number of a signature, or -1 if it is not in the index
+    def _find(self, key: str) -> int:
+        return find_key(key, self._table, self._mask, self._key_offsets, self._key_blob)
+
+    def get(self, key: str, default=None):
+        i = self._find(key)
+        if i == -1:
+            return default
+        word_offsets = self._word_offsets
+        word_blob = self._word_blob
+        ret = []
+        for word_number in self._postings[self._posting_offsets[i]:self._posting_offsets[i+1]]:
+            ret.append(str(word_blob[word_offsets[word_number]:word_offsets[word_number+1]], 'ascii'))
+        return ret
+
+    def __getitem__(self, key: str) -> list:
+        ret = self.get(key)
+        if ret is None:
+            raise KeyError(key)
+        return ret
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) != -1
+
+    def __len__(self) -> int:
+        return self._num_keys
+
+    def keys(self):
+        return self
+
+    def close(self):
+        for name in ('_word_offsets', '_key_offsets', '_posting_offsets', '_postings',
+                     '_table', '_word_blob', '_key_blob'):
+            if hasattr(self, name):
+                getattr(self, name).release()
+        self._mmap.close()
+        self._file.close()
+
+    # Worker processes re-open the mapping instead of copying the data
+    def __getstate__(self):
+        return self._filename
+
+    def __setstate__(self, filename: str):
+        self.__init__(filename)
+
+
+#
+# Open the compiled signature index in 'filename', rebuilding it first if it
+# is missing or was built for a different lexicon or number of blanks
+#
+def load_signature_index(filename: str, legal_words, num_blanks: int) -> SignatureIndex:
+    checksum = lexicon_checksum(legal_words)
+    if os.path.exists(filename):
+        try:
+            index = SignatureIndex(filename)
+            if index.checksum == checksum and index.num_blanks == num_blanks:
+                print("Using word signature index '" + filename + "'")
+                return index
+            index.close()
+            print("Word signature index '" + filename + "' is stale")
+        except (ValueError, TypeError, struct.error):
+            print("Word signature index '" + filename + "' is unreadable")
+    build_signature_index(legal_words, num_blanks, filename)
+    return SignatureIndex(filename)
+
+
+#
+# Letter-count index over a list of signatures (sorted letter sequences).
+# For every signature length and every (letter, count) pair it keeps a bitset
+# of the signatures of that length that contain the letter at least that often.
+# All signatures of a given length that contain a set of letters are found by
+# intersecting a handful of bitsets
+#
+class LetterCountIndex:
+
+    def __init__(self, signatures: list):
+        self._numbers = dict()  # Length -> signature numbers, bit i stands for self._numbers[length][i]
+        self._all = dict()
+        self._bits = dict()
+        members = dict()
+        for number, signature in enumerate(signatures):
+            length = len(signature)
+            if length not in self._numbers:
+                self._numbers[length] = []
+                members[length] = dict()
+            bit = len(self._numbers[length])
+            self._numbers[length].append(number)
+            count = 0
+            for i in range(0, length):
+                count = count + 1 if i > 0 and signature[i] == signature[i-1] else 1
+                members[length].setdefault((signature[i], count), []).append(bit)
+
+        for length, numbers in self._numbers.items():
+            self._all[length] = (1 << len(numbers)) - 1
+            self._bits[length] = dict()
+            for letter_count, bit_list in members[length].items():
+                bits = bytearray((len(numbers) + 7) // 8)
+                for bit in bit_list:
+                    bits[bit >> 3] |= 1 << (bit & 7)
+                self._bits[length][letter_count] = int.from_bytes(bits, 'little')
+
+    # Numbers of all signatures with 'length' letters that contain the (sorted) 'letters'
+    def supersets(self, letters: str, length: int) -> list:
+        bits = self._all.get(length, 0)
+        if bits == 0:
+            return []
+        letter_bits = self._bits[length]
+        count = 0
+        for i in range(0, len(letters)):
+            count = count + 1 if i > 0 and letters[i] == letters[i-1] else 1
+            if i + 1 < len(letters) and letters[i+1] == letters[i]:
+                continue
+            bits &= letter_bits.get((letters[i], count), 0)
+            if bits == 0:
+                return []
+        numbers = self._numbers[length]
+        ret = []
+        while bits:
+            lowest = bits & -bits
+            bits ^= lowest
+            ret.append(numbers[lowest.bit_length() - 1])
+        return ret
+
+    def memory_footprint(self) -> int:
+        return sum(sys.getsizeof(bits) for length_bits in self._bits.values() for bits in length_bits.values()) + \
+            sum(sys.getsizeof(numbers) + 28 * len(numbers) for numbers in self._numbers.values())
+
+
+#
+# Number of times build_word_signatures lists a word with signature 'signature' under the
+# key made of the (sorted) 'letters' plus blanks: once for every way of choosing which
+# letters of the word the blanks replace
+#
+def blank_repetitions(signature: str, letters: str) -> int:
+    blank_letters = list(signature)
+    for char in letters:
+        blank_letters.remove(char)
+    repetitions = 1
+    for char in set(blank_letters):
+        repetitions *= comb(signature.count(char), blank_letters.count(char))
+    return repetitions
+
+
+#
+# Signature lookup that only stores the blank-free signatures and resolves
+# blanks at query time.
+#
+# A key like "**ABC" is answered by asking the letter-count index for all
+# signatures of length 5 that contain "ABC"; each of them has exactly two
+# letters more, which the blanks stand for.
+#
+# The returned word lists are the same as those of build_word_signatures,
+# including the repetitions it produces when a blank can replace either of
+# two equal letters of a word
+#
+class BlankExpandingSignatures:
+
+    def __init__(self, legal_words):
+        print("Building blank-free word signatures with letter-count index")
+        self._full = dict()
+        for word in sorted(legal_words):
+            sorted_word = ''.join(sorted(word))
+            if sorted_word in self._full:
+                self._full[sorted_word].append(word)
+            else:
+                self._full[sorted_word] = [word]
+        self._signatures = list(self._full.keys())
+        self._letter_counts = LetterCountIndex(self._signatures)
+
+    def get(self, key: str, default=None):
+        # Keys without blanks are a plain lookup ('*' sorts before all letters)
+        if not key.startswith('*'):
+            return self._full.get(key, default)
+
+        letters = key.lstrip('*')
+        ret = []
+        for number in self._letter_counts.supersets(letters, len(key)):
+            sorted_word = self._signatures[number]
+            repetitions = blank_repetitions(sorted_word, letters)
+            for word in self._full[sorted_word]:
+                ret.extend([word] * repetitions)
+        if len(ret) == 0:
+            return default
+        return ret
+
+    def __getitem__(self, key: str) -> list:
+        ret = self.get(key)
+        if ret is None:
+            raise KeyError(key)
+        return ret
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def keys(self):
+        return self
@@ -0,0 +1,229 @@
+#
+# This file contains the leave table: the equity of the tiles a player keeps on
+# the rack after a move (the leave)
+#
+# The equity of a leave is how many points more (or fewer) than average the player
+# scores with the next move when keeping these tiles, as measured in self-play (see
+# ScrabbleLeaveTrainer.py, which plays the games and writes the table). "ERS*" is
+# worth several points, "QVV" costs several. Bots add it to the score of a move to
+# rank moves by score + leave (see EquityBot).
+#
+# Every leave of up to MAX_LEAVE_LENGTH tiles has a fixed slot in the table: a leave
+# is a multiset of the 27 symbols ALPHABET (blanks are '*'), and the multisets of
+# one size are numbered by the combinatorial number system. So a lookup is a few
+# additions for the sorted leave string, no hashing or searching. All 1,107,568
+# slots (including leaves that the tile distribution does not allow) take 2.2 MB.
+#
+# File layout (little endian):
+#   header  magic, version, max leave length, scale, number of slots, number of
+#           self-play turns the table was computed from
+#   values  one signed 16 bit equity per slot, in 1/scale points
+# The file is memory-mapped, so loading takes no time and the worker processes of
+# a match share the same pages.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from array import array
+from itertools import combinations_with_replacement
+from math import comb
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'SBLEAVES'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIIQ')
+
+ALPHABET = "*ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+MAX_LEAVE_LENGTH = 6
+SCALE = 100
+
+_CODES = dict((symbol, code) for code, symbol in enumerate(ALPHABET))
+
+# _OFFSETS[k]: first slot of the leaves with k tiles, _RANK_TERMS[i][code]: term of the
+# symbol with 'code' at position i of a sorted leave in the number of the leave
+_OFFSETS = [comb(len(ALPHABET) - 1 + k, k - 1) if k > 0 else 0 for k in range(0, MAX_LEAVE_LENGTH + 2)]
+_RANK_TERMS = [[comb(code + i, i + 1) for code in range(0, len(ALPHABET))] for i in range(0, MAX_LEAVE_LENGTH)]
+NUM_LEAVES = _OFFSETS[MAX_LEAVE_LENGTH + 1]
+
+
+#
+# Default location of the leave table for a dictionary file
+#
+def default_table_file(dictionary_file: str) -> str:
+    return dictionary_file + ".leaves"
+
+
+#
+# The leave of a move: the tiles of the rack 'letters' that are not in 'played', sorted
+#
+def leave_of(letters: str, played: str) -> str:
+    leave = list(letters)
+    for char in played:
+        leave.remove(char)
+    return "".join(sorted(leave))
+
+
+#
+# Slot of a sorted leave in the table
+#
+def leave_index(leave: str) -> int:
+    ret = _OFFSETS[len(leave)]
+    for i in range(0, len(leave)):
+        ret += _RANK_TERMS[i][_CODES[leave[i]]]
+    return ret
+
+
+#
+# All leaves of up to MAX_LEAVE_LENGTH tiles, in no particular order
+#
+def all_leaves():
+    for length in range(0, MAX_LEAVE_LENGTH + 1):
+        for leave in combinations_with_replacement(ALPHABET, length):
+            yield "".join(leave)
+
+
+#
+# Future scores of leaves, added up over self-play turns
+#
+class LeaveStats:
+
+    def __init__(self):
+        self.leaves = dict()  # Sorted leave -> [sum of next move scores, number of turns]
+        self.num_turns = 0
+        self.total_score = 0
+
+    # A turn that kept 'leave', after which the player scored 'next_score' with the next move
+    def add(self, leave: str, next_score: int):
+        entry = self.leaves.get(leave)
+        if entry is None:
+            self.leaves[leave] = [next_score, 1]
+        else:
+            entry[0] += next_score
+            entry[1] += 1
+        self.num_turns += 1
+        self.total_score += next_score
+
+    def merge(self, other: "LeaveStats"):
+        for leave, (score, count) in other.leaves.items():
+            entry = self.leaves.get(leave)
+            if entry is None:
+                self.leaves[leave] = [score, count]
+            else:
+                entry[0] += score
+                entry[1] += count
+        self.num_turns += other.num_turns
+        self.total_score += other.total_score
+
+    def mean_score(self) -> float:
+        return self.total_score / self.num_turns if self.num_turns > 0 else 0.0
+
+    #
+    # Value of every single tile: the average excess score (over the mean) of the turns
+    # that kept it, with the excess of a turn shared equally by the tiles of its leave
+    #
+    def tile_values(self) -> dict:
+        mean = self.mean_score()
+        sums = dict((symbol, 0.0) for symbol in ALPHABET)
+        counts = dict((symbol, 0) for symbol in ALPHABET)
+        for leave, (score, count) in self.leaves.items():
+            if len(leave) == 0:
+                continue
+            excess = (score - count * mean) / len(leave)
+            for char in leave:
+                sums[char] += excess
+                counts[char] += count
+        return dict((symbol, sums[symbol] / counts[symbol] if counts[symbol] > 0 else 0.0) for symbol in ALPHABET)
+
+    #
+    # Equity of every leave, in the order of the table slots. The average excess score
+    # of a leave is shrunk towards the sum of its tile values, with the weight of
+    # 'smoothing' turns, so that rare leaves get sensible values and unseen leaves
+    # get the sum of their tile values
+    #
+    def equities(self, smoothing: float = 25.0) -> array:
+        mean = self.mean_score()
+        tile_values = self.tile_values()
+        ret = array('d', bytes(8 * NUM_LEAVES))
+        for leave in all_leaves():
+            prior = sum(tile_values[char] for char in leave)
+            score, count = self.leaves.get(leave, (0, 0))
+            ret[leave_index(leave)] = (score - count * mean + smoothing * prior) / (count + smoothing)
+        return ret
+
+
+#
+# Write the equities of all leaves (see LeaveStats.equities) to 'filename'
+#
+def write_leave_table(filename: str, equities, num_turns: int):
+    values = array('h', (max(-32768, min(32767, round(equity * SCALE))) for equity in equities))
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    # Write to a temporary file first, so that concurrent readers never see a half-written table
+    tmp_filename = filename + ".tmp" + str(os.getpid())
+    with open(tmp_filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, MAX_LEAVE_LENGTH, SCALE, len(values), num_turns))
+        f.write(values.tobytes())
+    os.replace(tmp_filename, filename)
+
+
+#
+# Read-only view of a leave table file
+#
+class LeaveTable:
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._file = open(filename, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, max_leave_length, scale, num_leaves, num_turns = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION or max_leave_length != MAX_LEAVE_LENGTH or num_leaves != NUM_LEAVES:
+            view.release()
+            self.close()
+            raise ValueError("'" + filename + "' is not a leave table of version " + str(VERSION))
+        self.num_turns = num_turns
+        self._scale = scale
+        self._values = view[HEADER.size:HEADER.size + 2 * num_leaves].cast('h')
+        view.release()
+
+    # Equity of a sorted leave of up to MAX_LEAVE_LENGTH tiles, in points
+    def value(self, leave: str) -> float:
+        return self._values[leave_index(leave)] / self._scale
+
+    def __len__(self) -> int:
+        return NUM_LEAVES
+
+    def close(self):
+        if hasattr(self, '_values'):
+            self._values.release()
+        self._mmap.close()
+        self._file.close()
+
+    # Worker processes re-open the mapping instead of copying the data
+    def __getstate__(self):
+        return self._filename
+
+    def __setstate__(self, filename: str):
+        self.__init__(filename)
+
+
+# Tables opened in this process, by file name
+_tables = dict()
+
+
+#
+# Open the leave table in 'filename' (once per process, bots share the table)
+#
+def load_leave_table(filename: str) -> LeaveTable:
+    table = _tables.get(filename)
+    if table is None:
+        if not os.path.exists(filename):
+            raise FileNotFoundError("Leave table '" + filename + "' not found, build it with ScrabbleLeaveTrainer.py")
+        table = LeaveTable(filename)
+        _tables[filename] = table
+    return table
@@ -0,0 +1,139 @@
+#
+# This file defines a compact, array-backed lexicon.
+#
+# A CompactLexicon replaces both the set of legal words (from
+# ScrabbleUtils.load_word_set) and the word signature dictionary (from
+# ScrabbleUtils.build_word_signatures), so the same object can be passed
+# wherever 'legal_words' and 'word_signatures' are expected:
+#  - All words are stored once, in one contiguous buffer, grouped by signature
+#  - Membership ('word in lexicon') is a lookup in a hash table of word numbers
+#    on top of that buffer (like the signature table of ScrabbleIndex)
+#  - Signature lookups ('lexicon.get(key)') go through packed arrays as well: every
+#    signature maps to a range of word numbers. Keys with blanks are resolved
+#    with a letter-count index instead of storing every blank signature
+#
+# The lexicon also has len() and can be iterated (in the order of the buffer)
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleIndex
+
+from array import array
+from zlib import crc32
+import sys
+
+
+class CompactLexicon:
+
+    def __init__(self, legal_words):
+        legal_words = set(legal_words)
+        print("Building compact lexicon for " + str(len(legal_words)) + " words")
+        signature_words = dict()
+        for word in legal_words:
+            sorted_word = ''.join(sorted(word))
+            if sorted_word in signature_words:
+                signature_words[sorted_word].append(word)
+            else:
+                signature_words[sorted_word] = [word]
+        signatures = sorted(signature_words.keys())
+
+        # Words, grouped by signature, in one buffer
+        words = []
+        self._signature_words = array('I', [0])  # Signature i owns word numbers [s[i], s[i+1])
+        for sorted_word in signatures:
+            words.extend(sorted(signature_words[sorted_word]))
+            self._signature_words.append(len(words))
+        self._word_blob = "".join(words).encode('ascii')
+        self._word_offsets = array('I', [0])
+        for word in words:
+            self._word_offsets.append(self._word_offsets[-1] + len(word))
+        self._word_table, self._word_mask = ScrabbleIndex.build_key_table(words)
+
+        # Signatures in one buffer, with a hash table on top
+        self._signature_blob = "".join(signatures).encode('ascii')
+        self._signature_offsets = array('I', [0])
+        for sorted_word in signatures:
+            self._signature_offsets.append(self._signature_offsets[-1] + len(sorted_word))
+        self._table, self._mask = ScrabbleIndex.build_key_table(signatures)
+
+        self._letter_counts = ScrabbleIndex.LetterCountIndex(signatures)
+
+    # Same as ScrabbleIndex.find_key(word, ...) != -1, inlined as this is called for every candidate word
+    def __contains__(self, word) -> bool:
+        if not isinstance(word, str) or not word.isascii():
+            return False
+        word_bytes = word.encode('ascii')
+        table = self._word_table
+        mask = self._word_mask
+        slot = crc32(word_bytes) & mask
+        entry = table[slot]
+        while entry != 0:
+            if self._word_blob[self._word_offsets[entry-1]:self._word_offsets[entry]] == word_bytes:
+                return True
+            slot = (slot + 1) & mask
+            entry = table[slot]
+        return False
+
+    def __len__(self) -> int:
+        return len(self._word_offsets) - 1
+
+    def __iter__(self):
+        word_offsets = self._word_offsets
+        word_blob = self._word_blob
+        for i in range(0, len(word_offsets) - 1):
+            yield str(word_blob[word_offsets[i]:word_offsets[i+1]], 'ascii')
+
+    def _words(self, number: int) -> list:
+        word_offsets = self._word_offsets
+        word_blob = self._word_blob
+        return [str(word_blob[word_offsets[i]:word_offsets[i+1]], 'ascii')
+                for i in range(self._signature_words[number], self._signature_words[number+1])]
+
+    # Word signature lookup, returns the same word lists as build_word_signatures
+    # (for keys with blanks, see ScrabbleIndex.BlankExpandingSignatures)
+    def get(self, key: str, default=None):
+        if not key.startswith('*'):
+            number = ScrabbleIndex.find_key(key, self._table, self._mask,
+                                            self._signature_offsets, self._signature_blob)
+            if number == -1:
+                return default
+            return self._words(number)
+
+        letters = key.lstrip('*')
+        ret = []
+        for number in self._letter_counts.supersets(letters, len(key)):
+            sorted_word = str(self._signature_blob[self._signature_offsets[number]:
+                                                   self._signature_offsets[number+1]], 'ascii')
+            repetitions = ScrabbleIndex.blank_repetitions(sorted_word, letters)
+            for word in self._words(number):
+                ret.extend([word] * repetitions)
+        if len(ret) == 0:
+            return default
+        return ret
+
+    def __getitem__(self, key: str) -> list:
+        ret = self.get(key)
+        if ret is None:
+            raise KeyError(key)
+        return ret
+
+    # Approximate memory used by the lexicon in bytes, per component
+    def memory_footprint(self) -> dict:
+        return {'word_buffer': sys.getsizeof(self._word_blob) + sys.getsizeof(self._word_offsets),
+                'word_table': sys.getsizeof(self._word_table),
+                'signatures': sys.getsizeof(self._signature_blob) + sys.getsizeof(self._signature_offsets) +
+                sys.getsizeof(self._signature_words) + sys.getsizeof(self._table),
+                'letter_counts': self._letter_counts.memory_footprint()}
+
+    # Pickled as the plain word list, the arrays are rebuilt on load
+    def __reduce__(self):
+        return CompactLexicon, (list(self),)
+
+
+#
+# Load a Scrabble word list into a CompactLexicon
+#
+def load_lexicon(filename: str) -> CompactLexicon:
+    print("Loading dictionary '" + filename + "'")
+    return CompactLexicon(line.strip() for line in open(filename))
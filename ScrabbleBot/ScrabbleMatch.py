@@ -5,22 +5,128 @@
 # and must also be initialized with a dictionary file that specifies the words that
 # are allowed to be played
 #
+# Games of a match are independent of each other, so they can be played in
+# parallel by a pool of worker processes. The lexicon and signature index are
+# handed to every worker once when the pool starts (with the 'fork' start method
+# they are simply inherited, nothing is rebuilt or copied up front)
+#
 
 __author__ = 'Sebastian Wernicke'
 
 from ScrabbleBot import ScrabbleAI
+from ScrabbleBot import ScrabbleAnagram
+from ScrabbleBot import ScrabbleDawg
+from ScrabbleBot import ScrabbleIndex
+from ScrabbleBot import ScrabbleLexicon
 from ScrabbleBot import ScrabbleGame
+from ScrabbleBot import ScrabbleStats
+from ScrabbleBot import ScrabbleTelemetry
 from ScrabbleBot import ScrabbleUtils
 
+from multiprocessing import Pool
+import json
 import random
 
+
+#
+# Load the legal words and build (or load) the lookup structure of the selected
+# move generator. Returns the tuple (legal_words, word_signatures, engine, dawg)
+# that ScrabbleGame takes.
+# The 'engine' selects the move generator ("signatures" or "dawg"), only
+# the lookup structure of the selected engine is built.
+# For the "signatures" engine, 'signature_mode' selects how signatures are looked up:
+#  - "compiled": memory-mapped index with all blank signatures precomputed (fastest)
+#  - "query": blank-free signatures only, blanks are resolved at lookup time (smallest)
+#  - "compact": one CompactLexicon serves as both legal words and signatures
+#  - "dict": in-memory dictionary from ScrabbleUtils.build_word_signatures
+#  - "anagram": anagram index, rack subsets are found by one query per set of board letters
+#
+def load_move_generator(dictionary_file: str, engine: str = "signatures", signature_mode: str = "compiled") -> tuple:
+
+    # Load the set of allowed words
+    if engine == "signatures" and signature_mode == "compact":
+        legal_words = ScrabbleLexicon.load_lexicon(dictionary_file)
+    else:
+        legal_words = ScrabbleUtils.load_word_set(dictionary_file)
+
+    word_signatures = None
+    dawg = None
+    if engine == "signatures":
+        if signature_mode == "compiled":
+            # Load the Word Signatures, assuming 2 blanks
+            # (they are compiled to disk once and memory-mapped from then on)
+            word_signatures = ScrabbleIndex.load_signature_index(
+                ScrabbleIndex.default_index_file(dictionary_file, 2), legal_words, 2)
+        elif signature_mode == "compact":
+            word_signatures = legal_words
+        elif signature_mode == "query":
+            word_signatures = ScrabbleIndex.BlankExpandingSignatures(legal_words)
+        elif signature_mode == "anagram":
+            word_signatures = ScrabbleAnagram.AnagramIndex(legal_words)
+        elif signature_mode == "dict":
+            # Build the Word Signatures, assuming 2 blanks
+            # (since we only build this once, this is the most efficient)
+            word_signatures = ScrabbleUtils.build_word_signatures(legal_words, 2)
+        else:
+            raise ValueError("Unknown signature mode '" + signature_mode + "'")
+    elif engine == "dawg":
+        dawg = ScrabbleDawg.ScrabbleDawg(legal_words)
+    else:
+        raise ValueError("Unknown move generation engine '" + engine + "'")
+
+    return legal_words, word_signatures, engine, dawg
+
+
+#
+# Lexicon and move generator data of a worker process, set by _init_worker
+#
+_worker_lexicon = None
+
+
+def _init_worker(lexicon: tuple):
+    global _worker_lexicon
+    _worker_lexicon = lexicon
+
+
+#
+# Play a single game and return the final scores (in the order of 'players'), the
+# ScrabbleStats.EngineStats of the game if 'collect_stats' is set (otherwise None)
+# and the ScrabbleTelemetry.GameTelemetry of the game.
+# 'lexicon' is the tuple (legal_words, word_signatures, engine, dawg), 'board_type'
+# the board of the game (see ScrabbleGame).
+# If a seed is given, the game gets its own random number generator seeded with it
+# (see ScrabbleGame), so that it plays out the same no matter which process it runs in,
+# and the random module of the process is left alone
+#
+def _play_game(players: list, game_seed: int, verbosity: int, collect_stats: bool, lexicon: tuple,
+               board_type: str = "lists") -> tuple:
+    rng = random.Random(game_seed) if game_seed is not None else None
+    legal_words, word_signatures, engine, dawg = lexicon
+    stats = ScrabbleStats.EngineStats() if collect_stats else None
+    telemetry = ScrabbleTelemetry.GameTelemetry()
+    game = ScrabbleGame.ScrabbleGame(players, legal_words, word_signatures, engine, dawg, None, stats, telemetry,
+                                     board_type, rng)
+    return game.play_until_finished(verbosity), stats, telemetry
+
+
+def _play_game_in_worker(game_setup: tuple) -> tuple:
+    players, game_seed, verbosity, collect_stats, board_type = game_setup
+    return _play_game(players, game_seed, verbosity, collect_stats, _worker_lexicon, board_type)
+
+
 class ScrabbleMatch:
 
-    def __init__(self, dictionary_file: str, player_list: list):
+    # See load_move_generator for 'engine' and 'signature_mode', and ScrabbleGame for 'board_type'
+    def __init__(self, dictionary_file: str, player_list: list, engine: str = "signatures",
+                 signature_mode: str = "compiled", board_type: str = "lists"):
 
         self._total_scores = dict()
         self._total_matchwins = dict()
         self._player_names = set()
+        self._engine_stats = ScrabbleStats.EngineStats()
+        self._game_stats = []
+        self._telemetry = ScrabbleTelemetry.MatchTelemetry()
+        self._board_type = board_type
 
         self._players = []
         for p in player_list:
@@ -34,38 +140,67 @@ class ScrabbleMatch:
 
         print("Welcome to a new Scrabble match!")
 
-        # Load the set of allowed words
-        self._legal_words = ScrabbleUtils.load_word_set(dictionary_file)
-
-        # Build the Word Signatures, assuming 2 blanks
-        # (since we only build this once, this is the most efficient)
-        self._word_signatures = ScrabbleUtils.build_word_signatures(self._legal_words, 2)
+        # Load the set of allowed words and the lookup structures of the move generator
+        self._legal_words, self._word_signatures, self._engine, self._dawg = \
+            load_move_generator(dictionary_file, engine, signature_mode)
 
     #
     # Let the players play against each other for a specified number of rounds
     # the randomize_order flag signals if player order is to be randomized for each round
+    # num_workers > 1 plays the games in that many processes. With a seed, every game
+    # gets its own seed derived from it, and the totals are the same for any number
+    # of workers and any process start method (the move generators produce their moves
+    # in an order that does not depend on string hashing, so worker processes with
+    # their own hash seeds play the same games). Bots with a time budget (e.g. SimBot)
+    # can still play differently from run to run.
+    # With collect_stats, the move generator is instrumented in every game and the
+    # stats are kept per game and for the whole match (see export_engine_stats).
+    # Every match records telemetry (turn latencies per bot, solutions per turn, games
+    # per second) and prints a summary at the end. With a 'telemetry_file', every
+    # finished game is also appended to that file as a line of JSON
     #
-    def play_match(self, num_rounds: int, randomize_order: bool, verbosity: int):
+    def play_match(self, num_rounds: int, randomize_order: bool, verbosity: int,
+                   num_workers: int = 1, seed: int = None, collect_stats: bool = False,
+                   telemetry_file: str = None):
+
+        self._telemetry = ScrabbleTelemetry.MatchTelemetry(telemetry_file)
 
         if verbosity > 0:
             print("Match is starting!")
 
-        # Play the rounds
+        # Decide player order and game seeds up front, so they don't depend on how
+        # the games are distributed
+        rng = random if seed is None else random.Random(seed)
+        game_setups = []
         for i in range(0, num_rounds):
-
             if randomize_order:
-                random.shuffle(self._players)
-
-            # Initialize game
-            game = ScrabbleGame.ScrabbleGame(self._players, self._legal_words, self._word_signatures)
-
-            # Play game
-            tmp_result = game.play_until_finished(verbosity)
-
-            # Keep score
+                rng.shuffle(self._players)
+            game_seed = None if seed is None and num_workers <= 1 else rng.getrandbits(64)
+            game_setups.append((list(self._players), game_seed, verbosity, collect_stats, self._board_type))
+
+        lexicon = (self._legal_words, self._word_signatures, self._engine, self._dawg)
+        if num_workers <= 1:
+            results = (_play_game(players, game_seed, verbosity, collect_stats, lexicon, board_type)
+                       for players, game_seed, verbosity, collect_stats, board_type in game_setups)
+            self._collect_results(game_setups, results, verbosity)
+        else:
+            with Pool(num_workers, _init_worker, (lexicon,)) as pool:
+                results = pool.imap(_play_game_in_worker, game_setups)
+                self._collect_results(game_setups, results, verbosity)
+
+        print(self._telemetry.summary())
+
+    # Keep score of finished games (in round order)
+    def _collect_results(self, game_setups: list, results, verbosity: int):
+        for i, (tmp_result, game_stats, game_telemetry) in enumerate(results):
+            players = game_setups[i][0]
+            if game_stats is not None:
+                self._engine_stats.merge(game_stats)
+                self._game_stats.append(game_stats)
+            self._telemetry.add_game(i, game_telemetry, tmp_result)
             max_score = max(tmp_result)
             for j in range(0, len(tmp_result)):
-                player_name = self._players[j].name
+                player_name = players[j].name
                 self._total_scores[player_name] += tmp_result[j]
                 if tmp_result[j] == max_score:
                     if verbosity > 0:
@@ -79,4 +214,19 @@ class ScrabbleMatch:
         return self._total_scores
 
     def get_total_matchwins(self):
-        return self._total_matchwins
\ No newline at end of file
+        return self._total_matchwins
+
+    # Telemetry of the last match played
+    def get_telemetry(self) -> ScrabbleTelemetry.MatchTelemetry:
+        return self._telemetry
+
+    # Move generator stats, added up over all games played with collect_stats
+    def get_engine_stats(self) -> ScrabbleStats.EngineStats:
+        return self._engine_stats
+
+    # Write the move generator stats of the match and of every game (in round order) as JSON
+    def export_engine_stats(self, filename: str):
+        with open(filename, "w") as f:
+            json.dump({"engine": self._engine,
+                       "match": self._engine_stats.to_dict(),
+                       "games": [game_stats.to_dict() for game_stats in self._game_stats]}, f, indent=2)
\ No newline at end of file
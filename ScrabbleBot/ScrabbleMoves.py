@@ -0,0 +1,95 @@
+#
+# This file defines the MoveProvider, which ScrabbleGame hands to bots that
+# generate the legal moves of their turn on demand
+#
+# Instead of a list of all legal moves, a bot that sets 'lazy_moves = True' (see
+# ScrabbleAI) gets a MoveProvider in make_move and asks it for what it needs:
+#  - all(): ScrabbleUtils.MoveList of all legal moves (generated once, later calls return
+#    the same list)
+#  - best(): the highest scoring move, or None if there is no legal move
+#  - top(k): the (up to) k highest scoring moves, sorted by score from high to low
+#  - iter(): all legal moves, one at a time
+#  - features(): ScrabbleFeatures.feature_matrix of all() (needs NumPy)
+# With the "signatures" engine, best() and top(k) only search the placements that can
+# beat the k-th best move (see ScrabbleBoard.best_moves) and iter() generates the moves
+# while they are consumed. The "dawg" engine generates all moves at once. Once all()
+# has been called, the other methods work on its list.
+# The move list cache of the game is used by all() and iter(), the pruned search of
+# best() and top(k) goes without it. The move generator stats of the game record all of
+# them. num_generated is the number of moves that the last request generated (for the
+# pruned search, the moves of the placements it did not prune, not just the k returned).
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleDawg
+from ScrabbleBot import ScrabbleFeatures
+from ScrabbleBot import ScrabbleStats
+from ScrabbleBot import ScrabbleUtils
+from ScrabbleBot import ScrabbleZobrist
+
+
+class MoveProvider:
+
+    # The arguments are the ones of ScrabbleBoard.possible_moves (the board must not
+    # change while the provider is used)
+    def __init__(self, board: ScrabbleBoard.ScrabbleBoard, letters: str, letter_values: dict,
+                 legal_words: set, word_signatures: dict, engine: str = "signatures",
+                 dawg: ScrabbleDawg.ScrabbleDawg = None, move_cache: ScrabbleZobrist.MoveListCache = None,
+                 stats: ScrabbleStats.EngineStats = None):
+        self._board = board
+        self._letters = letters
+        self._letter_values = letter_values
+        self._legal_words = legal_words
+        self._word_signatures = word_signatures
+        self._engine = engine
+        self._dawg = dawg
+        self._move_cache = move_cache
+        self._stats = stats
+        self._moves = None
+        self.num_generated = 0  # Moves generated by the last request
+
+    def all(self) -> ScrabbleUtils.MoveList:
+        if self._moves is None:
+            self._moves = self._board.possible_moves(self._letters, self._letter_values, self._legal_words,
+                                                     self._word_signatures, self._engine, self._dawg,
+                                                     self._move_cache, self._stats)
+            self.num_generated = len(self._moves)
+        return self._moves
+
+    def best(self) -> ScrabbleUtils.ScrabbleMove:
+        moves = self.top(1)
+        return moves[0] if len(moves) > 0 else None
+
+    def top(self, k: int) -> list:
+        if self._lazy():
+            # The moves generated are counted by the stats of the game (or stats of our own)
+            stats = self._stats if self._stats is not None else ScrabbleStats.EngineStats()
+            generated = stats.counts["candidates_scored"] - stats.counts["candidates_illegal"]
+            moves = self._board.best_moves(self._letters, self._letter_values, self._legal_words,
+                                           self._word_signatures, k, self._engine, self._dawg, stats)
+            self.num_generated = stats.counts["candidates_scored"] - stats.counts["candidates_illegal"] - generated
+            return moves
+        return self.all().top(k)
+
+    def features(self):
+        return ScrabbleFeatures.feature_matrix(self._board, self.all())
+
+    def iter(self):
+        if self._lazy():
+            return self._counted(self._board.iter_possible_moves(self._letters, self._letter_values,
+                                                                 self._legal_words, self._word_signatures,
+                                                                 self._engine, self._dawg, self._stats))
+        return iter(self.all())
+
+    # Whether moves can be generated on demand (otherwise the list of all moves is used,
+    # and kept for the next request)
+    def _lazy(self) -> bool:
+        return self._moves is None and self._engine == "signatures" and self._move_cache is None
+
+    def _counted(self, moves):
+        self.num_generated = 0
+        for move in moves:
+            self.num_generated += 1
+            yield move
@@ -0,0 +1,241 @@
+#
+# This file contains a batch scorer that scores many candidate words on the same
+# board at once with array operations (needs NumPy).
+#
+# ScrabbleUtils.score_play_across/score_play_down walk every word square by square,
+# decode the multiplier codes one by one and walk again for every cross word.
+# The BatchScorer instead precomputes, for every line of the board and of its
+# transpose:
+#  - the letter and word multipliers of every square
+#  - prefix sums of the values of the tiles on the board, from which the value of
+#    the run of tiles left of (or right of) any square is a difference of two sums
+#  - the value of the cross word tiles next to every square, and whether there are any
+# and then scores a whole batch of (row, col, how, word) candidates with a few
+# gathers and sums. Scores are identical to score_play_across/score_play_down with
+# legality_check set to False (i.e. -1 if the word does not fit on the board or
+# conflicts with a tile, no dictionary lookup), including the 50 point bonus.
+#
+# Given the cross-checks of the board (see ScrabbleDawg.compute_cross_checks), the
+# scorer can also check the cross words of a batch, which makes it a drop-in for
+# the legality checking scorers in the move generator: ScrabbleUtils scores the
+# candidate words of all placements of a rack in one batch if it gets a BatchScorer
+# (the words of a placement come from the dictionary and span the whole run of tiles,
+# so the cross words are all that is left to check). The board type "batch" of
+# ScrabbleGame plays with it. A placement rarely has more than a few dozen candidate
+# words, too few to make up for the array overhead, which is why the batches hold the
+# candidates of all placements (thousands of words), or of a growing number of
+# placements in the pruned search of best_moves. Most candidates are illegal, so the
+# legality checks come first and only the playable candidates are scored
+# (ScrabbleScoringCheck.py checks that both scorers give the same moves and scores).
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleBitboard
+
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:  # The batch scorer is then not available
+    np = None
+
+BLANK_CODE = 27
+
+if np is not None:
+    _CODE_TABLE = np.zeros(256, dtype=np.uint8)  # ASCII -> letter code
+    _CODE_TABLE[ord('A'):ord('Z') + 1] = np.arange(1, 27)
+    _CODE_TABLE[ord('*')] = BLANK_CODE
+
+
+#
+# Letter codes of a batch of words, padded to 15 squares (an N x 15 uint8 array).
+# Blanks ('*') are BLANK_CODE
+#
+def word_codes(words: list, lengths: "np.ndarray" = None) -> "np.ndarray":
+    if lengths is None:
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    codes = np.zeros((len(words), 15), dtype=np.uint8)
+    codes[np.arange(15)[None, :] < lengths[:, None]] = \
+        _CODE_TABLE[np.frombuffer("".join(words).encode('ascii'), dtype=np.uint8)]
+    return codes
+
+
+#
+# Per-line tables for playing across on 'bitboard' (which can be a transposed view)
+#
+class LineTables:
+
+    def __init__(self, bitboard: "ScrabbleBitboard.BitBoard", value_table: "np.ndarray", cross_checks: list = None):
+        letters = np.ascontiguousarray(bitboard.letters)
+        occupied = letters != ScrabbleBitboard.EMPTY
+        self.letters = letters
+        self.letter_multipliers = np.ascontiguousarray(bitboard.letter_multipliers).astype(np.int32)
+        self.word_multipliers = np.ascontiguousarray(bitboard.word_multipliers).astype(np.int32)
+        values = value_table[letters]
+        positions = np.arange(15)
+
+        # prefix[line, i] is the sum of the tile values in squares 0..i-1
+        prefix = np.zeros((15, 16), dtype=np.int32)
+        prefix[:, 1:] = np.cumsum(values, axis=1)
+
+        # left_run[line, i]: value of the run of tiles that ends right before square i
+        last_empty = np.maximum.accumulate(np.where(occupied, -1, positions), axis=1)
+        last_empty_before = np.full((15, 15), -1)
+        last_empty_before[:, 1:] = last_empty[:, :-1]
+        self.left_run = prefix[:, :15] - np.take_along_axis(prefix, last_empty_before + 1, axis=1)
+
+        # right_run[line, i]: value of the run of tiles that starts at square i (i = 15 is off the board)
+        next_empty = np.full((15, 16), 15)
+        next_empty[:, :15] = np.minimum.accumulate(np.where(occupied, 15, positions)[:, ::-1], axis=1)[:, ::-1]
+        self.right_run = np.take_along_axis(prefix, next_empty, axis=1) - prefix
+
+        # Cross words: tiles directly above and below every square (i.e. the runs of the
+        # transposed lines that end right before / start right after the square)
+        occupied_t = occupied.T
+        values_t = values.T
+        prefix_t = np.zeros((15, 16), dtype=np.int32)
+        prefix_t[:, 1:] = np.cumsum(values_t, axis=1)
+        last_empty_t = np.maximum.accumulate(np.where(occupied_t, -1, positions), axis=1)
+        last_empty_before_t = np.full((15, 15), -1)
+        last_empty_before_t[:, 1:] = last_empty_t[:, :-1]
+        above = prefix_t[:, :15] - np.take_along_axis(prefix_t, last_empty_before_t + 1, axis=1)
+        next_empty_t = np.full((15, 16), 15)
+        next_empty_t[:, :15] = np.minimum.accumulate(np.where(occupied_t, 15, positions)[:, ::-1],
+                                                     axis=1)[:, ::-1]
+        below = np.take_along_axis(prefix_t, next_empty_t, axis=1) - prefix_t
+        self.cross_sum = np.ascontiguousarray((above + below[:, 1:]).T)
+        has_cross = np.zeros((15, 15), dtype=bool)
+        has_cross[1:, :] |= occupied[:-1, :]
+        has_cross[:-1, :] |= occupied[1:, :]
+        self.has_cross = has_cross
+
+        # allowed[line, i, code]: can the letter with 'code' be placed on square i, given the
+        # cross-checks of the lines (squares without a cross-check allow every letter)
+        self.allowed = None
+        if cross_checks is not None:
+            allowed = np.ones((15, 15, BLANK_CODE + 1), dtype=bool)
+            for line in range(0, 15):
+                for i in range(0, 15):
+                    if cross_checks[line][i] is not None:
+                        allowed[line, i, :] = False
+                        allowed[line, i, [ScrabbleBitboard.letter_code(char) for char in cross_checks[line][i]]] = True
+            self.allowed = allowed
+
+
+class BatchScorer:
+
+    # Precompute the line tables of a board for a given set of letter values. 'cross_checks'
+    # are the cross-checks for playing across and down (the latter in transposed coordinates,
+    # as ScrabbleBoard keeps them), needed for checking the cross words of candidates
+    def __init__(self, bitboard: "ScrabbleBitboard.BitBoard", letter_values: dict, cross_checks: tuple = None):
+        if np is None:
+            raise ImportError("The batch scorer requires NumPy, please install it (pip install numpy)")
+        self._value_table = np.zeros(BLANK_CODE + 1, dtype=np.int32)
+        for letter, value in letter_values.items():
+            if letter == '*':
+                self._value_table[BLANK_CODE] = value
+            elif len(letter) == 1 and letter != ' ':
+                self._value_table[ScrabbleBitboard.letter_code(letter)] = value
+        cross_checks_across, cross_checks_down = cross_checks if cross_checks is not None else (None, None)
+        self._across = LineTables(bitboard, self._value_table, cross_checks_across)
+        self._down = LineTables(bitboard.transposed(), self._value_table, cross_checks_down)
+
+    # Score a batch of candidates (row, col, how, word), where 'word' is the full word
+    # as in score_play_across/score_play_down and may contain '*' for blanks.
+    # Returns an int array with the score of every candidate (-1 if it cannot be played).
+    # With 'cross_check', candidates that form an illegal cross word are -1 as well (this
+    # needs the cross-checks and the letters the blanks stand for)
+    def score(self, candidates: list, cross_check: bool = False) -> "np.ndarray":
+        if len(candidates) == 0:
+            return np.full(0, -1, dtype=np.int32)
+        rows, cols, hows, words = zip(*candidates)
+        return self._score(np.array(rows), np.array(cols), np.array(hows) == "down", words, cross_check)
+
+    # Same as score for the candidates of placements (row, col, how, words), i.e. for the
+    # candidates (row, col, how, word) of every word of every placement, in this order
+    def score_placements(self, placements: list, cross_check: bool = False) -> "np.ndarray":
+        if len(placements) == 0:
+            return np.full(0, -1, dtype=np.int32)
+        rows, cols, hows, words = zip(*placements)
+        counts = np.fromiter(map(len, words), dtype=np.int64, count=len(placements))
+        return self._score(np.repeat(rows, counts), np.repeat(cols, counts),
+                           np.repeat(np.array(hows) == "down", counts), list(chain.from_iterable(words)),
+                           cross_check)
+
+    def _score(self, rows: "np.ndarray", cols: "np.ndarray", down: "np.ndarray", words: list,
+               cross_check: bool) -> "np.ndarray":
+        if cross_check and self._across.allowed is None:
+            raise ValueError("Checking cross words requires the cross-checks of the board")
+        scores = np.full(len(words), -1, dtype=np.int32)
+        if len(words) == 0:
+            return scores
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        codes = word_codes(words, lengths)
+        # Along the lines of the transposed board, moves down become moves across
+        for tables, selection, lines, starts in ((self._across, np.flatnonzero(~down), rows, cols),
+                                                 (self._down, np.flatnonzero(down), cols, rows)):
+            if len(selection) > 0:
+                scores[selection] = self._score_lines(tables, lines[selection], starts[selection],
+                                                      lengths[selection], codes[selection], cross_check)
+        return scores
+
+    # Score a list of ScrabbleMoves (with blanks at their blank_positions), the same as
+    # ScrabbleBoard.check_legal_and_score_move without the dictionary check
+    def score_moves(self, moves: list) -> "np.ndarray":
+        candidates = []
+        for move in moves:
+            word = list(move.word)
+            for pos in move.blank_positions:
+                word[pos] = '*'
+            candidates.append((move.row, move.col, move.how, "".join(word)))
+        return self.score(candidates)
+
+    # Scores of words played across lines of 'tables'. The legality checks come first, so
+    # that only the candidates that can be played (usually a small part of them) are scored
+    def _score_lines(self, tables: LineTables, lines: "np.ndarray", starts: "np.ndarray", lengths: "np.ndarray",
+                     codes: "np.ndarray", cross_check: bool) -> "np.ndarray":
+        offsets = np.arange(15)
+        in_word = offsets[None, :] < lengths[:, None]
+        squares = lines[:, None] * 15 + np.minimum(starts[:, None] + offsets[None, :], 14)  # Into the 15x15 tables
+
+        board_letters = tables.letters.take(squares)
+        occupied = board_letters != ScrabbleBitboard.EMPTY
+        new_tiles = in_word & ~occupied
+        conflict = (in_word & occupied & (board_letters != codes)).any(axis=1) | (starts + lengths > 15)
+        forms_cross = new_tiles & tables.has_cross.take(squares)
+        if cross_check:
+            conflict |= (forms_cross & ~tables.allowed.take(squares * (BLANK_CODE + 1) + codes)).any(axis=1)
+
+        scores = np.full(len(lines), -1, dtype=np.int32)
+        playable = np.flatnonzero(~conflict)
+        if len(playable) == 0:
+            return scores
+        lines, starts, lengths = lines[playable], starts[playable], lengths[playable]
+        in_word, squares, new_tiles, forms_cross = in_word[playable], squares[playable], new_tiles[playable], \
+            forms_cross[playable]
+        word_letters = np.where(new_tiles, codes[playable], board_letters[playable])
+
+        letter_scores = self._value_table[word_letters] * np.where(new_tiles, tables.letter_multipliers.take(squares),
+                                                                   1)
+        square_word_multipliers = np.where(new_tiles, tables.word_multipliers.take(squares), 1)
+        word_multiplier = np.prod(square_word_multipliers, axis=1)
+
+        ends = np.minimum(starts + lengths, 15)
+        base = np.where(in_word, letter_scores, 0).sum(axis=1) + tables.left_run[lines, np.minimum(starts, 14)] + \
+            tables.right_run[lines, ends]
+        score = base * word_multiplier
+
+        cross_scores = (letter_scores + tables.cross_sum.take(squares)) * square_word_multipliers
+        score += np.where(forms_cross, cross_scores, 0).sum(axis=1)
+
+        score += np.where(new_tiles.sum(axis=1) == 7, 50, 0)
+        scores[playable] = score
+        return scores
+
+
+#
+# Convenience function: score 'candidates' (see BatchScorer.score) on a board given as nested lists
+#
+def score_candidates(board: list, candidates: list, letter_values: dict) -> "np.ndarray":
+    return BatchScorer(ScrabbleBitboard.BitBoard.from_rows(board), letter_values).score(candidates)
@@ -0,0 +1,187 @@
+#
+# This file contains Monte Carlo simulation of candidate moves
+#
+# A rollout of a candidate move deals the unseen tiles (all tiles minus the ones on
+# the board and on the own rack) into a random opponent rack and bag, plays the
+# candidate, and continues the game for a few plies with a fast greedy policy
+# (every player plays their highest scoring move). Its value is the point spread
+# (own points minus opponent points) from the candidate on, including the penalties
+# for leftover tiles if the game ends during the rollout.
+#
+# Rollouts are run in rounds: every round deals the tiles once and rolls out every
+# candidate with the same deal, so differences between candidates are not drowned
+# in the luck of the draw. The time budget is checked after every rollout (at least
+# one rollout is played), so there is an answer at any time and the budget is never
+# exceeded by more than one rollout. Candidates that the first round did not get to
+# have no rollouts, and the last round may end part of the way through, so the
+# results are compared by their average spread. A RolloutPool runs rounds in several
+# worker processes at once, all until the same budget, and adds up the results.
+#
+# Moves are played with ScrabbleBoard.apply and taken back with undo, so every worker
+# sets up the position once and never copies the board.
+#
+# The simulation assumes a game of two players.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleGame
+from ScrabbleBot import ScrabbleUtils
+
+from collections import Counter
+from multiprocessing import Pool
+from time import perf_counter
+import random
+
+
+#
+# The tiles that are not on the board and not on the rack 'letters' (i.e. the
+# opponent's rack and the bag), blanks are '*'
+#
+def unseen_letters(board: ScrabbleBoard.ScrabbleBoard, letters: list) -> list:
+    seen = Counter(letters)
+    blank_locations = board.blank_locations()
+    for row in range(0, 15):
+        for col in range(0, 15):
+            letter = board.get(row, col)
+            if letter != ' ':
+                seen['*' if blank_locations[row][col] == 'X' else letter] += 1
+    return list((Counter(ScrabbleGame.get_letter_pieces()) - seen).elements())
+
+
+class Simulator:
+
+    # 'lexicon' is the tuple (legal_words, word_signatures, engine, dawg) of
+    # ScrabbleMatch.load_move_generator, 'plies' the number of greedy moves after
+    # the candidate (an even number ends every rollout with a move of our own)
+    def __init__(self, lexicon: tuple, letter_values: dict, plies: int = 2):
+        self._legal_words, self._word_signatures, self._engine, self._dawg = lexicon
+        self._letter_values = letter_values
+        self.plies = plies
+
+    # The highest scoring move for a rack, or None
+    def greedy_move(self, board: ScrabbleBoard.ScrabbleBoard, rack: list) -> ScrabbleUtils.ScrabbleMove:
+        moves = board.best_moves("".join(rack), self._letter_values, self._legal_words,
+                                 self._word_signatures, 1, self._engine, self._dawg)
+        return moves[0] if len(moves) > 0 else None
+
+    #
+    # Spread of one rollout of 'candidate' for the rack 'letters', where 'tiles' are
+    # the unseen tiles in the order in which they are dealt (first the opponent's rack,
+    # then the bag from the end). The board is the same afterwards
+    #
+    def rollout(self, board: ScrabbleBoard.ScrabbleBoard, letters: list,
+                candidate: ScrabbleUtils.ScrabbleMove, tiles: list) -> int:
+        racks = [list(letters), tiles[:7]]
+        bag = tiles[7:]
+        records = []
+        spread = 0
+        passes = 0
+        player = 0
+        move = candidate
+        for ply in range(0, self.plies + 1):
+            if ply > 0:
+                move = self.greedy_move(board, racks[player])
+            if move is None:
+                passes += 1
+                if passes == 2:
+                    break
+            else:
+                passes = 0
+                spread += move.score if player == 0 else -move.score
+                records.append(board.apply(move))
+                for letter in move.letters:
+                    racks[player].remove(letter)
+                num_drawn = min(len(move.letters), len(bag))
+                racks[player].extend(bag[len(bag) - num_drawn:])
+                del bag[len(bag) - num_drawn:]
+                if len(racks[player]) == 0:
+                    break
+            player = 1 - player
+
+        # Penalties for leftover tiles if the game ended
+        if passes == 2 or len(racks[0]) == 0 or len(racks[1]) == 0:
+            spread -= sum(self._letter_values[letter] for letter in racks[0])
+            spread += sum(self._letter_values[letter] for letter in racks[1])
+
+        for record in reversed(records):
+            board.undo(record)
+        return spread
+
+    #
+    # Roll out the candidates in rounds until 'time_budget' seconds have passed (checked
+    # after every rollout) or after 'max_rounds' full rounds, if given. At least one
+    # rollout is played. 'unseen' are the tiles of unseen_letters. Returns the lists
+    # (total spread, number of rollouts) of the candidates; a candidate that was not
+    # rolled out before the deadline has no rollouts
+    #
+    def simulate(self, board: ScrabbleBoard.ScrabbleBoard, letters: list, candidates: list, unseen: list,
+                 time_budget: float, max_rounds: int = None, seed: int = None) -> tuple:
+        if time_budget is None and max_rounds is None:
+            raise ValueError("A simulation needs a time budget or a maximum number of rounds")
+        rng = random.Random(seed)
+        deadline = perf_counter() + time_budget if time_budget is not None else None
+        totals = [0] * len(candidates)
+        counts = [0] * len(candidates)
+        rounds = 0
+        while max_rounds is None or rounds < max_rounds:
+            tiles = list(unseen)
+            rng.shuffle(tiles)
+            for i, candidate in enumerate(candidates):
+                totals[i] += self.rollout(board, letters, candidate, tiles)
+                counts[i] += 1
+                if deadline is not None and perf_counter() >= deadline:
+                    return totals, counts
+            rounds += 1
+        return totals, counts
+
+
+#
+# Simulator of a worker process, set by _init_worker
+#
+_worker_simulator = None
+
+
+def _init_worker(lexicon: tuple, letter_values: dict, plies: int):
+    global _worker_simulator
+    _worker_simulator = Simulator(lexicon, letter_values, plies)
+
+
+def _simulate_in_worker(task: tuple) -> tuple:
+    rows, blank_locations, letters, candidates, unseen, time_budget, max_rounds, seed = task
+    board = ScrabbleBoard.ScrabbleBoard()
+    board.load(rows, blank_locations)
+    return _worker_simulator.simulate(board, letters, candidates, unseen, time_budget, max_rounds, seed)
+
+
+#
+# Runs the rounds of a simulation in a pool of worker processes. The lexicon is
+# handed to every worker once when the pool starts (with the 'fork' start method it
+# is simply inherited). 'max_rounds' is per worker
+#
+class RolloutPool:
+
+    def __init__(self, num_workers: int, lexicon: tuple, letter_values: dict, plies: int = 2):
+        self.num_workers = num_workers
+        self._pool = Pool(num_workers, _init_worker, (lexicon, letter_values, plies))
+
+    # Same as Simulator.simulate, with the rounds of all workers added up
+    def simulate(self, board: ScrabbleBoard.ScrabbleBoard, letters: list, candidates: list, unseen: list,
+                 time_budget: float, max_rounds: int = None, seed: int = None) -> tuple:
+        rng = random.Random(seed)
+        rows = board.rows()
+        blank_locations = board.blank_locations()
+        tasks = [(rows, blank_locations, list(letters), candidates, unseen, time_budget, max_rounds,
+                  rng.getrandbits(64)) for i in range(0, self.num_workers)]
+        totals = [0] * len(candidates)
+        counts = [0] * len(candidates)
+        for worker_totals, worker_counts in self._pool.map(_simulate_in_worker, tasks):
+            for i in range(0, len(candidates)):
+                totals[i] += worker_totals[i]
+                counts[i] += worker_counts[i]
+        return totals, counts
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
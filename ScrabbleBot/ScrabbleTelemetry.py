@@ -0,0 +1,194 @@
+#
+# This file contains the telemetry of games and matches: how long move generation
+# and the bots' decisions take, and how many moves the bots get to choose from.
+#
+# A GameTelemetry records one entry per turn (player, move generation time,
+# make_move time, number of solutions) and the duration of the game. A
+# MatchTelemetry adds up the games of a match into latency histograms per bot
+# (decision time and move generation time of the bot's turns), counts the games
+# per second, and prints a summary report. If it is given a file name, it appends
+# one JSON line per finished game to that file (with the running totals), so that
+# a long match can be watched while it is still going, e.g. with 'tail -f'.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from time import perf_counter
+import json
+
+# Upper bounds of the histogram buckets in seconds (the last bucket is open)
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds < 1.0:
+        return "{:.1f}ms".format(seconds * 1000)
+    return "{:.2f}s".format(seconds)
+
+
+#
+# Histogram of latencies with fixed, roughly logarithmic buckets
+#
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.num = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.num += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        for i in range(0, len(self.counts)):
+            self.counts[i] += other.counts[i]
+        self.num += other.num
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def mean(self) -> float:
+        return self.total / self.num if self.num > 0 else 0.0
+
+    # Upper bound of the bucket that contains the given percentile (at most the maximum)
+    def percentile(self, percent: float) -> float:
+        if self.num == 0:
+            return 0.0
+        rank = percent / 100.0 * self.num
+        cumulative = 0
+        for i in range(0, len(self.counts)):
+            cumulative += self.counts[i]
+            if cumulative >= rank:
+                return min(LATENCY_BUCKETS[i], self.max) if i < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {"buckets": list(LATENCY_BUCKETS), "counts": list(self.counts), "num": self.num,
+                "total": self.total, "max": self.max}
+
+    def __str__(self) -> str:
+        ret = ""
+        for i in range(0, len(self.counts)):
+            if self.counts[i] > 0:
+                upper = _format_seconds(LATENCY_BUCKETS[i]) if i < len(LATENCY_BUCKETS) else "inf"
+                bar = "#" * max(1, round(40 * self.counts[i] / self.num))
+                ret += "  " + ("<= " + upper).ljust(10) + str(self.counts[i]).rjust(7) + " " + bar + "\n"
+        return ret.rstrip("\n")
+
+
+#
+# Turns of one game
+#
+class GameTelemetry:
+
+    def __init__(self):
+        self.turns = []  # (player name, generation seconds, decision seconds, number of solutions)
+        self.duration = 0.0
+        self._start = perf_counter()
+
+    def add_turn(self, player_name: str, generation_time: float, decision_time: float, num_solutions: int):
+        self.turns.append((player_name, generation_time, decision_time, num_solutions))
+
+    def finish(self):
+        self.duration = perf_counter() - self._start
+
+    def to_dict(self) -> dict:
+        return {"duration": self.duration,
+                "turns": [{"player": player_name, "generation_time": generation_time,
+                           "decision_time": decision_time, "num_solutions": num_solutions}
+                          for player_name, generation_time, decision_time, num_solutions in self.turns]}
+
+
+#
+# Statistics of the turns of one bot over a match
+#
+class BotTelemetry:
+
+    def __init__(self):
+        self.decision_times = LatencyHistogram()
+        self.generation_times = LatencyHistogram()
+        self.num_solutions = 0
+        self.max_solutions = 0
+
+    def add_turn(self, generation_time: float, decision_time: float, num_solutions: int):
+        self.decision_times.add(decision_time)
+        self.generation_times.add(generation_time)
+        self.num_solutions += num_solutions
+        self.max_solutions = max(self.max_solutions, num_solutions)
+
+    def mean_solutions(self) -> float:
+        return self.num_solutions / self.decision_times.num if self.decision_times.num > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {"decision_times": self.decision_times.to_dict(),
+                "generation_times": self.generation_times.to_dict(),
+                "mean_solutions": self.mean_solutions(), "max_solutions": self.max_solutions}
+
+
+#
+# Telemetry of a match, optionally streamed to 'stream_file' (one JSON line per game)
+#
+class MatchTelemetry:
+
+    def __init__(self, stream_file: str = None):
+        self.bots = dict()  # Bot name -> BotTelemetry
+        self.num_games = 0
+        self.num_turns = 0
+        self.game_durations = LatencyHistogram()
+        self.stream_file = stream_file
+        self._start = perf_counter()
+        if stream_file is not None:
+            open(stream_file, "w").close()
+
+    def elapsed(self) -> float:
+        return perf_counter() - self._start
+
+    def games_per_second(self) -> float:
+        elapsed = self.elapsed()
+        return self.num_games / elapsed if elapsed > 0 else 0.0
+
+    def add_game(self, round_number: int, game: GameTelemetry, scores: list):
+        for player_name, generation_time, decision_time, num_solutions in game.turns:
+            if player_name not in self.bots:
+                self.bots[player_name] = BotTelemetry()
+            self.bots[player_name].add_turn(generation_time, decision_time, num_solutions)
+        self.num_games += 1
+        self.num_turns += len(game.turns)
+        self.game_durations.add(game.duration)
+
+        if self.stream_file is not None:
+            record = {"round": round_number, "scores": scores, "elapsed": self.elapsed(),
+                      "games": self.num_games, "games_per_second": self.games_per_second()}
+            record.update(game.to_dict())
+            with open(self.stream_file, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def to_dict(self) -> dict:
+        return {"games": self.num_games, "turns": self.num_turns, "elapsed": self.elapsed(),
+                "games_per_second": self.games_per_second(), "game_durations": self.game_durations.to_dict(),
+                "bots": dict((name, bot.to_dict()) for name, bot in self.bots.items())}
+
+    # Summary report of the match
+    def summary(self) -> str:
+        ret = "Games: " + str(self.num_games) + "   turns: " + str(self.num_turns) + \
+              "   time: " + _format_seconds(self.elapsed()) + \
+              "   games/s: " + "{:.3f}".format(self.games_per_second()) + "\n"
+        ret += "BOT".ljust(20) + "TURNS".rjust(7) + "DECIDE p50".rjust(12) + "p95".rjust(10) + "max".rjust(10) + \
+            "GENERATE p50".rjust(14) + "p95".rjust(10) + "SOLUTIONS".rjust(11) + "\n"
+        for name, bot in self.bots.items():
+            ret += name[:19].ljust(20) + str(bot.decision_times.num).rjust(7) + \
+                _format_seconds(bot.decision_times.percentile(50)).rjust(12) + \
+                _format_seconds(bot.decision_times.percentile(95)).rjust(10) + \
+                _format_seconds(bot.decision_times.max).rjust(10) + \
+                _format_seconds(bot.generation_times.percentile(50)).rjust(14) + \
+                _format_seconds(bot.generation_times.percentile(95)).rjust(10) + \
+                "{:.0f}".format(bot.mean_solutions()).rjust(11) + "\n"
+        for name, bot in self.bots.items():
+            ret += "Decision times of '" + name + "':\n" + str(bot.decision_times) + "\n"
+        return ret.rstrip("\n")
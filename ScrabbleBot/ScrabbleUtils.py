@@ -8,11 +8,18 @@
 
 __author__ = 'Sebastian Wernicke'
 
-from itertools import combinations, product
+from ScrabbleBot import ScrabbleAnagram
+
+from array import array
+from heapq import heappush, heapreplace, nlargest
+from itertools import combinations
+from time import perf_counter
 
 
 class ScrabbleMove:
 
+    __slots__ = ("score", "row", "col", "how", "word", "letters", "blank_positions")
+
     def __init__(self, row: int, col: int, how: str, word: str, letters: list, score: int):
         self.score = score
         self.row = row
@@ -26,6 +33,245 @@ class ScrabbleMove:
         return self.score < other.score
 
 
+#
+# Columnar list of moves, which the move generators return instead of a list of ScrabbleMoves
+#
+# The row, column, direction and score of every move are kept in packed arrays, and its
+# word, letters and blank positions as indexes into storage that all moves of the list
+# share. ScrabbleMoves are only created when moves are accessed (by position or by
+# iterating), and the list keeps the moves it handed out: accessing a move again returns
+# the same ScrabbleMove, and a score changed on it is the score of the move in the list
+# (e.g. for sort, top and columns), just as if it was set with set_score / adjust_score.
+# A MoveList can be used like the list of ScrabbleMoves it replaces (len, indexing,
+# iteration, item assignment, del, pop, remove, index, sort, random.choice...). Sorting
+# only puts the positions of the moves in order, and like ScrabbleMove.__lt__ it compares
+# (adjusted) scores. top(k) picks the k best moves with a heap instead of sorting them all
+#
+class MoveList:
+
+    def __init__(self, moves=()):
+        self._rows = array('b')
+        self._cols = array('b')
+        self._across = array('b')
+        self._scores = array('l')
+        self._words = array('l')  # Indexes into self._storage
+        self._letters = array('l')  # Indexes into self._storage (the letters as a string)
+        self._blanks = array('l')  # Indexes into self._storage (the blank positions as a tuple)
+        self._adjusted = None  # Adjusted scores, once a score has been adjusted
+        self._order = None  # Moves in sorted order (None for the order in which they were added)
+        self._handed = None  # ScrabbleMoves handed out, by index (None until the first one is)
+        self._storage = [()]
+        self._storage_index = {(): 0}
+        for move in moves:
+            self.append(move)
+
+    def add(self, row: int, col: int, how: str, word: str, letters, score: int, blank_positions=()):
+        if self._order is not None:
+            self._order.append(len(self._rows))
+        self._rows.append(row)
+        self._cols.append(col)
+        self._across.append(how == "across")
+        self._scores.append(score)
+        self._words.append(self._store(word))
+        self._letters.append(self._store("".join(letters)))
+        self._blanks.append(self._store(tuple(blank_positions)))
+        if self._adjusted is not None:
+            self._adjusted.append(score)
+
+    def append(self, move: ScrabbleMove):
+        self.add(move.row, move.col, move.how, move.word, move.letters, move.score, move.blank_positions)
+
+    def extend(self, moves):
+        for move in moves:
+            self.append(move)
+
+    def _store(self, value) -> int:
+        index = self._storage_index.get(value)
+        if index is None:
+            index = len(self._storage)
+            self._storage_index[value] = index
+            self._storage.append(value)
+        return index
+
+    # Index into the columns of the move at 'position'
+    def _index(self, position: int) -> int:
+        position = self._position(position)
+        return self._order[position] if self._order is not None else position
+
+    # 'position' (which may be negative, as for lists) checked against the length of the list
+    def _position(self, position: int) -> int:
+        if position < 0:
+            position += len(self._rows)
+        if not 0 <= position < len(self._rows):
+            raise IndexError("MoveList index out of range")
+        return position
+
+    def _positions(self):
+        return self._order if self._order is not None else range(0, len(self._rows))
+
+    def _score_column(self):
+        self._sync_scores()
+        return self._adjusted if self._adjusted is not None else self._scores
+
+    # Takes over the scores that were changed on the ScrabbleMoves handed out
+    def _sync_scores(self):
+        if not self._handed:
+            return
+        column = self._adjusted if self._adjusted is not None else self._scores
+        for index, move in self._handed.items():
+            if move.score != column[index]:
+                if self._adjusted is None:
+                    self._adjusted = array('d', self._scores)
+                    column = self._adjusted
+                column[index] = move.score
+
+    # Whether the move at 'index' is 'move', or a move with the same placement
+    def _matches(self, index: int, move: ScrabbleMove) -> bool:
+        if self._handed is not None and self._handed.get(index) is move:
+            return True
+        return self._rows[index] == move.row and self._cols[index] == move.col and \
+            self._across[index] == (move.how == "across") and self._storage[self._words[index]] == move.word and \
+            self._storage[self._letters[index]] == "".join(move.letters) and \
+            self._storage[self._blanks[index]] == tuple(move.blank_positions)
+
+    def _move(self, index: int) -> ScrabbleMove:
+        if self._handed is None:
+            self._handed = {}
+        else:
+            move = self._handed.get(index)
+            if move is not None:
+                return move
+        move = ScrabbleMove.__new__(ScrabbleMove)
+        move.row = self._rows[index]
+        move.col = self._cols[index]
+        move.how = "across" if self._across[index] else "down"
+        move.word = self._storage[self._words[index]]
+        move.letters = list(self._storage[self._letters[index]])
+        move.blank_positions = list(self._storage[self._blanks[index]])
+        move.score = self._scores[index]
+        if self._adjusted is not None and self._adjusted[index] != move.score:
+            move.score = self._adjusted[index]
+        self._handed[index] = move
+        return move
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._move(index) for index in list(self._positions())[position]]
+        return self._move(self._index(position))
+
+    # Replaces the move at 'position' (which is then the ScrabbleMove of the list)
+    def __setitem__(self, position, move: ScrabbleMove):
+        if isinstance(position, slice):
+            raise TypeError("MoveList does not support slice assignment")
+        index = self._index(position)
+        self._rows[index] = move.row
+        self._cols[index] = move.col
+        self._across[index] = move.how == "across"
+        self._words[index] = self._store(move.word)
+        self._letters[index] = self._store("".join(move.letters))
+        self._blanks[index] = self._store(tuple(move.blank_positions))
+        if self._handed is None:
+            self._handed = {}
+        self._handed[index] = move
+        self._sync_scores()
+
+    def __delitem__(self, position):
+        if isinstance(position, slice):
+            raise TypeError("MoveList does not support slice deletion")
+        position = self._position(position)
+        index = self._index(position)
+        for column in (self._rows, self._cols, self._across, self._scores, self._words, self._letters, self._blanks):
+            del column[index]
+        if self._adjusted is not None:
+            del self._adjusted[index]
+        if self._handed:
+            self._handed = {i - (i > index): move for i, move in self._handed.items() if i != index}
+        if self._order is not None:
+            del self._order[position]
+            self._order = array('l', (i - (i > index) for i in self._order))
+
+    def __iter__(self):
+        for index in self._positions():
+            yield self._move(index)
+
+    def pop(self, position: int = -1) -> ScrabbleMove:
+        move = self[position]
+        del self[position]
+        return move
+
+    # Position of 'move' (the ScrabbleMove of the list, or a move with the same placement)
+    def index(self, move: ScrabbleMove) -> int:
+        for position, index in enumerate(self._positions()):
+            if self._matches(index, move):
+                return position
+        raise ValueError("move is not in MoveList")
+
+    def remove(self, move: ScrabbleMove):
+        del self[self.index(move)]
+
+    # Score of the move at 'position' (adjusted, if it was)
+    def score(self, position: int):
+        index = self._index(position)
+        if self._handed is not None and index in self._handed:
+            return self._handed[index].score
+        column = self._adjusted if self._adjusted is not None else self._scores
+        return column[index]
+
+    def set_score(self, position: int, score):
+        index = self._index(position)
+        if self._adjusted is None:
+            self._adjusted = array('d', self._scores)
+        self._adjusted[index] = score
+        if self._handed is not None and index in self._handed:
+            self._handed[index].score = score
+
+    def adjust_score(self, position: int, delta):
+        self.set_score(position, self.score(position) + delta)
+
+    # Sorts by score like list.sort (stable). With a 'key', the key is computed from ScrabbleMoves
+    def sort(self, key=None, reverse: bool = False):
+        if key is None:
+            column = self._score_column()
+            self._order = array('l', sorted(self._positions(), key=column.__getitem__, reverse=reverse))
+        else:
+            self._order = array('l', sorted(self._positions(), key=lambda index: key(self._move(index)),
+                                            reverse=reverse))
+
+    # The (up to) k highest scoring moves, sorted by score from high to low (the same as
+    # the first k moves after sort(reverse=True))
+    def top(self, k: int) -> list:
+        column = self._score_column()
+        return [self._move(index) for index in nlargest(k, self._positions(), key=column.__getitem__)]
+
+    # The packed columns for vectorised code (see ScrabbleFeatures), in the order in which the
+    # moves were added: "row", "col", "across" (1 or 0), "score" (adjusted, if any), and
+    # "word", "letters" and "blanks" as indexes into "storage". "order" holds the indexes of
+    # the moves in their current order (None if the list has not been sorted)
+    def columns(self) -> dict:
+        return {"row": self._rows, "col": self._cols, "across": self._across, "score": self._score_column(),
+                "word": self._words, "letters": self._letters, "blanks": self._blanks,
+                "storage": self._storage, "order": self._order}
+
+    def copy(self) -> "MoveList":
+        self._sync_scores()
+        ret = MoveList()
+        ret._rows = array('b', self._rows)
+        ret._cols = array('b', self._cols)
+        ret._across = array('b', self._across)
+        ret._scores = array('l', self._scores)
+        ret._words = array('l', self._words)
+        ret._letters = array('l', self._letters)
+        ret._blanks = array('l', self._blanks)
+        ret._adjusted = array('d', self._adjusted) if self._adjusted is not None else None
+        ret._order = array('l', self._order) if self._order is not None else None
+        ret._storage = list(self._storage)
+        ret._storage_index = dict(self._storage_index)
+        return ret
+
+
 #
 # Load Scrabble Word Set
 #
@@ -37,7 +283,8 @@ def load_word_set(filename: str) -> set:
 #
 # Build utility dictionary with word signatures
 # The keys of the dictionary are sorted letter sequences
-# The entries are all words that match a given key
+# The entries are all words that match a given key (in alphabetical order, so that
+# the order does not depend on how the set of legal words is hashed)
 #
 def build_word_signatures(legal_words: set, num_blanks: int) -> dict:
 
@@ -48,7 +295,8 @@ def build_word_signatures(legal_words: set, num_blanks: int) -> dict:
 
     print("Building word signatures with up to " + str(num_blanks) + " blank pieces")
 
-    for word in legal_words:
+    words = sorted(legal_words)
+    for word in words:
         sorted_word = ''.join(sorted(word))
         if sorted_word in sorted_letters.keys():
             sorted_letters[sorted_word].append(word)
@@ -56,7 +304,7 @@ def build_word_signatures(legal_words: set, num_blanks: int) -> dict:
             sorted_letters[sorted_word] = [word]
 
     if num_blanks == 1:
-        for word in legal_words:
+        for word in words:
             sorted_word = ''.join(sorted(word))
             for i in range(0, len(word)):
                 new_key_one = "*" + sorted_word[:i] + sorted_word[i+1:]
@@ -66,7 +314,7 @@ def build_word_signatures(legal_words: set, num_blanks: int) -> dict:
                     sorted_letters[new_key_one] = [word]
 
     elif num_blanks == 2:
-        for word in legal_words:
+        for word in words:
             #print("--"+word)
             sorted_word = ''.join(sorted(word))
             for i in range(0, len(word)):
@@ -303,7 +551,96 @@ def score_play_down(word: str, row: int, col: int, board: list,
 
 
 #
-# Function to generate all unique non-empty subsets of a given iterable
+# The cross-checks of a board, which ScrabbleBoard keeps up to date move by move (see
+# ScrabbleDawg.compute_cross_checks: for every empty square with a tile above or below it,
+# the letters that form a legal word down and the value of the tiles of that word; the
+# cross-checks for playing down are stored transposed). With them, a candidate word is
+# scored in one walk over its squares, instead of walking every cross word it forms and
+# looking it up in the legal words
+#
+class CrossChecks:
+
+    __slots__ = ("board", "board_t", "multipliers", "multipliers_t", "checks_across", "sums_across",
+                 "checks_down", "sums_down")
+
+    def __init__(self, board: list, board_t: list, multipliers: list, multipliers_t: list,
+                 checks_across: list, sums_across: list, checks_down: list, sums_down: list):
+        self.board = board
+        self.board_t = board_t
+        self.multipliers = multipliers
+        self.multipliers_t = multipliers_t
+        self.checks_across = checks_across
+        self.sums_across = sums_across
+        self.checks_down = checks_down
+        self.sums_down = sums_down
+
+    # Same as score_play_across/score_play_down with the legality check, for a 'word' that is
+    # legal itself (as the candidate words of the move generators are): -1 if it can't be played
+    def score(self, word: str, row: int, col: int, how: str, letter_values: dict, legal_words: set) -> int:
+        if how == "across":
+            line, multipliers, checks, sums, start = self.board[row], self.multipliers[row], \
+                self.checks_across[row], self.sums_across[row], col
+        else:
+            line, multipliers, checks, sums, start = self.board_t[col], self.multipliers_t[col], \
+                self.checks_down[col], self.sums_down[col], row
+        end = start + len(word)
+        if end > 15:
+            return -1
+
+        base_score = 0
+        word_multiplier = 1
+        cross_score = 0
+        letters_used = 0
+        for i in range(0, len(word)):
+            letter = word[i]
+            square = start + i
+            letter_on_board = line[square]
+            if letter_on_board != ' ':
+                if letter_on_board != letter:
+                    return -1
+                base_score += letter_values[letter]
+                continue
+            check = checks[square]
+            if check is not None and letter not in check:
+                return -1
+            letters_used += 1
+            value = letter_values[letter]
+            multiplier = multipliers[square]
+            square_multiplier = 1
+            if multiplier == 2 or multiplier == 3:
+                value *= multiplier
+            elif multiplier == 4:
+                square_multiplier = 2
+            elif multiplier == 6:
+                square_multiplier = 3
+            base_score += value
+            word_multiplier *= square_multiplier
+            if check is not None:
+                cross_score += (sums[square] + value) * square_multiplier
+
+        # Tiles that extend the word at either end
+        first = start
+        while first > 0 and line[first-1] != ' ':
+            first -= 1
+        last = end
+        while last < 15 and line[last] != ' ':
+            last += 1
+        if first < start or last > end:
+            if "".join(line[first:start]) + word + "".join(line[end:last]) not in legal_words:
+                return -1
+            base_score += sum(letter_values[letter] for letter in line[first:start]) + \
+                sum(letter_values[letter] for letter in line[end:last])
+
+        score = base_score * word_multiplier + cross_score
+        if letters_used == 7:
+            score += 50
+        return score
+
+
+#
+# Function to generate all unique non-empty subsets of a given iterable, as a list of
+# sorted tuples ordered by size and then alphabetically (the move generators visit the
+# subsets in this order, which must not depend on string hashing)
 #
 def non_empty_powerset(iterable):
     xs = list(iterable)
@@ -311,7 +648,7 @@ def non_empty_powerset(iterable):
     for n in range(1, len(xs)+1):
         for el in combinations(xs, n):
             ls.add(tuple(sorted(el)))
-    return ls
+    return sorted(ls, key=lambda subset: (len(subset), subset))
 
 
 #
@@ -323,26 +660,19 @@ def all_unique(x):
 
 
 #
-# Given a Scrabble board and a string of letters, this function calculates a list of
-# tuples that represent all possible Scrabble moves.
-# The tuples are structured
-#   (score, starting row, starting column, "down"/"across", word, letters used)
+# Pre-calculation for move generation on a board, which significantly speeds up
+# the solution finding. It generates two nested lists of the structure
+#    list -> num_letters -> (rows cols letterset)
+# that is to be interpreted as follows:
+#  - If I place num_letters on the board, in which (row,col) coordinates can I do that
+#    to generate a legal move?
+#  - Assuming I play num_letters letters in a given row and column, what letters
+#    would need to be incorporated (because they are already on the board)?
+# We generate two nested lists, one for playing words across and one for
+# playing words down
 #
-def find_all_moves(board: list, letters: str, legal_words: set,
-                   board_multipliers: list, letter_values: dict, word_signatures: dict) -> list:
-
-    # The following part is a pre-calculation that significantly speeds up the solution
-    # finding. It generates two nested lists of the structure
-    #    list -> num_letters -> (rows cols letterset)
-    # that is to be interpreted as follows:
-    #  - If I place num_letters on the board, in which (row,col) coordinates can I do that
-    #    to generate a legal move?
-    #  - Assuming I play num_letters letters in a given row and column, what letters
-    #    would need to be incorporated (because they are already on the board)?
-    # We generate two nested lists, one for playing words across and one for
-    # playing words down
-
-    max_num_letters = len(letters)
+def find_placements(board: list, max_num_letters: int) -> tuple:
+
     potential_plays_across = []
     potential_plays_down = []
     for i in range(0, max_num_letters+1):
@@ -430,155 +760,567 @@ def find_all_moves(board: list, letters: str, legal_words: set,
                         letterset.append(board[working_row][col])
                         working_row += 1
 
+    return potential_plays_across, potential_plays_down
+
+
+#
+# Placements from a precomputed ScrabbleAnalysis.BoardAnalysis of the board if there is
+# one (it covers racks of any size), otherwise from find_placements
+#
+def _placements(board: list, max_num_letters: int, analysis) -> tuple:
+    if analysis is None:
+        return find_placements(board, max_num_letters)
+    return analysis.placements_across, analysis.placements_down
+
+
+#
+# _placements, timed and counted in an optional ScrabbleStats.EngineStats
+#
+def _timed_placements(board: list, max_num_letters: int, analysis, stats) -> tuple:
+    if stats is None:
+        return _placements(board, max_num_letters, analysis)
+    start = perf_counter()
+    potential_plays_across, potential_plays_down = _placements(board, max_num_letters, analysis)
+    stats.add_time("placements", perf_counter() - start)
+    stats.count("placements", sum(len(potential_plays_across[i]) + len(potential_plays_down[i])
+                                  for i in range(1, max_num_letters + 1)))
+    return potential_plays_across, potential_plays_down
+
+
+#
+# Score-optimal designation of the blanks in a word that is played at (row, col) across
+# (or down if 'across' is False). Returns (penalty, blank_positions), where the penalty
+# is the number of points the blanks cost compared to playing real letters.
+#
+# A blank that stands for letter x at position j of the word costs
+#    (value of x - value of a blank) * letter multiplier of j * word multiplier of the word
+# plus a cross word term that only depends on x (it is evaluated at the first square of
+# the word). So the designation is a small assignment problem: every blank picks a
+# position holding its letter, no two blanks share one, and the sum of the position
+# costs is minimal. With at most two blanks this is solved directly. Among equally good
+# designations the first one in the order of the position lists is chosen.
+# An optional ScrabbleStats.EngineStats counts the combinations of positions to choose from
+#
+def best_blank_placement(word: str, row: int, col: int, across: bool, additional_letters: list,
+                         letters_to_place: list, board: list, board_multipliers: list,
+                         letter_values: dict, legal_words: set, stats=None) -> tuple:
+
+    # What letters do the blanks represent?
+    blank_meaning = list(word)
+    for char in additional_letters:
+        blank_meaning.remove(char)
+    for char in letters_to_place:
+        if char != '*':
+            blank_meaning.remove(char)
+
+    # Cost of a blank on every empty square of the word, and the word multiplier
+    d_row, d_col = (0, 1) if across else (1, 0)
+    costs = dict()
+    word_multiplier = 1
+    for j in range(0, len(word)):
+        if board[row + j * d_row][col + j * d_col] == ' ':
+            multiplier = board_multipliers[row + j * d_row][col + j * d_col]
+            if multiplier == 4 or multiplier == 6:
+                word_multiplier *= multiplier // 2
+            letter_multiplier = multiplier if multiplier == 2 or multiplier == 3 else 1
+            costs[j] = (letter_values[word[j]] - letter_values['*']) * letter_multiplier
+
+    # In which positions could I play the blanks, and what does it cost in cross words?
+    blank_positions = []
+    cross_penalty = 0
+    score_cross_word = score_word_down if across else score_word_across
+    for letter in blank_meaning:
+        blank_positions.append([j for j in costs if word[j] == letter])
+        cross_penalty += score_cross_word(letter, row, col, board, board_multipliers,
+                                          letter_values, legal_words, False) \
+            - score_cross_word('*', row, col, board, board_multipliers, letter_values, legal_words, False)
+
+    # Blanks for different letters never compete for a position, two blanks for the
+    # same letter take the cheapest pair of distinct positions
+    same_letter = len(blank_positions) == 2 and blank_meaning[0] == blank_meaning[1]
+    if stats is not None:
+        if same_letter:
+            combinations_tried = len(blank_positions[0]) * (len(blank_positions[0]) - 1) // 2
+        else:
+            combinations_tried = 1
+            for positions in blank_positions:
+                combinations_tried *= len(positions)
+        stats.count("blank_combinations", combinations_tried)
+    if same_letter:
+        positions = blank_positions[0]
+        cheapest = sorted(costs[j] for j in positions)
+        best_cost = cheapest[0] + cheapest[1]
+        for first in positions:
+            second = next((j for j in positions if j != first and costs[first] + costs[j] == best_cost), None)
+            if second is not None:
+                best_placement = [first, second]
+                break
+    else:
+        best_placement = [min(positions, key=lambda j: costs[j]) for positions in blank_positions]
+
+    return sum(costs[j] for j in best_placement) * word_multiplier + cross_penalty, best_placement
+
+
+#
+# The candidate words at a placement that uses the rack letters 'letters_to_place' plus
+# the letters already on the board ('additional_letters'), or None if there are none
+#
+def _signature_words(additional_letters: list, letters_to_place: list, word_signatures: dict, stats=None):
+    letters_to_use = "".join(sorted(letters_to_place + additional_letters))
+    if stats is None:
+        return word_signatures.get(letters_to_use)
+    start = perf_counter()
+    potential_words = word_signatures.get(letters_to_use)
+    stats.add_time("signature_lookups", perf_counter() - start)
+    stats.count("signature_misses" if potential_words is None else "signature_hits")
+    return potential_words
+
+
+#
+# All moves at (row, col) ('how' is "across" or "down") that use the rack letters
+# 'letters_to_place' plus the letters already on the board ('additional_letters'),
+# as a generator
+#
+def _placement_moves(row: int, col: int, how: str, additional_letters: list, letters_to_place: list,
+                     num_blanks: int, board: list, legal_words: set, board_multipliers: list,
+                     letter_values: dict, word_signatures: dict, stats=None, cross_checks=None):
+    potential_words = _signature_words(additional_letters, letters_to_place, word_signatures, stats)
+    if potential_words is None:
+        return
+    for potential_word in potential_words:
+        new_move = _score_candidate(row, col, how, potential_word, additional_letters, letters_to_place,
+                                    num_blanks, board, legal_words, board_multipliers, letter_values, stats,
+                                    cross_checks)
+        if new_move is not None:
+            yield new_move
+
+
+#
+# Scores the candidate words of a batch of placements (row, col, how, words) with a
+# ScrabbleScoring.BatchScorer with cross-checks, the same as score_play_across/score_play_down
+# with the legality check (the words come from the dictionary and span the whole run of
+# tiles of their placement, so only their cross words need to be checked). 'sources' holds
+# the letters on the board and the rack letters placed by every word of every placement.
+# Yields the position of the placement in the batch, the position of the word in the
+# placement and the ScrabbleMove of every legal candidate, in the order of the batch
+#
+def _batch_moves(placements: list, sources: list, scorer, board: list, legal_words: set, board_multipliers: list,
+                 letter_values: dict, stats=None):
+    start_time = perf_counter() if stats is not None else 0
+    scores = scorer.score_placements(placements, True)
+    playable = (scores != -1).nonzero()[0].tolist()
+    if stats is not None:
+        stats.add_time("scoring", perf_counter() - start_time)
+        stats.count("candidates_scored", len(scores))
+        stats.count("candidates_illegal", len(scores) - len(playable))
+    placement_number = 0
+    start = 0  # Position of the first word of the placement in the batch
+    for position in playable:
+        while position >= start + len(placements[placement_number][3]):
+            start += len(placements[placement_number][3])
+            placement_number += 1
+        row, col, how, words = placements[placement_number]
+        additional_letters, rack_letters = sources[placement_number]
+        letters_to_place = list(rack_letters[position - start])
+        yield placement_number, position - start, \
+            _candidate_move(row, col, how, words[position - start], int(scores[position]), additional_letters,
+                            letters_to_place, letters_to_place.count('*'), board, legal_words, board_multipliers,
+                            letter_values, stats)
+
+
+#
+# Score a candidate word at (row, col), returns a ScrabbleMove or None if it can't be played.
+# With the CrossChecks of the board, the cross words are checked and scored with them
+#
+def _score_candidate(row: int, col: int, how: str, word: str, additional_letters: list, letters_to_place: list,
+                     num_blanks: int, board: list, legal_words: set, board_multipliers: list, letter_values: dict,
+                     stats=None, cross_checks: CrossChecks = None):
+    if cross_checks is not None:
+        start = perf_counter() if stats is not None else 0
+        score = cross_checks.score(word, row, col, how, letter_values, legal_words)
+    else:
+        score_play = score_play_across if how == "across" else score_play_down
+        start = perf_counter() if stats is not None else 0
+        score = score_play(word, row, col, board, board_multipliers, letter_values, legal_words, True)
+    if stats is not None:
+        stats.add_time("scoring", perf_counter() - start)
+        stats.count("candidates_scored")
+        if score == -1:
+            stats.count("candidates_illegal")
+    if score == -1:
+        return None
+    return _candidate_move(row, col, how, word, score, additional_letters, letters_to_place, num_blanks,
+                           board, legal_words, board_multipliers, letter_values, stats)
+
+
+#
+# The ScrabbleMove of a legal candidate word with the given score (before the blanks are designated)
+#
+def _candidate_move(row: int, col: int, how: str, word: str, score: int, additional_letters: list,
+                    letters_to_place: list, num_blanks: int, board: list, legal_words: set,
+                    board_multipliers: list, letter_values: dict, stats=None):
+    if num_blanks == 0:
+        return ScrabbleMove(row, col, how, word, letters_to_place, score)
+
+    # If we have blanks, we need to re-evaluate the score
+    # We'll assume that the player always wants to place the
+    # blanks score-optimally (as there's no advantage to doing it
+    # any other way)
+    if stats is None:
+        penalty, blank_placement = best_blank_placement(word, row, col, how == "across", additional_letters,
+                                                        letters_to_place, board, board_multipliers,
+                                                        letter_values, legal_words)
+    else:
+        start = perf_counter()
+        penalty, blank_placement = best_blank_placement(word, row, col, how == "across", additional_letters,
+                                                        letters_to_place, board, board_multipliers,
+                                                        letter_values, legal_words, stats)
+        stats.add_time("blanks", perf_counter() - start)
+        stats.count("blank_designations")
+    new_move = ScrabbleMove(row, col, how, word, letters_to_place, score - penalty)
+    new_move.blank_positions = blank_placement
+    return new_move
+
+
+#
+# The (word, rack letters used) at a placement with the letters on the board 'additional_letters'
+# that use 'num_letters' of the rack 'letters', from an anagram query. 'queries' holds the
+# results of earlier queries (sorted board letters -> number of rack letters used -> words)
+#
+def _anagram_words(additional_letters: list, num_letters: int, letters: str,
+                   anagram_index: ScrabbleAnagram.AnagramIndex, queries: dict, stats=None) -> list:
+    required = "".join(sorted(additional_letters))
+    by_size = queries.get(required)
+    if by_size is None:
+        start = perf_counter() if stats is not None else 0
+        by_size = [[] for i in range(0, len(letters) + 1)]
+        for word, letters_used in anagram_index.anagrams(required, letters):
+            by_size[len(letters_used)].append((word, letters_used))
+        queries[required] = by_size
+        if stats is not None:
+            stats.add_time("signature_lookups", perf_counter() - start)
+    if stats is not None:
+        stats.count("signature_hits" if len(by_size[num_letters]) > 0 else "signature_misses")
+    return by_size[num_letters]
+
+
+#
+# Move generation with an anagram index instead of word signatures: for every placement,
+# the words that contain the letters on the board plus some of the rack letters come
+# from one query of the index, which is shared by all placements that need the same
+# board letters. Every (placement, word, rack letters used) is generated once
+#
+def _iter_anagram_moves(board: list, letters: str, legal_words: set, board_multipliers: list,
+                        letter_values: dict, anagram_index: ScrabbleAnagram.AnagramIndex, analysis=None,
+                        stats=None, scorer=None, cross_checks=None):
+
+    potential_plays_across, potential_plays_down = _timed_placements(board, len(letters), analysis, stats)
+
+    queries = dict()
+    batch = []  # Placements and their words (and their sources) to score in one batch, if there is a scorer
+    sources = []
+    for how, potential_plays in (("across", potential_plays_across), ("down", potential_plays_down)):
+        for num_letters in range(1, len(letters) + 1):
+            for row, col, additional_letters in potential_plays[num_letters]:
+                words = _anagram_words(additional_letters, num_letters, letters, anagram_index, queries, stats)
+                if scorer is not None:
+                    if len(words) > 0:
+                        batch.append((row, col, how, [word for word, letters_used in words]))
+                        sources.append((additional_letters, [letters_used for word, letters_used in words]))
+                    continue
+                for word, letters_used in words:
+                    new_move = _score_candidate(row, col, how, word, additional_letters, list(letters_used),
+                                                letters_used.count('*'), board, legal_words,
+                                                board_multipliers, letter_values, stats, cross_checks)
+                    if new_move is not None:
+                        yield new_move
+
+    if scorer is not None:
+        for placement_number, word_number, move in _batch_moves(batch, sources, scorer, board, legal_words,
+                                                                board_multipliers, letter_values, stats):
+            yield move
+
+
+#
+# Given a Scrabble board and a string of letters, this function generates all possible
+# Scrabble moves as ScrabbleMoves, one at a time (in the same order as find_all_moves)
+#
+# 'word_signatures' can be the dictionary from build_word_signatures or any object with the
+# same 'get' method (e.g. a compiled ScrabbleIndex.SignatureIndex). If it is a
+# ScrabbleAnagram.AnagramIndex, the rack subsets are not enumerated but found by
+# anagram queries (see _iter_anagram_moves), in which case the moves come placement by placement
+#
+# 'analysis' is an optional ScrabbleAnalysis.BoardAnalysis of the board, which saves
+# the placement pre-calculation. 'stats' is an optional ScrabbleStats.EngineStats that
+# records the time and counters of the generator phases. 'scorer' is an optional
+# ScrabbleScoring.BatchScorer with the cross-checks of the board, with which the
+# candidate words of all placements are scored in one batch (same moves and scores, but
+# then all candidates are looked up and scored before the first move is yielded).
+# Without a scorer, 'cross_checks' is an optional CrossChecks of the board, with which
+# each candidate word is checked and scored without walking its cross words
+#
+def iter_all_moves(board: list, letters: str, legal_words: set,
+                   board_multipliers: list, letter_values: dict, word_signatures: dict, analysis=None,
+                   stats=None, scorer=None, cross_checks=None):
+
+    if stats is not None:
+        stats.count("calls")
+
+    if isinstance(word_signatures, ScrabbleAnagram.AnagramIndex):
+        yield from _iter_anagram_moves(board, letters, legal_words, board_multipliers, letter_values,
+                                       word_signatures, analysis, stats, scorer, cross_checks)
+        return
+
+    potential_plays_across, potential_plays_down = _timed_placements(board, len(letters), analysis, stats)
+
     # Now that the pre-computation is complete, we can iterate over all
     # non-empty subset of letters that we have ('letterset') and see, for
     # each subset, if there are valid plays using those letters
-    solutions = []
+    batch = []  # Placements and their words (and their sources) to score in one batch, if there is a scorer
+    sources = []
     for letterset in non_empty_powerset(letters):
         letters_to_place = list(letterset)
         num_letters = len(letterset)
         num_blanks = letterset.count('*')
-        #Across_eval
-        for placement_tuple in potential_plays_across[num_letters]:
-            row = placement_tuple[0]
-            col = placement_tuple[1]
-            additional_letters = list(placement_tuple[2])
-            letters_to_use = "".join(sorted(letters_to_place + additional_letters))
-            if letters_to_use in word_signatures.keys():
-                for potential_word in word_signatures[letters_to_use]:
-                    score = score_play_across(potential_word, row, col, board,
-                                              board_multipliers, letter_values, legal_words, True)
-                    if score > -1:
-                        if num_blanks == 0:
-                            new_move = ScrabbleMove(row, col, "across", potential_word, letters_to_place, score)
-                            solutions.append(new_move)
-                        else:
-                            #If we have blanks, we need to re-evaluate the score
-                            #We'll assume that the player always wants to place the
-                            #blanks score-optimally (as there's no advantage to doing it
-                            # any other way)
-                            #Steps:
-                            # 1) What letters do the blanks represent?
-                            blank_meaning = list(potential_word)
-                            for char in additional_letters:
-                                blank_meaning.remove(char)
-                            for char in letters_to_place:
-                                if char != '*':
-                                    blank_meaning.remove(char)
-                            # 2) In which position could I play the blanks?
-                            blank_positions = []
-                            for i in range(0, len(blank_meaning)):
-                                blank_positions.append([])
-                                for j in range(0, len(potential_word)):
-                                    if potential_word[j] == blank_meaning[i] and board[row][col + j] == ' ':
-                                        blank_positions[i].append(j)
-                            # 3) evaluate each position to find the optimal one
-                            best_penalty = 100000
-                            best_placement = []
-                            old_across_score = score_word_across(potential_word, row, col, board, board_multipliers,
-                                                                 letter_values, legal_words, False)
-                            for blank_placement in product(*blank_positions):
-                                if all_unique(blank_placement):
-
-                                    word_with_blanks = list(potential_word)
-                                    for pos in blank_placement:
-                                        word_with_blanks[pos] = '*'
-                                    new_across_score = score_word_across(''.join(word_with_blanks), row, col,
-                                                                         board, board_multipliers,
-                                                                         letter_values, legal_words, False)
-
-                                    current_penalty = old_across_score - new_across_score
-
-                                    if current_penalty < best_penalty:
-                                        for pos in blank_placement:
-                                            current_penalty += score_word_down(potential_word[pos], row, col,
-                                                                               board, board_multipliers,
-                                                                               letter_values, legal_words, False) \
-                                                - score_word_down('*', row, col,
-                                                                  board, board_multipliers,
-                                                                  letter_values, legal_words, False)
-
-                                    if current_penalty < best_penalty:
-                                        best_penalty = current_penalty
-                                        best_placement = list(blank_placement)
-                            # Done, now add the move
-                            new_move = ScrabbleMove(row, col, "across", potential_word, letters_to_place,
-                                                    score - best_penalty)
-                            new_move.blank_positions = list(best_placement)
-                            solutions.append(new_move)
-
-        #Down_eval
-        for placement_tuple in potential_plays_down[num_letters]:
-            #if num_letters == 7:
-            #    print(str(len(letterset)) + " down: " + str(placement_tuple))
-            row = placement_tuple[0]
-            col = placement_tuple[1]
-            additional_letters = list(placement_tuple[2])
-            letters_to_use = "".join(sorted(letters_to_place + additional_letters))
-            if letters_to_use in word_signatures.keys():
-                for potential_word in word_signatures[letters_to_use]:
-                    score = score_play_down(potential_word, row, col, board,
-                                            board_multipliers, letter_values, legal_words, True)
-                    if score > -1:
-                        if num_blanks == 0:
-                            new_move = ScrabbleMove(row, col, "down", potential_word, letters_to_place, score)
-                            solutions.append(new_move)
-                        else:
-                            #If we have blanks, we need to re-evaluate the score
-                            #We'll assume that the player always wants to place the
-                            #blanks score-optimally (as there's no advantage to doing it
-                            # any other way)
-                            #Steps:
-                            # 1) What letters do the blanks represent?
-                            blank_meaning = list(potential_word)
-                            for char in additional_letters:
-                                blank_meaning.remove(char)
-                            for char in letters_to_place:
-                                if char != '*':
-                                    blank_meaning.remove(char)
-                            # 2) In which position could I play the blanks?
-                            blank_positions = []
-                            for i in range(0, len(blank_meaning)):
-                                blank_positions.append([])
-                                for j in range(0, len(potential_word)):
-                                    if potential_word[j] == blank_meaning[i] and board[row + j][col] == ' ':
-                                        blank_positions[i].append(j)
-                            # 3) evaluate each position to find the optimal one
-                            best_penalty = 100000
-                            best_placement = []
-                            old_down_score = score_word_down(potential_word, row, col, board, board_multipliers,
-                                                             letter_values, legal_words, False)
-                            for blank_placement in product(*blank_positions):
-                                if all_unique(blank_placement):
-                                    word_with_blanks = list(potential_word)
-
-                                    for pos in blank_placement:
-                                        word_with_blanks[pos] = '*'
-                                    new_down_score = score_word_down(''.join(word_with_blanks), row, col,
-                                                                     board, board_multipliers,
-                                                                     letter_values, legal_words, False)
-
-                                    current_penalty = old_down_score - new_down_score
-
-                                    if current_penalty < best_penalty:
-                                        for pos in blank_placement:
-                                            current_penalty += score_word_across(potential_word[pos], row, col,
-                                                                                 board, board_multipliers,
-                                                                                 letter_values, legal_words, False) \
-                                                - score_word_across('*', row, col,
-                                                                    board, board_multipliers,
-                                                                    letter_values, legal_words, False)
-
-                                    if current_penalty < best_penalty:
-                                        best_penalty = current_penalty
-                                        best_placement = list(blank_placement)
-                            # Done, now add the move
-                            new_move = ScrabbleMove(row, col, "down", potential_word, letters_to_place,
-                                                    score - best_penalty)
-                            new_move.blank_positions = list(best_placement)
-                            solutions.append(new_move)
-
-    return solutions
+        if stats is not None:
+            stats.count("subsets")
+        for how, potential_plays in (("across", potential_plays_across), ("down", potential_plays_down)):
+            for row, col, additional_letters in potential_plays[num_letters]:
+                if scorer is None:
+                    yield from _placement_moves(row, col, how, list(additional_letters), letters_to_place,
+                                                num_blanks, board, legal_words, board_multipliers, letter_values,
+                                                word_signatures, stats, cross_checks)
+                    continue
+                words = _signature_words(list(additional_letters), letters_to_place, word_signatures, stats)
+                if words is not None:
+                    batch.append((row, col, how, words))
+                    sources.append((list(additional_letters), [letters_to_place] * len(words)))
+
+    if scorer is not None:
+        for placement_number, word_number, move in _batch_moves(batch, sources, scorer, board, legal_words,
+                                                                board_multipliers, letter_values, stats):
+            yield move
+
+
+#
+# Given a Scrabble board and a string of letters, this function calculates a MoveList of
+# all possible Scrabble moves (in the order of iter_all_moves)
+#
+def find_all_moves(board: list, letters: str, legal_words: set,
+                   board_multipliers: list, letter_values: dict, word_signatures: dict, analysis=None,
+                   stats=None, scorer=None, cross_checks=None) -> MoveList:
+    return MoveList(iter_all_moves(board, letters, legal_words, board_multipliers, letter_values, word_signatures,
+                                   analysis, stats, scorer, cross_checks))
+
+
+#
+# Optimistic upper bound on the score of any move that places 'num_letters' letters
+# from the rack at a placement found by find_placements, i.e. the word starts at
+# (row, col) and covers the next 'num_letters' empty squares across (or down if
+# 'across' is False). 'rack_values' are the values of the rack tiles, sorted from
+# high to low, with blanks counted as the most valuable letter (the score of a move
+# with blanks never exceeds the score of the same move with real letters)
+#
+def placement_score_bound(row: int, col: int, num_letters: int, across: bool, board: list,
+                          board_multipliers: list, letter_values: dict, rack_values: list) -> int:
+
+    if across:
+        d_row, d_col, c_row, c_col = 0, 1, 1, 0
+    else:
+        d_row, d_col, c_row, c_col = 1, 0, 0, 1
+
+    # Walk along the main word and collect, for every empty square, its letter and word
+    # multiplier as well as the tiles and multiplier of the cross word it forms
+    fixed_score = 0
+    word_multiplier = 1
+    squares = []
+    letters_placed = 0
+    r, c = row, col
+    while r < 15 and c < 15 and (letters_placed < num_letters or board[r][c] != ' '):
+        if board[r][c] != ' ':
+            fixed_score += letter_values[board[r][c]]
+        else:
+            letters_placed += 1
+            multiplier = board_multipliers[r][c]
+            letter_multiplier = multiplier if multiplier in (2, 3) else 1
+            square_word_multiplier = multiplier // 2 if multiplier in (4, 6) else 1
+            word_multiplier *= square_word_multiplier
+            cross_sum = 0
+            has_cross_word = False
+            for sign in (-1, 1):
+                cr, cc = r + sign * c_row, c + sign * c_col
+                while 0 <= cr < 15 and 0 <= cc < 15 and board[cr][cc] != ' ':
+                    cross_sum += letter_values[board[cr][cc]]
+                    has_cross_word = True
+                    cr, cc = cr + sign * c_row, cc + sign * c_col
+            squares.append((letter_multiplier, square_word_multiplier if has_cross_word else 0, cross_sum))
+        r, c = r + d_row, c + d_col
+
+    # Every letter counts in the main word and (possibly) in its cross word, so pair the
+    # highest rack values with the highest total weights
+    bound = fixed_score * word_multiplier
+    weights = []
+    for letter_multiplier, cross_multiplier, cross_sum in squares:
+        bound += cross_sum * cross_multiplier
+        weights.append(letter_multiplier * (word_multiplier + cross_multiplier))
+    weights.sort(reverse=True)
+    for weight, value in zip(weights, rack_values):
+        bound += weight * value
+
+    if num_letters == 7:
+        bound += 50
+
+    return bound
+
+
+#
+# The candidate words at a placement of best_moves, as (group number, words, rack letters
+# used by every word), where the groups are the rack subsets of 'subsets' (by number of
+# letters) that have words, or one group of all words of an anagram query
+#
+def _placement_candidates(additional_letters: list, num_letters: int, subsets: list, letters: str,
+                          word_signatures: dict, queries: dict, stats=None) -> list:
+    if isinstance(word_signatures, ScrabbleAnagram.AnagramIndex):
+        words = _anagram_words(additional_letters, num_letters, letters, word_signatures, queries, stats)
+        if len(words) == 0:
+            return []
+        return [(0, [word for word, letters_used in words], [letters_used for word, letters_used in words])]
+    ret = []
+    for subset_number, letters_to_place in subsets[num_letters]:
+        words = _signature_words(additional_letters, letters_to_place, word_signatures, stats)
+        if words is not None:
+            ret.append((subset_number, words, [letters_to_place] * len(words)))
+    return ret
+
+
+#
+# The moves of the placements of best_moves ((bound, row, col, number of letters, direction,
+# placement number, letters on the board), sorted by bound) with the rack 'letters', as
+# (position of the placement, group number, word number, move) where the group is as for
+# _placement_candidates and the word number orders the moves of a group. Stops at the first
+# placement for which 'stop' is true given its bound. With a 'scorer', the moves of a
+# growing number of placements are scored in one batch (the moves of placements after the
+# one at which the search stops are scored in vain, but not generated)
+#
+def _moves_by_placement(placements: list, subsets: list, letters: str, stop, board: list, legal_words: set,
+                        board_multipliers: list, letter_values: dict, word_signatures: dict, stats=None,
+                        scorer=None, cross_checks=None):
+    queries = dict()  # Anagram queries, see _anagram_words
+    batch_size = 1 if scorer is None else 32
+    position = 0
+    while position < len(placements) and not stop(placements[position][0]):
+        batch = []
+        sources = []
+        numbers = []  # (position of the placement, group number) of the batch entries
+        for batch_position in range(position, min(position + batch_size, len(placements))):
+            bound, row, col, num_letters, direction, placement_number, additional_letters = placements[batch_position]
+            how = "down" if direction else "across"
+            for group_number, words, rack_letters in _placement_candidates(list(additional_letters), num_letters,
+                                                                           subsets, letters, word_signatures,
+                                                                           queries, stats):
+                if scorer is None:
+                    word_number = 0
+                    for word, letters_to_place in zip(words, rack_letters):
+                        move = _score_candidate(row, col, how, word, list(additional_letters), list(letters_to_place),
+                                                letters_to_place.count('*'), board, legal_words, board_multipliers,
+                                                letter_values, stats, cross_checks)
+                        if move is not None:
+                            yield batch_position, group_number, word_number, move
+                            word_number += 1
+                    continue
+                batch.append((row, col, how, words))
+                sources.append((list(additional_letters), rack_letters))
+                numbers.append((batch_position, group_number))
+
+        current = position
+        if scorer is not None:
+            for batch_number, word_number, move in _batch_moves(batch, sources, scorer, board, legal_words,
+                                                                board_multipliers, letter_values, stats):
+                move_position, group_number = numbers[batch_number]
+                if move_position != current:
+                    current = move_position
+                    if stop(placements[current][0]):
+                        return
+                yield move_position, group_number, word_number, move
+        position = min(position + batch_size, len(placements))
+        if scorer is not None:
+            batch_size = min(2 * batch_size, 128)
+
+
+#
+# Given a Scrabble board and a string of letters, this function returns the (up to) k
+# highest scoring ScrabbleMoves, sorted by score from high to low
+#
+# Instead of generating every move, the placements are visited in order of an optimistic
+# score bound (see placement_score_bound) and the search stops as soon as no remaining
+# placement can beat the k-th best move found so far. Moves that the signature lookup
+# reports more than once (e.g. via different blank keys) are only returned once.
+# Moves with the same score come in the order in which iter_all_moves generates them,
+# so the best move is the first move of find_all_moves after sort(reverse=True).
+# An optional ScrabbleStats.EngineStats records the phases and counters of the search
+# (like for iter_all_moves, the moves generated are the candidates scored minus the
+# illegal ones). With a ScrabbleAnagram.AnagramIndex as 'word_signatures', the words of a
+# placement come from anagram queries as in iter_all_moves. With a 'scorer' (as for
+# iter_all_moves), the candidate words of a growing number of placements are scored in
+# one batch, otherwise one by one (with the optional 'cross_checks' as in iter_all_moves)
+#
+def best_moves(board: list, letters: str, legal_words: set, board_multipliers: list,
+               letter_values: dict, word_signatures: dict, k: int, analysis=None, stats=None,
+               scorer=None, cross_checks=None) -> list:
+
+    if k < 1:
+        return []
+
+    if stats is not None:
+        stats.count("calls")
+
+    potential_plays_across, potential_plays_down = _timed_placements(board, len(letters), analysis, stats)
+
+    max_value = max(letter_values.values())
+    rack_values = sorted((max_value if letter == '*' else letter_values[letter] for letter in letters),
+                         reverse=True)
+    # Rack subsets by size, with their position in the order of iter_all_moves
+    subsets = [[] for i in range(0, len(letters) + 1)]
+    for subset_number, letterset in enumerate(non_empty_powerset(letters)):
+        if stats is not None:
+            stats.count("subsets")
+        subsets[len(letterset)].append((subset_number, list(letterset)))
+
+    placements = []
+    for num_letters in range(1, len(letters) + 1):
+        for direction, potential_plays in ((0, potential_plays_across), (1, potential_plays_down)):
+            for placement_number, (row, col, additional_letters) in enumerate(potential_plays[num_letters]):
+                bound = placement_score_bound(row, col, num_letters, direction == 0, board, board_multipliers,
+                                              letter_values, rack_values)
+                placements.append((bound, row, col, num_letters, direction, placement_number, additional_letters))
+    placements.sort(key=lambda placement: placement[0], reverse=True)
+
+    # Min-heap of (score, tie breaker, move), where the tie breaker is the negated position
+    # (subset, direction, placement, word) of the move in the order of iter_all_moves, so
+    # that the root is the lowest scoring move that was generated last. A duplicate of a
+    # move always comes from the same placement, after the first one
+    anagrams = isinstance(word_signatures, ScrabbleAnagram.AnagramIndex)
+    best = []
+    seen = set()
+    for position, group_number, word_number, move in _moves_by_placement(
+            placements, subsets, letters, lambda bound: len(best) == k and bound < best[0][0], board, legal_words,
+            board_multipliers, letter_values, word_signatures, stats, scorer, cross_checks):
+        key = (move.row, move.col, move.how, move.word, tuple(move.letters))
+        if key in seen:
+            continue
+        seen.add(key)
+        bound, row, col, num_letters, direction, placement_number, additional_letters = placements[position]
+        if anagrams:
+            tie_breaker = (-direction, -num_letters, -placement_number, -word_number)
+        else:
+            tie_breaker = (-group_number, -direction, -placement_number, -word_number)
+        entry = (move.score, tie_breaker, move)
+        if len(best) < k:
+            heappush(best, entry)
+        elif entry[:2] > best[0][:2]:
+            heapreplace(best, entry)
+
+    return [move for score, tie_breaker, move in sorted(best, key=lambda entry: entry[:2], reverse=True)]
 
 
 #
@@ -0,0 +1,106 @@
+#
+# This file contains Zobrist hashing of board positions and a move list cache
+# (a 'transposition table') keyed by position and rack.
+#
+# Every combination of square, letter and blank flag gets a fixed random 64 bit
+# key, and the hash of a position is the XOR of the keys of all tiles on the
+# board. Placing or changing a tile only XORs the keys of that square in and
+# out, so ScrabbleBoard can keep the hash up to date at almost no cost. The keys
+# are generated from a fixed seed, so hashes are the same in every process.
+#
+# The MoveListCache stores generated move lists by (board hash, sorted rack), so
+# that positions that are reached again (in another game of a duplicate-style
+# match, or in another branch of a simulation) don't need move generation again.
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleUtils
+
+from collections import OrderedDict
+import random
+
+ZOBRIST_SEED = 0x5C4A88
+
+
+def _generate_keys() -> list:
+    generator = random.Random(ZOBRIST_SEED)
+    return [generator.getrandbits(64) for i in range(0, 15 * 15 * 26 * 2)]
+
+
+ZOBRIST_KEYS = _generate_keys()
+
+
+#
+# Key of a tile on a square ('letter' is 'A'-'Z', 'blank' tells if the tile is a blank),
+# 0 for an empty square
+#
+def square_key(row: int, col: int, letter: str, blank: bool) -> int:
+    if letter == ' ':
+        return 0
+    return ZOBRIST_KEYS[((row * 15 + col) * 26 + ord(letter) - ord('A')) * 2 + (1 if blank else 0)]
+
+
+#
+# Hash of a board position from scratch (blank locations are marked with 'X')
+#
+def compute_hash(board: list, blank_locations: list) -> int:
+    ret = 0
+    for row in range(0, 15):
+        for col in range(0, 15):
+            ret ^= square_key(row, col, board[row][col], blank_locations[row][col] == 'X')
+    return ret
+
+
+#
+# LRU cache of move lists (ScrabbleUtils.MoveLists), keyed by (board hash, sorted rack,
+# move generator). The size is bounded by the number of lists and by the total number
+# of moves they hold (a cached move takes roughly 30 bytes plus its share of the words).
+# A cache must only be used with one lexicon, as the lexicon is not part of the key
+#
+class MoveListCache:
+
+    def __init__(self, max_entries: int = 4096, max_moves: int = 1000000):
+        self.max_entries = max_entries
+        self.max_moves = max_moves
+        self._entries = OrderedDict()
+        self.num_moves = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(board_hash: int, letters: str, engine: str = "signatures") -> tuple:
+        return board_hash, "".join(sorted(letters)), engine
+
+    # Cached move list (a copy, so that scores can be adjusted and the list sorted) or None
+    def lookup(self, key: tuple) -> ScrabbleUtils.MoveList:
+        moves = self._entries.get(key)
+        if moves is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return moves.copy()
+
+    def store(self, key: tuple, moves: ScrabbleUtils.MoveList):
+        if len(moves) > self.max_moves:
+            return
+        if key in self._entries:
+            self.num_moves -= len(self._entries.pop(key))
+        self._entries[key] = moves.copy() if isinstance(moves, ScrabbleUtils.MoveList) \
+            else ScrabbleUtils.MoveList(moves)
+        self.num_moves += len(moves)
+        while len(self._entries) > self.max_entries or self.num_moves > self.max_moves:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self.num_moves -= len(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self.num_moves = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
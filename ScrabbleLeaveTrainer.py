@@ -0,0 +1,149 @@
+#
+# This script builds the leave table of EquityBot (see ScrabbleLeaves) from self-play.
+#
+# Two bots play games against each other in several worker processes. For every
+# turn before the bag runs out (the rack was full before the move and again before
+# the next move), the leave of the move and the score of the player's next move are
+# recorded. The equity of a leave is the average next move score after keeping it,
+# minus the average over all turns; rare and unseen leaves fall back to the values
+# of their single tiles. The table is written when all games are played.
+#
+# The first table is built from GreedyBot games. With --table, the games are played
+# by EquityBots with an existing table instead, which refines the values for play
+# that already takes leaves into account.
+#
+# Usage:
+#   python ScrabbleLeaveTrainer.py --games 100000 --workers 8
+#   python ScrabbleLeaveTrainer.py --games 100000 --workers 8 --table OSPD4.txt.leaves --output new.leaves
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleAI
+from ScrabbleBot import ScrabbleGame
+from ScrabbleBot import ScrabbleLeaves
+from ScrabbleBot import ScrabbleMatch
+from EquityBot import EquityBot
+from GreedyBot import GreedyBot
+
+from multiprocessing import Pool
+from time import perf_counter
+import argparse
+import random
+
+
+#
+# Bot that plays the moves of another bot and remembers its racks and moves
+#
+class RecordingBot(ScrabbleAI.ScrabbleAI):
+
+    def __init__(self, name, bot: ScrabbleAI.ScrabbleAI):
+        super().__init__(name)
+        self.bot = bot
+        self.lazy_moves = bot.lazy_moves
+        self.turns = []  # (rack, move or None)
+
+    def start_game(self, legal_words: set, word_signatures: dict, engine: str, dawg, letter_values: dict):
+        self.turns = []
+        self.bot.start_game(legal_words, word_signatures, engine, dawg, letter_values)
+
+    def make_move(self, board, letters, solutions):
+        move = self.bot.make_move(board, letters, solutions)
+        self.turns.append((letters, move))
+        return move
+
+
+#
+# Add the recorded turns of a bot to 'stats': the leave of every move that was played
+# from a full rack, if the rack was full again for the next move
+#
+def record_leaves(turns: list, stats: ScrabbleLeaves.LeaveStats):
+    for i in range(0, len(turns) - 1):
+        letters, move = turns[i]
+        next_letters, next_move = turns[i+1]
+        if move is None or len(letters) != 7 or len(next_letters) != 7:
+            continue
+        stats.add(ScrabbleLeaves.leave_of(letters, move.letters), next_move.score if next_move is not None else 0)
+
+
+#
+# Lexicon and leave table of a worker process, set by _init_worker
+#
+_worker_lexicon = None
+_worker_table_file = None
+
+
+def _init_worker(lexicon: tuple, table_file: str):
+    global _worker_lexicon, _worker_table_file
+    _worker_lexicon = lexicon
+    _worker_table_file = table_file
+
+
+#
+# Play the games with the given seeds, returns their LeaveStats
+#
+def _play_games(game_seeds: list) -> ScrabbleLeaves.LeaveStats:
+    legal_words, word_signatures, engine, dawg = _worker_lexicon
+    if _worker_table_file is None:
+        players = [RecordingBot("Player-1", GreedyBot("Greedy-1")), RecordingBot("Player-2", GreedyBot("Greedy-2"))]
+    else:
+        players = [RecordingBot("Player-1", EquityBot("Equity-1", _worker_table_file)),
+                   RecordingBot("Player-2", EquityBot("Equity-2", _worker_table_file))]
+    stats = ScrabbleLeaves.LeaveStats()
+    for game_seed in game_seeds:
+        random.seed(game_seed)
+        game = ScrabbleGame.ScrabbleGame(players, legal_words, word_signatures, engine, dawg)
+        game.play_until_finished(0)
+        for player in players:
+            record_leaves(player.turns, stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the leave table of EquityBot from self-play")
+    parser.add_argument("--dictionary", default="OSPD4.txt")
+    parser.add_argument("--engine", default="signatures", choices=["signatures", "dawg"])
+    parser.add_argument("--games", type=int, default=10000, help="self-play games")
+    parser.add_argument("--workers", type=int, default=1, help="processes that play games")
+    parser.add_argument("--chunk", type=int, default=20, help="games per task of a worker")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--smoothing", type=float, default=25.0,
+                        help="turns with which the tile values of a leave are weighted against its average")
+    parser.add_argument("--table", help="leave table with which EquityBots play the games (default: GreedyBots)")
+    parser.add_argument("--output", help="leave table to write (default: the one of the dictionary)")
+    args = parser.parse_args()
+
+    output = args.output if args.output else ScrabbleLeaves.default_table_file(args.dictionary)
+    lexicon = ScrabbleMatch.load_move_generator(args.dictionary, args.engine)
+
+    rng = random.Random(args.seed)
+    game_seeds = [rng.getrandbits(64) for i in range(0, args.games)]
+    chunks = [game_seeds[i:i + args.chunk] for i in range(0, len(game_seeds), args.chunk)]
+
+    stats = ScrabbleLeaves.LeaveStats()
+    num_games = 0
+    start_time = perf_counter()
+    with Pool(args.workers, _init_worker, (lexicon, args.table)) as pool:
+        for chunk_stats in pool.imap_unordered(_play_games, chunks):
+            stats.merge(chunk_stats)
+            num_games += args.chunk
+            elapsed = perf_counter() - start_time
+            print("Games: " + str(min(num_games, args.games)) + "   turns: " + str(stats.num_turns) +
+                  "   leaves: " + str(len(stats.leaves)) + "   turns/s: " + "{:.1f}".format(stats.num_turns / elapsed))
+
+    print("Average next move score: " + "{:.2f}".format(stats.mean_score()))
+    ScrabbleLeaves.write_leave_table(output, stats.equities(args.smoothing), stats.num_turns)
+    print("Wrote leave table '" + output + "'")
+
+    # Show the best and worst leaves that were seen often enough to tell
+    table = ScrabbleLeaves.LeaveTable(output)
+    frequent = sorted((leave for leave, (score, count) in stats.leaves.items() if count >= 50),
+                      key=table.value, reverse=True)
+    for leave in frequent[:10] + frequent[max(10, len(frequent) - 10):]:
+        print((leave if leave else "-").ljust(8) + "{:+.2f}".format(table.value(leave)).rjust(8) +
+              str(stats.leaves[leave][1]).rjust(10) + " turns")
+    table.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#
+# This script checks that the batch scorer (ScrabbleScoring.BatchScorer) scores the
+# same as the list-based scorers of ScrabbleUtils, on the positions of a few GreedyBot
+# self-play games. In every position it compares
+#  - the moves of the "signatures" engine with and without the batch path (same moves,
+#    scores, blank designations and order)
+#  - BatchScorer.score_moves with ScrabbleBoard.check_legal_and_score_move for all moves
+#  - BatchScorer.score with score_play_across/score_play_down (without the legality check)
+#    for the words of all moves shifted by one square in every direction, which covers
+#    words that run off the board, conflict with tiles or form other cross words
+# and exits with status 1 if anything differs (needs NumPy).
+#
+# Usage:
+#   python ScrabbleScoringCheck.py --games 3
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleBitboard
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleDawg
+from ScrabbleBot import ScrabbleGame
+from ScrabbleBot import ScrabbleMatch
+from ScrabbleBot import ScrabbleScoring
+from ScrabbleBot import ScrabbleUtils
+from GreedyBot import GreedyBot
+
+import argparse
+import random
+import sys
+
+SHIFTS = ((0, 0), (0, 1), (1, 0), (0, -1), (-1, 0))
+MAX_REPORTED = 10
+
+
+#
+# GreedyBot that checks the scorers on every position it moves in
+#
+class CheckingBot(GreedyBot):
+
+    def __init__(self, name, results: dict):
+        super().__init__(name)
+        self.results = results
+        self._lexicon = None
+
+    def start_game(self, legal_words: set, word_signatures: dict, engine: str, dawg, letter_values: dict):
+        self._lexicon = (legal_words, word_signatures, letter_values)
+
+    def make_move(self, board, letters, solutions):
+        check_position(board, "".join(letters), *self._lexicon, self.results)
+        return super().make_move(board, letters, solutions)
+
+
+def report(results: dict, message: str):
+    results["mismatches"] += 1
+    if results["mismatches"] <= MAX_REPORTED:
+        print("MISMATCH: " + message)
+
+
+def move_key(move: ScrabbleUtils.ScrabbleMove) -> tuple:
+    return move.row, move.col, move.how, move.word, list(move.letters), move.score, list(move.blank_positions)
+
+
+def check_position(board: ScrabbleBoard.ScrabbleBoard, letters: str, legal_words: set, word_signatures: dict,
+                   letter_values: dict, results: dict):
+    rows = board.rows()
+    multipliers = ScrabbleBoard.get_board_multipliers()
+    cross_checks = (ScrabbleDawg.compute_cross_checks(rows, legal_words, letter_values)[0],
+                    ScrabbleDawg.compute_cross_checks(ScrabbleDawg.transpose(rows), legal_words, letter_values)[0])
+    scorer = ScrabbleScoring.BatchScorer(ScrabbleBitboard.BitBoard.from_rows(rows), letter_values, cross_checks)
+    results["positions"] += 1
+
+    # Move generation with and without the batch path
+    moves = ScrabbleUtils.find_all_moves(rows, letters, legal_words, multipliers, letter_values, word_signatures)
+    batch_moves = ScrabbleUtils.find_all_moves(rows, letters, legal_words, multipliers, letter_values,
+                                               word_signatures, None, None, scorer)
+    results["moves"] += len(moves)
+    if [move_key(move) for move in moves] != [move_key(move) for move in batch_moves]:
+        report(results, "moves for rack " + letters + " differ with batch scoring\n" + str(board))
+
+    # Scores of the moves with their blanks
+    for move, score in zip(moves, scorer.score_moves(list(moves)).tolist()):
+        expected = board.check_legal_and_score_move(move, letter_values, legal_words)
+        if score != expected:
+            report(results, str(move_key(move)) + " scores " + str(score) + " instead of " + str(expected))
+
+    # Scores of the words of all moves (with their blanks), shifted around the board
+    candidates = []
+    for move in moves:
+        word = list(move.word)
+        for pos in move.blank_positions:
+            word[pos] = '*'
+        for d_row, d_col in SHIFTS:
+            if 0 <= move.row + d_row < 15 and 0 <= move.col + d_col < 15:
+                candidates.append((move.row + d_row, move.col + d_col, move.how, "".join(word)))
+    results["candidates"] += len(candidates)
+    for candidate, score in zip(candidates, scorer.score(candidates).tolist()):
+        row, col, how, word = candidate
+        score_play = ScrabbleUtils.score_play_across if how == "across" else ScrabbleUtils.score_play_down
+        expected = score_play(word, row, col, rows, multipliers, letter_values, legal_words, False)
+        if score != expected:
+            report(results, str(candidate) + " scores " + str(score) + " instead of " + str(expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the batch scorer against the list-based scorers")
+    parser.add_argument("--dictionary", default="OSPD4.txt")
+    parser.add_argument("--games", type=int, default=3, help="GreedyBot self-play games to take positions from")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    legal_words, word_signatures, engine, dawg = ScrabbleMatch.load_move_generator(args.dictionary, "signatures")
+    results = {"positions": 0, "moves": 0, "candidates": 0, "mismatches": 0}
+    random.seed(args.seed)
+    for i in range(0, args.games):
+        players = [CheckingBot("Checker-1", results), CheckingBot("Checker-2", results)]
+        game = ScrabbleGame.ScrabbleGame(players, legal_words, word_signatures, engine, dawg)
+        game.play_until_finished(0)
+
+    print("Positions: " + str(results["positions"]) + "   moves: " + str(results["moves"]) +
+          "   shifted candidates: " + str(results["candidates"]) + "   mismatches: " + str(results["mismatches"]))
+    if results["mismatches"] > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
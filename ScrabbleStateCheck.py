@@ -0,0 +1,179 @@
+#
+# This script checks the state that ScrabbleBoard keeps up to date move by move against
+# the same state computed from scratch, on the positions of a few GreedyBot self-play
+# games (on every board type). In every position it checks
+#  - the anchors against ScrabbleDawg.compute_anchors
+#  - the Zobrist hash against ScrabbleZobrist.compute_hash
+#  - the cross-checks and cross-word sums against ScrabbleDawg.compute_cross_checks
+#  - the exposure map against ScrabbleExposure.ExposureMap.from_board
+#  - the BitBoard of an ArrayScrabbleBoard against the nested lists
+#  - the same after apply() of each of the highest scoring moves, and that undo()
+#    restores the state before exactly
+#  - that best_moves returns the scores (and the best move) of find_all_moves
+# and exits with status 1 if anything differs.
+#
+# Usage:
+#   python ScrabbleStateCheck.py --games 3
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleBitboard
+from ScrabbleBot import ScrabbleDawg
+from ScrabbleBot import ScrabbleExposure
+from ScrabbleBot import ScrabbleGame
+from ScrabbleBot import ScrabbleMatch
+from ScrabbleBot import ScrabbleUtils
+from ScrabbleBot import ScrabbleZobrist
+from GreedyBot import GreedyBot
+
+import argparse
+import copy
+import random
+import sys
+
+MAX_REPORTED = 10
+
+
+#
+# GreedyBot that checks the board on every position it moves in
+#
+class CheckingBot(GreedyBot):
+
+    def __init__(self, name, results: dict, num_moves: int):
+        super().__init__(name)
+        self.results = results
+        self.num_moves = num_moves
+        self._lexicon = None
+
+    def start_game(self, legal_words: set, word_signatures: dict, engine: str, dawg, letter_values: dict):
+        self._lexicon = (legal_words, word_signatures, letter_values)
+
+    def make_move(self, board, letters, solutions):
+        check_position(board, "".join(letters), *self._lexicon, self.num_moves, self.results)
+        return super().make_move(board, letters, solutions)
+
+
+def report(results: dict, message: str):
+    results["mismatches"] += 1
+    if results["mismatches"] <= MAX_REPORTED:
+        print("MISMATCH: " + message)
+
+
+def move_key(move: ScrabbleUtils.ScrabbleMove) -> tuple:
+    return move.row, move.col, move.how, move.word, tuple(move.letters), tuple(move.blank_positions)
+
+
+#
+# Everything the board updates incrementally (this looks at the internals of the board)
+#
+def board_state(board) -> dict:
+    state = {"board": copy.deepcopy(board._board),
+             "board_t": copy.deepcopy(board._board_t),
+             "blanks": board.blank_locations(),
+             "hash": board.zobrist_hash(),
+             "anchors": copy.deepcopy(board._anchors),
+             "cross_words": board._cross_words,
+             "cross_across": copy.deepcopy((board._cross_checks_across, board._cross_sums_across)),
+             "cross_down": copy.deepcopy((board._cross_checks_down, board._cross_sums_down)),
+             "exposure": (board.exposure().exposed, board.exposure().hidden)}
+    if isinstance(board, ScrabbleBitboard.ArrayScrabbleBoard):
+        bitboard = board.bitboard
+        state["bitboard"] = (bitboard.letters.tolist(), bitboard.blanks.tolist(), bitboard.row_masks.tolist(),
+                             bitboard.col_masks.tolist())
+    return state
+
+
+#
+# Compare the incrementally updated state of the board with the state computed from scratch
+#
+def check_state(board, legal_words: set, letter_values: dict, where: str, results: dict):
+    state = board_state(board)
+    rows = board.rows()
+    anchors = ScrabbleDawg.compute_anchors(rows)
+    expected = {"board_t": ScrabbleDawg.transpose(rows),
+                "hash": ScrabbleZobrist.compute_hash(rows, state["blanks"]),
+                "anchors": anchors,
+                "cross_across": ScrabbleDawg.compute_cross_checks(rows, legal_words, letter_values),
+                "cross_down": ScrabbleDawg.compute_cross_checks(ScrabbleDawg.transpose(rows), legal_words,
+                                                                letter_values)}
+    exposure = ScrabbleExposure.ExposureMap.from_board(rows, anchors, board._premium_mask())
+    expected["exposure"] = (exposure.exposed, exposure.hidden)
+    if "bitboard" in state:
+        bitboard = ScrabbleBitboard.BitBoard.from_rows(rows, state["blanks"])
+        expected["bitboard"] = (bitboard.letters.tolist(), bitboard.blanks.tolist(), bitboard.row_masks.tolist(),
+                                bitboard.col_masks.tolist())
+    results["states"] += 1
+    for name, value in expected.items():
+        if state[name] != value:
+            report(results, name + " differs " + where + "\n" + str(board))
+
+
+def check_position(board, letters: str, legal_words: set, word_signatures: dict, letter_values: dict,
+                   num_moves: int, results: dict):
+    # Cross-checks are only kept once they were computed (on the first move generation)
+    if board._cross_words is not legal_words:
+        board._init_cross_checks(legal_words, letter_values)
+    results["positions"] += 1
+    check_state(board, legal_words, letter_values, "in position", results)
+
+    # Highest scoring moves (without the duplicates that best_moves leaves out)
+    moves = board.possible_moves(letters, letter_values, legal_words, word_signatures)
+    moves.sort(reverse=True)
+    best = []
+    seen = set()
+    for move in moves:
+        if move_key(move) not in seen:
+            seen.add(move_key(move))
+            best.append(move)
+            if len(best) == num_moves:
+                break
+
+    found = board.best_moves(letters, letter_values, legal_words, word_signatures, num_moves)
+    if [move.score for move in found] != [move.score for move in best]:
+        report(results, "best_moves scores " + str([move.score for move in found]) + " instead of " +
+               str([move.score for move in best]) + " for rack " + letters + "\n" + str(board))
+    elif len(best) > 0 and move_key(found[0]) != move_key(best[0]):
+        report(results, "best_moves plays " + str(move_key(found[0])) + " instead of " + str(move_key(best[0])))
+
+    # apply / undo round trips
+    before = board_state(board)
+    for move in best:
+        record = board.apply(move)
+        check_state(board, legal_words, letter_values, "after applying " + str(move_key(move)), results)
+        board.undo(record)
+        results["round_trips"] += 1
+        after = board_state(board)
+        for name, value in before.items():
+            if after[name] != value:
+                report(results, name + " differs after undoing " + str(move_key(move)) + "\n" + str(board))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the incrementally updated board state")
+    parser.add_argument("--dictionary", default="OSPD4.txt")
+    parser.add_argument("--games", type=int, default=3, help="GreedyBot self-play games per board type")
+    parser.add_argument("--board-types", nargs="+", default=["lists", "arrays"], choices=["lists", "arrays"])
+    parser.add_argument("--moves", type=int, default=5, help="highest scoring moves to apply and undo per position")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    legal_words, word_signatures, engine, dawg = ScrabbleMatch.load_move_generator(args.dictionary, "signatures")
+    results = {"positions": 0, "states": 0, "round_trips": 0, "mismatches": 0}
+    for board_type in args.board_types:
+        random.seed(args.seed)
+        for i in range(0, args.games):
+            players = [CheckingBot("Checker-1", results, args.moves), CheckingBot("Checker-2", results, args.moves)]
+            game = ScrabbleGame.ScrabbleGame(players, legal_words, word_signatures, engine, dawg,
+                                             board_type=board_type)
+            game.play_until_finished(0)
+
+    print("Positions: " + str(results["positions"]) + "   states: " + str(results["states"]) +
+          "   apply/undo round trips: " + str(results["round_trips"]) + "   mismatches: " +
+          str(results["mismatches"]))
+    if results["mismatches"] > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
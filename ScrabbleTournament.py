@@ -15,6 +15,8 @@ from GreedyBot import GreedyBot
 from RandomBot import RandomBot
 from CarefulGreedyBot import CarefulGreedyBot
 from QBot import QBot
+from SimBot import SimBot
+from EquityBot import EquityBot  # Needs a leave table, see ScrabbleLeaveTrainer.py
 
 
 # Specify the set of players
@@ -26,11 +28,32 @@ num_rounds = 100
 # Specify volume of output, verbosity levels are 0, 1, and 2
 verbosity = 0
 
-# Play it out
-sm = ScrabbleMatch.ScrabbleMatch("OSPD4.txt", players)
-sm.play_match(num_rounds, True, verbosity)
+# Move generator, either "signatures" or "dawg"
+engine = "signatures"
 
-# Print results
-print("\nResults:")
-print(sm.get_total_scores())
-print(sm.get_total_matchwins())
+# Board the games are played on: "lists", "arrays" or "batch" (both need NumPy, see ScrabbleGame)
+board_type = "lists"
+
+# Number of processes to play games in parallel, and random seed (None for a random match)
+num_workers = 1
+seed = None
+
+# Instrument the move generator and write its stats to this file (None to switch it off)
+engine_stats_file = None
+
+# Stream the telemetry of every finished game to this file, one JSON line per game (None to switch it off)
+telemetry_file = None
+
+# Play it out (guarded, since worker processes may import this script)
+if __name__ == "__main__":
+    sm = ScrabbleMatch.ScrabbleMatch("OSPD4.txt", players, engine, "compiled", board_type)
+    sm.play_match(num_rounds, True, verbosity, num_workers, seed, engine_stats_file is not None,
+                  telemetry_file)
+
+    # Print results
+    print("\nResults:")
+    print(sm.get_total_scores())
+    print(sm.get_total_matchwins())
+    if engine_stats_file is not None:
+        print(sm.get_engine_stats())
+        sm.export_engine_stats(engine_stats_file)
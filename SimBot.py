@@ -0,0 +1,92 @@
+#
+# SimBot looks a few moves ahead: it takes the highest scoring candidate moves,
+# plays each of them out against random opponent racks (see ScrabbleSimulation)
+# and picks the one with the best average point spread
+#
+# Parameters:
+#  - num_candidates: number of highest scoring moves that are simulated
+#  - plies: number of greedy moves that are played after a candidate
+#  - time_budget: seconds to spend on simulation per move (checked after every
+#    rollout, candidates that were not rolled out in time are not considered),
+#    None to play max_rounds rounds
+#  - max_rounds: optional limit of rollout rounds per move (per worker)
+#  - num_workers: processes that run rollouts in parallel. When the games of a
+#    ScrabbleMatch already run in worker processes, rollouts run in the game's process
+#
+
+__author__ = 'Sebastian Wernicke'
+
+from ScrabbleBot import ScrabbleAI
+from ScrabbleBot import ScrabbleBoard
+from ScrabbleBot import ScrabbleMoves
+from ScrabbleBot import ScrabbleSimulation
+from ScrabbleBot import ScrabbleUtils
+
+import multiprocessing
+
+
+class SimBot(ScrabbleAI.ScrabbleAI):
+
+    lazy_moves = True
+
+    def __init__(self, name, num_candidates: int = 10, plies: int = 2, time_budget: float = 1.0,
+                 max_rounds: int = None, num_workers: int = 1):
+        super().__init__(name)
+        self.num_candidates = num_candidates
+        self.plies = plies
+        self.time_budget = time_budget
+        self.max_rounds = max_rounds
+        self.num_workers = num_workers
+        self._lexicon = None
+        self._letter_values = None
+        self._simulator = None
+
+    def start_game(self, legal_words: set, word_signatures: dict, engine: str, dawg, letter_values: dict):
+        lexicon = (legal_words, word_signatures, engine, dawg)
+        if self._lexicon is None or any(a is not b for a, b in zip(lexicon, self._lexicon)) \
+                or letter_values != self._letter_values:
+            self.close()
+            self._lexicon = lexicon
+            self._letter_values = letter_values
+
+    def make_move(self, board: ScrabbleBoard, letters: list,
+                  solutions: ScrabbleMoves.MoveProvider) -> ScrabbleUtils.ScrabbleMove:
+        candidates = solutions.top(self.num_candidates)
+        if len(candidates) == 0:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+
+        unseen = ScrabbleSimulation.unseen_letters(board, letters)
+        totals, counts = self._get_simulator().simulate(board, letters, candidates, unseen, self.time_budget,
+                                                        self.max_rounds, self.rng.getrandbits(64))
+        best = max((i for i in range(0, len(candidates)) if counts[i] > 0),
+                   key=lambda i: (totals[i] / counts[i], candidates[i].score))
+        return candidates[best]
+
+    def _get_simulator(self):
+        if self._lexicon is None:
+            raise ValueError("SimBot needs the lexicon of the game (see ScrabbleAI.start_game)")
+        if self._simulator is None:
+            # Worker processes of a ScrabbleMatch can't start processes of their own
+            if self.num_workers > 1 and not multiprocessing.current_process().daemon:
+                self._simulator = ScrabbleSimulation.RolloutPool(self.num_workers, self._lexicon,
+                                                                 self._letter_values, self.plies)
+            else:
+                self._simulator = ScrabbleSimulation.Simulator(self._lexicon, self._letter_values, self.plies)
+        return self._simulator
+
+    # Stop the worker processes (if any)
+    def close(self):
+        if isinstance(self._simulator, ScrabbleSimulation.RolloutPool):
+            self._simulator.close()
+        self._simulator = None
+
+    # Bots are sent to the worker processes of a ScrabbleMatch, without the lexicon
+    # (which every game hands over in start_game) and without the rollout pool
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lexicon'] = None
+        state['_letter_values'] = None
+        state['_simulator'] = None
+        return state
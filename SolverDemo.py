@@ -8,6 +8,7 @@ __author__ = 'Sebastian Wernicke'
 from ScrabbleBot import ScrabbleUtils
 from ScrabbleBot import ScrabbleBoard
 from ScrabbleBot import ScrabbleGame
+from ScrabbleBot import ScrabbleIndex
 
 from time import time
 
@@ -32,10 +33,11 @@ my_letters = "**PBAZE"
 # Load the Scrabble Dictionary
 legal_words = ScrabbleUtils.load_word_set("OSPD4.txt")
 
-# Build the Word Signatures
+# Load the Word Signatures (compiled to disk on first use)
 # (Needs my_letters to figure out if there are blank tiles)
 num_blanks = my_letters.count('*')
-word_signatures = ScrabbleUtils.build_word_signatures(legal_words, num_blanks)
+word_signatures = ScrabbleIndex.load_signature_index(ScrabbleIndex.default_index_file("OSPD4.txt", num_blanks),
+                                                     legal_words, num_blanks)
 
 # Get the board multiplier table
 board_multipliers = ScrabbleBoard.get_board_multipliers()